@@ -0,0 +1,153 @@
+import os
+import threading
+
+# Credentials and API clients, resolved on first use so that importing the extraction
+# functions stays cheap and works outside Streamlit (workers, CLI, benchmarks).
+# Settings come from environment variables first, then from Streamlit secrets.
+
+# Retries are done by Api_Functions.call_with_backoff so they can be counted
+OPENAI_CLIENT_MAX_RETRIES = 0
+
+# Timeouts and retries of the pooled transcription client
+TRANSCRIPTION_CONNECT_TIMEOUT = 5.0
+TRANSCRIPTION_READ_TIMEOUT = 120.0
+TRANSCRIPTION_MAX_RETRIES = 3
+
+# Provider quotas shared by every session and process using the same key (see
+# Rate_Limiter.py). Set OPENAI_RPM / OPENAI_TPM / TRANSCRIPTION_RPM to enforce them;
+# RATE_LIMIT_DB is the SQLite file the processes coordinate through.
+RATE_LIMIT_SETTINGS = ("OPENAI_RPM", "OPENAI_TPM", "TRANSCRIPTION_RPM")
+
+_lock = threading.Lock()
+_openai_client = None
+_transcription_client = None
+_rate_limiters = {}
+
+
+class ConfigError(Exception):
+    """
+    Raised when a required setting is neither in the environment nor in Streamlit secrets.
+    """
+
+
+# Function to read a setting from the environment, falling back to Streamlit secrets
+def get_setting(name, default=None):
+    value = os.environ.get(name)
+    if value:
+        return value
+    try:
+        # Deferred: Streamlit is only loaded when the environment does not have the value
+        import streamlit as st
+        return st.secrets[name]
+    except (ImportError, KeyError, FileNotFoundError):
+        return default
+
+
+# Function to read a setting that has no sensible default
+def require_setting(name):
+    value = get_setting(name)
+    if not value:
+        raise ConfigError(f"{name} is not set (environment variable or Streamlit secret)")
+    return value
+
+
+# Function to get the shared OpenAI client, built on first use
+def get_openai_client():
+    global _openai_client
+    if _openai_client is None:
+        with _lock:
+            if _openai_client is None:
+                from openai import OpenAI
+
+                _openai_client = OpenAI(
+                    api_key=require_setting("OPENAI_API_KEY"),
+                    base_url=get_setting("OPENAI_BASE_URL"),
+                    max_retries=OPENAI_CLIENT_MAX_RETRIES,
+                )
+    return _openai_client
+
+
+# Function to get the shared, connection-pooled transcription client, built on first use
+def get_transcription_client():
+    global _transcription_client
+    if _transcription_client is None:
+        with _lock:
+            if _transcription_client is None:
+                from Transcription_Client import TranscriptionClient
+
+                _transcription_client = TranscriptionClient(
+                    require_setting("API_URL"),
+                    require_setting("ANDAKIA_API_KEY"),
+                    connect_timeout=TRANSCRIPTION_CONNECT_TIMEOUT,
+                    read_timeout=TRANSCRIPTION_READ_TIMEOUT,
+                    max_retries=TRANSCRIPTION_MAX_RETRIES,
+                    rate_limiter=_build_rate_limiter("transcription", "ANDAKIA_API_KEY", "TRANSCRIPTION_RPM"),
+                )
+    return _transcription_client
+
+
+# Function to read a numeric setting (None when unset)
+def _number_setting(name):
+    value = get_setting(name)
+    return float(value) if value else None
+
+
+# Function to build the shared limiter of an API key, or None when no limit is set
+def _build_rate_limiter(service, key_setting, rpm_setting, tpm_setting=None):
+    requests_per_minute = _number_setting(rpm_setting)
+    tokens_per_minute = _number_setting(tpm_setting) if tpm_setting else None
+    if not requests_per_minute and not tokens_per_minute:
+        return None
+    from Rate_Limiter import SharedRateLimiter, bucket_name, DEFAULT_DB_PATH
+
+    return SharedRateLimiter(
+        bucket_name(service, require_setting(key_setting)),
+        requests_per_minute=requests_per_minute,
+        tokens_per_minute=tokens_per_minute,
+        path=get_setting("RATE_LIMIT_DB", DEFAULT_DB_PATH),
+    )
+
+
+# Function to get the shared OpenAI rate limiter (None when OPENAI_RPM/OPENAI_TPM are unset)
+def get_openai_limiter():
+    if "openai" not in _rate_limiters:
+        with _lock:
+            if "openai" not in _rate_limiters:
+                _rate_limiters["openai"] = _build_rate_limiter("openai", "OPENAI_API_KEY", "OPENAI_RPM", "OPENAI_TPM")
+    return _rate_limiters["openai"]
+
+
+# Function to report the state of the shared rate limiters that are enabled
+def rate_limit_stats():
+    stats = {}
+    openai_limiter = get_openai_limiter()
+    if openai_limiter is not None:
+        stats["openai"] = openai_limiter.stats()
+    if _transcription_client is not None and _transcription_client.rate_limiter is not None:
+        stats["transcription"] = _transcription_client.rate_limiter.stats()
+    return stats
+
+
+# Function to replace the shared clients (e.g. to point them at mock servers);
+# None leaves a client unchanged
+def set_clients(openai_client=None, transcription_client=None):
+    global _openai_client, _transcription_client
+    with _lock:
+        if openai_client is not None:
+            _openai_client = openai_client
+        if transcription_client is not None:
+            _transcription_client = transcription_client
+
+
+# Function to drop the shared clients so the next call rebuilds them from the settings
+def reset_clients():
+    global _openai_client, _transcription_client
+    with _lock:
+        if _transcription_client is not None:
+            _transcription_client.close()
+        for limiter in _rate_limiters.values():
+            if limiter is not None:
+                limiter.close()
+        _openai_client = None
+        _transcription_client = None
+        _rate_limiters.clear()
@@ -1,108 +1,256 @@
 import base64
+import contextvars
+import os
+import random
 import re
-import requests
-import streamlit as st
+import time
 import json
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, as_completed, wait
 from datetime import datetime, timedelta
 
-# Import the OpenAI client from your installed openai module
-from openai import OpenAI
+from Api_Clients import get_openai_client, get_openai_limiter, get_transcription_client
+from Result_Cache import make_cache_key
+from Instrumentation import metrics, record_usage
+from Hedged_Requests import Hedger, DeadlineExceeded, current_deadline, deadline_scope
+from Rate_Limiter import current_priority
+from Model_Cascade import ModelCascade, accept_image_product, accept_transaction
+from French_Normalization import normalize_transcript, parse_simple_transaction
+from Prompt_Registry import IMAGE_PROMPT, IMAGE_PACK_PROMPT, IMAGE_VIEWS_PROMPT, PRODUCTS_PROMPT
+from Product_Catalog import get_catalog, canonicalize_image_product, canonicalize_transaction, match_product
+from Response_Parsing import (
+    IMAGE_PRODUCT_FIELDS,
+    IMAGE_PRODUCT_SCHEMA,
+    IMAGE_PRODUCTS_SCHEMA,
+    TRANSACTION_SCHEMA,
+    json_schema_response_format,
+    parse_json_reply,
+    validate_image_product,
+    validate_image_products,
+    validate_transaction,
+    field_retry_prompt,
+)
+from Audio_Streaming import merge_extraction, split_audio_on_silence, stream_products_from_chunks
+from Audio_Preprocessing import preprocess_audio, DEFAULT_SAMPLE_RATE, DEFAULT_CODEC
+from Image_Preprocessing import (
+    preprocess_image,
+    estimate_image_tokens,
+    DEFAULT_MAX_DIMENSION,
+    DEFAULT_JPEG_QUALITY,
+    DEFAULT_DETAIL,
+)
 
-# Load secrets
-OPENAI_API_KEY = st.secrets["OPENAI_API_KEY"]
-ANDAKIA_API_KEY = st.secrets["ANDAKIA_API_KEY"]
-API_URL = st.secrets["API_URL"]
+# Credentials and clients are resolved on first use (see Api_Clients.py), so importing
+# this module needs neither Streamlit nor the OpenAI SDK
 
-# Initialize OpenAI client
-client = OpenAI(api_key=OPENAI_API_KEY)
+# Retries per model call on rate limits and transient errors
+OPENAI_MAX_RETRIES = 4
+
+# Models and the transcription version (prompt versions live in Prompt_Registry.py).
+# Each task tries its models in order and only escalates when the answer fails validation
+# (see Model_Cascade.py); a single model disables the cascade.
+IMAGE_MODELS = ("gpt-4o-mini", "gpt-4o")
+PRODUCTS_MODELS = ("gpt-4o-mini", "gpt-4o")
+TRANSCRIPTION_VERSION = "andakia-fr-16k-v1"
+
+image_cascade = ModelCascade("image", IMAGE_MODELS, accept_image_product)
+products_cascade = ModelCascade("products", PRODUCTS_MODELS, accept_transaction)
+
+# End-to-end time budget of one extraction, in seconds (see Hedged_Requests.py). Cascade
+# escalations, field retries and backoff sleeps only get the time that is left, and a
+# request out of time raises DeadlineExceeded instead of stalling the caller; a deadline
+# set by the caller with deadline_scope can only shorten these. None disables the budget.
+IMAGE_DEADLINE_SECONDS = 60
+PRODUCTS_DEADLINE_SECONDS = 30
+
+# Hedged model calls: a duplicate request is sent when the first one is slower than
+# HEDGE_QUANTILE of recent calls with the same stage and model, on at most
+# HEDGE_MAX_RATE of calls; the first usable answer wins
+HEDGE_REQUESTS = True
+HEDGE_QUANTILE = 0.95
+HEDGE_MAX_RATE = 0.1
+
+model_hedger = Hedger("openai", quantile=HEDGE_QUANTILE, max_hedge_rate=HEDGE_MAX_RATE)
+
+# Reply tokens reserved from the shared tokens-per-minute quota when a call sets no
+# max_tokens (see Api_Clients.get_openai_limiter); the real usage is settled afterwards
+COMPLETION_TOKENS_ESTIMATE = 300
+
+# Image preprocessing applied before upload (see Image_Preprocessing.py)
+IMAGE_MAX_DIMENSION = DEFAULT_MAX_DIMENSION
+IMAGE_JPEG_QUALITY = DEFAULT_JPEG_QUALITY
+IMAGE_DETAIL = DEFAULT_DETAIL
+
+# Several images per request (see extract_image_product_info_packed and
+# extract_image_product_info_views): a pack holds at most IMAGE_PACK_MAX_IMAGES images
+# and IMAGE_PACK_TOKEN_BUDGET estimated image tokens, and is answered by the first
+# (cheapest) image model; images it does not answer well get a single-image call
+IMAGE_PACK_MAX_IMAGES = 4
+IMAGE_PACK_TOKEN_BUDGET = 3000
+IMAGE_PACK_MODEL = IMAGE_MODELS[0]
+
+# Audio preprocessing applied before upload (see Audio_Preprocessing.py): mono at the
+# sample rate the transcription client declares, leading/trailing silence trimmed.
+# AUDIO_CODEC may be "flac" or "opus" when soundfile is installed and the backend accepts them.
+AUDIO_PREPROCESS = True
+AUDIO_SAMPLE_RATE = DEFAULT_SAMPLE_RATE
+AUDIO_CODEC = DEFAULT_CODEC
+AUDIO_TRIM_SILENCE = True
+
+# Ask the models for schema-constrained JSON (OpenAI structured outputs); set to False
+# for models without json_schema support, the tolerant parser still applies
+STRUCTURED_OUTPUTS = True
+# Follow-up requests allowed for fields that could not be parsed or validated
+MAX_FIELD_RETRIES = 1
+# Answer simple utterances ("J'ai acheté deux sacs de riz à cinq mille") without the model
+LOCAL_FAST_PATH = True
+# Reply budget of a transcript extraction: room for the JSON frame plus about one token
+# per transcript character (a product takes ~4 times more tokens as JSON than spoken),
+# capped. Replies still cut at the limit are retried or escalated, never shortened.
+PRODUCTS_MIN_REPLY_TOKENS = 500
+PRODUCTS_MAX_REPLY_TOKENS = 4000
+# Minimum trigram similarity for replacing an extracted name by its catalog name
+# (see Product_Catalog.py; matching is off unless PRODUCT_CATALOG is set)
+CATALOG_MIN_SCORE = 0.8
+# Minimum similarity for the local fast path to take a product name it cannot parse
+# (digits, sizes) from the catalog instead of sending the transcript to the model
+CATALOG_SHORTCUT_MIN_SCORE = 0.9
+
+# Cache keys for the result cache, derived from the input content
+def _catalog_signature():
+    catalog = get_catalog()
+    return catalog.signature if catalog is not None else "no-catalog"
+
+def image_cache_key(image_bytes, max_dimension=None, jpeg_quality=None, detail=None, crop_box=None):
+    return make_cache_key(
+        image_bytes, "image", image_cascade.signature, IMAGE_PROMPT.cache_version, _catalog_signature(),
+        max_dimension or IMAGE_MAX_DIMENSION, jpeg_quality or IMAGE_JPEG_QUALITY,
+        detail or IMAGE_DETAIL, crop_box,
+    )
+
+def _audio_signature():
+    if not AUDIO_PREPROCESS:
+        return "raw"
+    return f"{AUDIO_SAMPLE_RATE}-{AUDIO_CODEC}-{'trim' if AUDIO_TRIM_SILENCE else 'full'}"
+
+def transcription_cache_key(audio_bytes):
+    return make_cache_key(audio_bytes, "transcription", TRANSCRIPTION_VERSION, _audio_signature())
+
+def stream_cache_key(audio_bytes):
+    today_str = datetime.now().strftime("%Y-%m-%d")
+    return make_cache_key(
+        audio_bytes, "stream", TRANSCRIPTION_VERSION, _audio_signature(), products_cascade.signature, PRODUCTS_PROMPT.cache_version,
+        _catalog_signature(), today_str,
+    )
+
+def products_cache_key(text):
+    # Relative payment dates depend on today's date, so it is part of the key
+    today_str = datetime.now().strftime("%Y-%m-%d")
+    return make_cache_key(
+        text, "products", products_cascade.signature, PRODUCTS_PROMPT.cache_version, _catalog_signature(), today_str
+    )
+
+# Function to get the raw bytes of an input without copying when possible.
+# Accepts bytes, bytearray, memoryview, BytesIO/Streamlit uploads, open files or a path.
+def read_input_bytes(source):
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return source
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, "rb") as f:
+            return f.read()
+    if hasattr(source, "getbuffer"):
+        return source.getbuffer()
+    source.seek(0)  # Reset file pointer to start
+    return source.read()
 
 # Function to encode the image in base64
 def encode_image(image_file):
-    image_file.seek(0)  # Reset file pointer to start
-    return base64.b64encode(image_file.read()).decode("utf-8")
+    return base64.b64encode(read_input_bytes(image_file)).decode("utf-8")
 
 # Function to sanitize the message by removing any unwanted HTML tags
 def sanitize_message(message):
     sanitized_message = re.sub(r"<.*?>", "", message)
     return sanitized_message
 
-# Function to extract product information from an image and return JSON with null values
-def extract_image_product_info(image_path):
-    # Read the image file once into memory
-    with open(image_path, "rb") as f:
-        image_data = f.read()
+# Function to extract product information from an image and return JSON with null values.
+# `image` may be a path, raw bytes/memoryview or a file-like upload (see read_input_bytes).
+# The image is downscaled/re-encoded first; pass a dict as `report` to receive the
+# bytes and estimated tokens before and after preprocessing, plus a JPEG thumbnail
+# built from the already decoded image when `thumbnail_size` is set.
+def extract_image_product_info(image, max_dimension=None, jpeg_quality=None, detail=None,
+                               crop_box=None, report=None, thumbnail_size=None):
+    image_part, preprocess_report = prepare_image_part(
+        image, max_dimension=max_dimension, jpeg_quality=jpeg_quality, detail=detail, crop_box=crop_box,
+        thumbnail_size=thumbnail_size if report is not None else None,
+    )
+    if report is not None:
+        report.update(preprocess_report)
+    return _extract_image_part(image_part)
+
+# Function to preprocess an image for upload and build its chat message part.
+# Returns (image_part, preprocess_report); options as for extract_image_product_info.
+def prepare_image_part(image, max_dimension=None, jpeg_quality=None, detail=None, crop_box=None, thumbnail_size=None):
+    # Get the image bytes once, without a temporary file
+    image_data = read_input_bytes(image)
+
+    detail = detail or IMAGE_DETAIL
+    with metrics.stage("image.preprocess") as span:
+        image_data, mime_type, preprocess_report = preprocess_image(
+            image_data,
+            max_dimension=max_dimension or IMAGE_MAX_DIMENSION,
+            jpeg_quality=jpeg_quality or IMAGE_JPEG_QUALITY,
+            detail=detail,
+            crop_box=crop_box,
+            thumbnail_size=thumbnail_size,
+        )
+        span["payload_bytes"] = len(image_data)
 
     # Encode the image data in base64
-    base64_image = base64.b64encode(image_data).decode("utf-8")
-
-    # Expert-level prompt to extract product details
-    prompt = [
-        {
-            "type": "text",
-            "text": (
-                "You are an expert at extracting structured information from images. "
-                "You are given an image that may contain a product (like a packaged good, a poster, a label, etc.). "
-                "Your task is to extract the following information and return it as a Python dictionary with the exact keys: "
-                "\"product_name\", \"company\", \"start_date\", and \"end_date\".\n\n"
-                "Requirements:\n"
-                "- If any piece of information is not present or cannot be deduced, return null for that field.\n"
-                "- The dates should be returned in the format 'jj-mm-aa' (day-month-year). For example, '01-09-24' would represent 1 September 2024.\n"
-                "- If the product name or company name is unclear, do your best to infer it from logos, text fragments, or any textual clues.\n"
-                "- For start and end dates, carefully inspect the image for dates that might represent a production date, expiration date, "
-                "promotion period, or validity window. Dates may be partially visible or formatted in various ways (dd/mm/yy, dd-mm-yy, mm/yy, etc.). "
-                "Try to interpret and standardize them into 'jj-mm-aa' as best as you can.\n"
-                "- If multiple potential dates are visible, choose the ones that most reasonably represent a start and end timeframe for the product "
-                "(e.g., a promotional period or a product's valid shelf life). If no logical inference can be made, return null for those dates.\n"
-                "- Use advanced reasoning and be creative in interpreting unclear or incomplete clues. Consider language nuances, brand hints, or numeric sequences that could represent dates.\n"
-                "- Always return strictly a single Python dictionary in the following format:\n\n"
-                "{\n"
-                "  \"product_name\": \"...\" or null,\n"
-                "  \"company\": \"...\" or null,\n"
-                "  \"start_date\": \"jj-mm-aa\" or null,\n"
-                "  \"end_date\": \"jj-mm-aa\" or null\n"
-                "}\n"
-            ),
+    with metrics.stage("image.encode") as span:
+        base64_image = base64.b64encode(image_data).decode("utf-8")
+        span["payload_bytes"] = len(base64_image)
+
+    image_part = {
+        "type": "image_url",
+        "image_url": {
+            "url": f"data:{mime_type};base64,{base64_image}",
+            "detail": detail,
         },
-        {
-            "type": "image_url",
-            "image_url": {
-                "url": f"data:image/jpeg;base64,{base64_image}",
-            },
-        }
-    ]
+    }
+    return image_part, preprocess_report
 
-    # Make the API call
-    response = client.chat.completions.create(
-        model="gpt-4o-mini",
-        messages=[{"role": "user", "content": prompt}],
-    )
+# Function to run the image cascade on one prepared image part and return the product JSON
+def _extract_image_part(image_part):
+    catalog = get_catalog()
 
-    # Retrieve the raw string response from the model
-    extracted_data = response.choices[0].message.content
+    # Static instructions first (served from the provider's prompt cache), the image last
+    messages = IMAGE_PROMPT.build_messages(attachments=[image_part])
 
-    # Initialize the product info with None for missing values (will become null in JSON)
-    product_info = {
-        "product_name": None,
-        "company": None,
-        "start_date": None,
-        "end_date": None,
-        "days_before_expire": None,
-    }
+    def call(model, is_last):
+        response = create_chat_completion(
+            "image",
+            model=model,
+            messages=messages,
+            response_format=_response_format("product_info", IMAGE_PRODUCT_SCHEMA),
+        )
+        # Retrieve the raw string response from the model and validate it against the schema;
+        # only the last model of the cascade gets field retries, the others escalate instead
+        extracted_data = response.choices[0].message.content or ""
+        product_info, failed_fields = parse_validated_reply(
+            model, messages, extracted_data, validate_image_product, stage="image",
+            max_retries=MAX_FIELD_RETRIES if is_last else 0,
+        )
+        # A known product gets its catalog name, and its company when the label did not show it
+        if catalog is not None:
+            canonicalize_image_product(product_info, catalog, CATALOG_MIN_SCORE)
+        return product_info, failed_fields
 
-    # Regex patterns for extracting fields
-    patterns = {
-        "product_name": r'"product_name":\s*"([^"]+)"',
-        "company": r'"company":\s*"([^"]+)"',
-        "start_date": r'"start_date":\s*"([^"]+)"',
-        "end_date": r'"end_date":\s*"([^"]+)"',
-    }
+    with deadline_scope(IMAGE_DEADLINE_SECONDS):
+        product_info = image_cascade.run(call)
+    return _product_info_json(product_info)
 
-    for key, pattern in patterns.items():
-        match = re.search(pattern, extracted_data)
-        if match:
-            product_info[key] = match.group(1)
-        else:
-            product_info[key] = None  # Explicitly mark missing data as None
+# Function to add days_before_expire to an image extraction and return it as JSON
+def _product_info_json(product_info):
+    product_info["days_before_expire"] = None
 
     # Calculate days_before_expire if both dates are available
     if product_info["start_date"] and product_info["end_date"]:
@@ -117,111 +265,530 @@ def extract_image_product_info(image_path):
     # Convert the result to a JSON string so that None appears as null
     return json.dumps(product_info, ensure_ascii=False, indent=2)
 
-# Function to transcribe an audio file and return transcription text
-def transcribe_audio_file(file_path):
-    headers = {
-        "Authorization": f"Bearer {ANDAKIA_API_KEY}",
-    }
-    
-    with open(file_path, 'rb') as audio_file:
-        files = {'incoming_file': audio_file}
-        data = {
-            'sample_rate': 16000,
-            'tempo_factor': 1.0,
-            'target_language': 'fr',
-        }
+# Response format for a schema, or nothing when structured outputs are disabled
+def _response_format(name, schema):
+    if STRUCTURED_OUTPUTS:
+        return json_schema_response_format(name, schema)
+    from openai import NOT_GIVEN
+    return NOT_GIVEN
+
+# Size in bytes of the text and inline images sent in a list of chat messages
+def _messages_size(messages):
+    size = 0
+    for message in messages:
+        content = message["content"]
+        if isinstance(content, str):
+            size += len(content.encode("utf-8"))
+            continue
+        for part in content:
+            if part["type"] == "text":
+                size += len(part["text"].encode("utf-8"))
+            elif part["type"] == "image_url":
+                size += len(part["image_url"]["url"])
+    return size
+
+# Tokens a request may use, reserved from the shared quota before it is sent: about
+# 4 characters per text token, images at the size they are downscaled to, and the reply
+def _estimated_tokens(messages, max_tokens=None):
+    tokens = 0
+    for message in messages:
+        content = message["content"]
+        if isinstance(content, str):
+            tokens += len(content) // 4
+            continue
+        for part in content:
+            if part["type"] == "text":
+                tokens += len(part["text"]) // 4
+            elif part["type"] == "image_url":
+                detail = part["image_url"].get("detail", IMAGE_DETAIL)
+                tokens += estimate_image_tokens(IMAGE_MAX_DIMENSION, IMAGE_MAX_DIMENSION, detail=detail)
+    return tokens + (max_tokens or COMPLETION_TOKENS_ESTIMATE)
+
+# A usable completion: an empty reply from one attempt lets a hedged duplicate win instead
+def _has_content(response):
+    return bool(response.choices and response.choices[0].message.content)
+
+# Function to call the chat completions API with retries, recording wall time, request size,
+# token usage and retries under "<stage>.model_call".
+# Inside a deadline each attempt times out with the request, and with HEDGE_REQUESTS a
+# slow attempt is hedged (see model_hedger). With OPENAI_RPM/OPENAI_TPM set, each attempt
+# first waits for the quota shared with the other sessions and processes.
+def create_chat_completion(stage, **kwargs):
+    deadline = current_deadline()
+    client = get_openai_client()
+    limiter = get_openai_limiter()
+    priority = current_priority()
+    estimated_tokens = _estimated_tokens(kwargs["messages"], kwargs.get("max_tokens"))
+
+    def send():
+        try:
+            if deadline is None:
+                return client.chat.completions.create(**kwargs)
+            deadline.check(stage)
+            # An abandoned attempt ends with the request instead of holding a connection
+            return client.chat.completions.create(timeout=deadline.remaining(), **kwargs)
+        except retryable_errors() as e:
+            retry_after = _retry_after_seconds(e)
+            if limiter is not None and retry_after is not None:
+                # Hold every caller of the key instead of letting each one hit the limit
+                limiter.pause(retry_after)
+            raise
+
+    def attempt():
+        if limiter is not None:
+            limiter.acquire(estimated_tokens, priority=priority, deadline=deadline)
+        if not HEDGE_REQUESTS:
+            return send()
+        # A duplicate is only sent when the quota has room for it right away
+        can_hedge = (lambda: limiter.try_acquire(estimated_tokens)) if limiter is not None else None
+        return model_hedger.run(
+            send, key=(stage, kwargs["model"]), deadline=deadline, is_valid=_has_content, can_hedge=can_hedge,
+        )
+
+    with metrics.stage(f"{stage}.model_call") as span:
+        span["payload_bytes"] = _messages_size(kwargs["messages"])
+        retry_stats = {}
         try:
-            response = requests.post(API_URL, headers=headers, files=files, data=data)
-            response_data = response.json()
-            if response.status_code == 200:
-                return response_data.get('transcription', '')
+            response = call_with_backoff(attempt, max_retries=OPENAI_MAX_RETRIES, stats=retry_stats)
+        finally:
+            span["retries"] = retry_stats.get("retries", 0)
+        record_usage(span, response)
+        if limiter is not None and response.usage is not None:
+            limiter.settle(estimated_tokens, response.usage.total_tokens)
+    return response
+
+# Function to parse and validate a model reply, asking again only for the fields that failed.
+# `validate` returns (result, failed_fields); the follow-up keeps the original conversation so
+# the model only has to produce the missing keys, and successful fields are never re-requested.
+# Returns (result, failed_fields) with the fields still failing after `max_retries` follow-ups.
+# A reply cut at max_tokens (`truncated`) still parses once its brackets are closed, but
+# its lists may have lost items: list fields then count as failed instead of shorter.
+def parse_validated_reply(model, messages, reply, validate, stage="reply", max_retries=MAX_FIELD_RETRIES,
+                          truncated=False):
+    with metrics.stage(f"{stage}.parse") as span:
+        span["payload_bytes"] = len(reply.encode("utf-8"))
+        span["truncated"] = truncated
+        result, failed_fields = validate(parse_json_reply(reply))
+    if truncated:
+        failed_fields += [
+            field for field, value in result.items() if isinstance(value, list) and field not in failed_fields
+        ]
+    retries = 0
+    while failed_fields and retries < max_retries:
+        retries += 1
+        follow_up = messages + [
+            {"role": "assistant", "content": reply},
+            {"role": "user", "content": field_retry_prompt(failed_fields)},
+        ]
+        try:
+            response = create_chat_completion(
+                f"{stage}.field_retry",
+                model=model,
+                messages=follow_up,
+                response_format={"type": "json_object"},
+                temperature=0,
+            )
+        except DeadlineExceeded:
+            # Out of time: keep the fields that did validate
+            break
+        reply = response.choices[0].message.content or ""
+        if response.choices[0].finish_reason == "length":
+            # Cut off again: nothing in it can be trusted to be complete
+            continue
+        with metrics.stage(f"{stage}.parse"):
+            data = parse_json_reply(reply)
+        if data is None:
+            continue
+        retried, still_failed = validate(data)
+        for field in failed_fields:
+            if field in data and field not in still_failed:
+                result[field] = retried[field]
+        failed_fields = [field for field in failed_fields if field in still_failed or field not in data]
+    return result, failed_fields
+
+# OpenAI errors worth retrying: rate limits, timeouts, dropped connections and 5xx
+# responses (imported on first use, with the client)
+def retryable_errors():
+    from openai import RateLimitError, APIConnectionError, APITimeoutError, InternalServerError
+    return (RateLimitError, APIConnectionError, APITimeoutError, InternalServerError)
+
+# Read the server's Retry-After hint (in seconds) from an OpenAI error, if any
+def _retry_after_seconds(error):
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    try:
+        return float(response.headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+# Call func, retrying retryable errors with jittered exponential backoff.
+# Pass a dict as `stats` to get the number of retries that were needed.
+# Inside a deadline (see deadline_scope) it never sleeps past it: DeadlineExceeded is raised instead.
+def call_with_backoff(func, *args, max_retries=4, base_delay=1.0, max_delay=30.0, stats=None, **kwargs):
+    attempt = 0
+    while True:
+        try:
+            return func(*args, **kwargs)
+        except retryable_errors() as e:
+            if attempt >= max_retries:
+                raise
+            delay = min(max_delay, base_delay * (2 ** attempt)) * random.uniform(0.5, 1.0)
+            retry_after = _retry_after_seconds(e)
+            if retry_after is not None:
+                delay = max(delay, min(retry_after, max_delay))
+            deadline = current_deadline()
+            if deadline is not None and deadline.remaining() <= delay:
+                raise DeadlineExceeded(f"no time left to retry after: {e}") from e
+            time.sleep(delay)
+            attempt += 1
+            if stats is not None:
+                stats["retries"] = attempt
+
+# Function to extract product information from many images with a bounded worker pool.
+# Images may be paths or in-memory inputs, as for extract_image_product_info.
+# Yields (index, image, product_json, error) as soon as each image finishes, so
+# callers can display results in completion order. A failing image only sets its own error.
+# Keyword options (max_dimension, jpeg_quality, detail, crop_box) are passed to each call;
+# rate limits are retried per model call (see OPENAI_MAX_RETRIES). The workers inherit
+# the caller's deadline and rate-limit priority (see Rate_Limiter.priority_scope).
+def extract_image_product_info_batch(images, max_workers=4, **options):
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    try:
+        futures = {
+            executor.submit(contextvars.copy_context().run, extract_image_product_info, image, **options): (index, image)
+            for index, image in enumerate(images)
+        }
+        for future in as_completed(futures):
+            index, image = futures[future]
+            try:
+                yield index, image, future.result(), None
+            except Exception as e:
+                yield index, image, None, str(e)
+    finally:
+        # Drop queued work if the caller stops iterating early
+        executor.shutdown(wait=True, cancel_futures=True)
+
+# Function to group images into packs from their estimated token costs (first-fit
+# decreasing, so few packs are needed). Returns lists of indexes in ascending order; an
+# image over the budget on its own gets a pack of one.
+def pack_images(token_costs, token_budget=None, max_images=None):
+    token_budget = token_budget or IMAGE_PACK_TOKEN_BUDGET
+    max_images = max_images or IMAGE_PACK_MAX_IMAGES
+    packs = []
+    for index in sorted(range(len(token_costs)), key=lambda i: -token_costs[i]):
+        for pack in packs:
+            if len(pack["indexes"]) < max_images and pack["tokens"] + token_costs[index] <= token_budget:
+                break
+        else:
+            pack = {"indexes": [], "tokens": 0}
+            packs.append(pack)
+        pack["indexes"].append(index)
+        pack["tokens"] += token_costs[index]
+    return sorted((sorted(pack["indexes"]) for pack in packs), key=lambda indexes: indexes[0])
+
+# Function to extract several different products with one request.
+# Returns one product JSON per image part, or None for the images whose entry is missing,
+# fails validation or would have escalated in the cascade (see accept_image_product).
+def _extract_pack(image_parts):
+    attachments = []
+    for position, image_part in enumerate(image_parts):
+        attachments += [{"type": "text", "text": f"Image {position}:"}, image_part]
+    messages = IMAGE_PACK_PROMPT.build_messages(attachments=attachments, count=len(image_parts))
+    with deadline_scope(IMAGE_DEADLINE_SECONDS):
+        response = create_chat_completion(
+            "image.pack",
+            model=IMAGE_PACK_MODEL,
+            messages=messages,
+            response_format=_response_format("image_products", IMAGE_PRODUCTS_SCHEMA),
+        )
+    reply = response.choices[0].message.content or ""
+    with metrics.stage("image.pack.parse") as span:
+        span["payload_bytes"] = len(reply.encode("utf-8"))
+        entries = validate_image_products(parse_json_reply(reply), len(image_parts))
+
+    catalog = get_catalog()
+    results = []
+    for product_info, failed_fields in entries:
+        accepted, _ = accept_image_product(product_info, failed_fields)
+        if not accepted:
+            results.append(None)
+            continue
+        if catalog is not None:
+            canonicalize_image_product(product_info, catalog, CATALOG_MIN_SCORE)
+        results.append(_product_info_json(product_info))
+    return results
+
+# Function to redo one image of a pack with a single-image call
+def _extract_pack_fallback(image_part):
+    with metrics.stage("image.pack.fallback"):
+        return _extract_image_part(image_part)
+
+# Function to extract product information from many images, several images per request.
+# Images are preprocessed, packed by estimated token cost (see pack_images) and each
+# pack is sent as one request asking for one indexed answer per image. An image the pack
+# reply does not answer well, or whose pack fails, gets its own single-image call.
+# Yields (index, image, product_json, error) as each image finishes, like
+# extract_image_product_info_batch; options are the same.
+def extract_image_product_info_packed(images, max_workers=4, token_budget=None, max_images=None, **options):
+    images = list(images)
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+
+    # Workers inherit the caller's deadline and rate-limit priority
+    def submit(func, *args, **kwargs):
+        return executor.submit(contextvars.copy_context().run, func, *args, **kwargs)
+
+    try:
+        preparing = {submit(prepare_image_part, image, **options): index for index, image in enumerate(images)}
+        parts = {}
+        costs = {}
+        for future in as_completed(preparing):
+            index = preparing[future]
+            try:
+                parts[index], report = future.result()
+            except Exception as e:
+                yield index, images[index], None, str(e)
+                continue
+            costs[index] = report.get("processed_tokens") or estimate_image_tokens(
+                IMAGE_MAX_DIMENSION, IMAGE_MAX_DIMENSION, detail=parts[index]["image_url"]["detail"]
+            )
+
+        ready = sorted(parts)
+        pending = {}
+        for pack in pack_images([costs[index] for index in ready], token_budget, max_images):
+            indexes = [ready[position] for position in pack]
+            if len(indexes) == 1:
+                pending[submit(_extract_image_part, parts[indexes[0]])] = indexes
             else:
-                return f"Error: {response_data.get('error_message', 'Unknown error')}"
-        except Exception as e:
-            return f"Error: {str(e)}"
-
-# Clean the GPT response to ensure valid JSON (remove extra markers)
-def clean_json_response(content):
-    content = content.strip().strip("`").strip()
-    match = re.search(r'\{.*\}', content, re.DOTALL)
-    if match:
-        return match.group(0)
-    return "{}"
+                pending[submit(_extract_pack, [parts[index] for index in indexes])] = indexes
 
-# Function to extract product details from transcribed text and return JSON with null values
-def extract_products(text):
-    today_str = datetime.now().strftime("%Y-%m-%d")
-    
-    prompt = f'''
-Le texte suivant est en français: "{text}"
-
-Nous sommes le {today_str}. Veuillez :
-
-1. Extraire le nom de la personne mentionnée dans le texte (par exemple "M. Dupont", "Alice", "Jean Martin", "Madame Sakho", etc.).  
-   - Incluez les titres honorifiques (par exemple, "Madame", "Monsieur") si mentionnés dans le texte.
-   - S'il n'y a pas de nom explicite, retournez "None".
-
-2. Extraire les informations sur les produits et retourner STRICTEMENT le format JSON suivant :
-
-{{
-  "person_name": "Nom de la personne ou None",
-  "products": [
-    {{
-      "product_name": "Nom du produit",
-      "quantity": "Nombre ou None",
-      "price": "Prix ou None",
-      "transaction_type": "vente ou achat",
-      "payment_date": "Date de paiement au format YYYY-MM-DD ou None"
-    }}
-  ]
-}}
-
-Contraintes supplémentaires :
-- N'incluez aucun texte supplémentaire comme des traductions ou des introductions dans la réponse.
-- "transaction_type" doit être "vente" ou "achat" selon ce qui est trouvé dans le texte.
-- Identifiez toute date ou période de paiement mentionnée dans le texte, qu'elle soit absolue (ex : "15 janvier 2024") ou relative (ex : "dans deux semaines", "le mois prochain", ou "vendredi prochain"). 
-  - Convertissez cette information en une date exacte au format YYYY-MM-DD en vous basant sur la date du jour ({today_str}).
-  - Si aucune date n'est trouvée, retournez "None".
-- "quantity" doit être un nombre si trouvé, sinon "None".
-- "price" doit être un nombre si trouvé, sinon "None".
-- Le JSON doit STRICTEMENT respecter ce format (n'ajoutez ni ne retirez aucune clé).
-- Si plusieurs dates sont mentionnées, choisissez celle qui semble la plus logiquement liée au paiement.
-- Soyez créatif dans l'interprétation des dates implicites ou relatives, mais conservez un format rigoureux.
-
-IMPORTANT : Ne retournez rien d'autre que la structure JSON demandée.
-'''
-
-    response = client.chat.completions.create(
-        model="gpt-4o",
-        messages=[{"role": "user", "content": prompt}],
-        temperature=0,
-        max_tokens=500
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                indexes = pending.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    if len(indexes) == 1:
+                        yield indexes[0], images[indexes[0]], None, str(e)
+                        continue
+                    # A failed pack is not retried as a pack: its images go one by one
+                    result = [None] * len(indexes)
+                if isinstance(result, str):
+                    # A single-image call: a pack of one or a fallback
+                    yield indexes[0], images[indexes[0]], result, None
+                    continue
+                for index, product_json in zip(indexes, result):
+                    if product_json is None:
+                        pending[submit(_extract_pack_fallback, parts[index])] = [index]
+                    else:
+                        yield index, images[index], product_json, None
+    finally:
+        # Drop queued work if the caller stops iterating early
+        executor.shutdown(wait=True, cancel_futures=True)
+
+# Function to extract one product from several photos of it (e.g. the front with the
+# name and the back with the dates) in a single request, returning JSON like
+# extract_image_product_info. When the combined reply does not pass validation each
+# photo goes through the single-image cascade and the answers are merged, the first
+# photo that shows a field giving its value. Options as for extract_image_product_info.
+def extract_image_product_info_views(images, **options):
+    image_parts = [prepare_image_part(image, **options)[0] for image in images]
+    if len(image_parts) == 1:
+        return _extract_image_part(image_parts[0])
+
+    messages = IMAGE_VIEWS_PROMPT.build_messages(attachments=image_parts, count=len(image_parts))
+    with deadline_scope(IMAGE_DEADLINE_SECONDS):
+        response = create_chat_completion(
+            "image.views",
+            model=IMAGE_PACK_MODEL,
+            messages=messages,
+            response_format=_response_format("product_info", IMAGE_PRODUCT_SCHEMA),
+        )
+    product_info, failed_fields = parse_validated_reply(
+        IMAGE_PACK_MODEL, messages, response.choices[0].message.content or "", validate_image_product,
+        stage="image.views", max_retries=0,
     )
+    accepted, _ = accept_image_product(product_info, failed_fields)
+    if accepted:
+        catalog = get_catalog()
+        if catalog is not None:
+            canonicalize_image_product(product_info, catalog, CATALOG_MIN_SCORE)
+        return _product_info_json(product_info)
+
+    with ThreadPoolExecutor(max_workers=len(image_parts)) as executor:
+        futures = [
+            executor.submit(contextvars.copy_context().run, _extract_pack_fallback, image_part)
+            for image_part in image_parts
+        ]
+        answers = [json.loads(future.result()) for future in futures]
+    merged = {field: next((answer[field] for answer in answers if answer[field]), None) for field in IMAGE_PRODUCT_FIELDS}
+    return _product_info_json(merged)
+
+# Function to transcribe audio and return transcription text.
+# `audio` may be a path, raw bytes/memoryview or a file-like upload; `filename` tells the
+# backend the format of in-memory audio (e.g. "note.mp3").
+# With `preprocess` (default AUDIO_PREPROCESS) the audio is downmixed, trimmed and
+# resampled before upload; pass a dict as `report` to get the byte savings.
+def transcribe_audio_file(audio, filename=None, preprocess=None, report=None):
+    try:
+        if preprocess is None:
+            preprocess = AUDIO_PREPROCESS
+        if preprocess:
+            if isinstance(audio, (str, os.PathLike)):
+                filename = filename or os.path.basename(audio)
+            audio, filename = prepare_audio(read_input_bytes(audio), filename, report=report)
+        elif not isinstance(audio, (str, os.PathLike)):
+            audio = read_input_bytes(audio)
+        return get_transcription_client().transcribe(audio, filename=filename)
+    except Exception as e:
+        return f"Error: {str(e)}"
 
-    content = response.choices[0].message.content.strip()
-    cleaned_content = clean_json_response(content)
+# Function to preprocess audio for upload, recording its cost and size in the metrics.
+# Returns (audio_bytes, filename).
+def prepare_audio(audio_bytes, filename=None, codec=None, report=None):
+    with metrics.stage("audio.preprocess") as span:
+        audio_bytes, filename, preprocess_report = preprocess_audio(
+            audio_bytes, filename,
+            sample_rate=AUDIO_SAMPLE_RATE,
+            codec=codec or AUDIO_CODEC,
+            trim_silence=AUDIO_TRIM_SILENCE,
+        )
+        span["payload_bytes"] = len(audio_bytes)
+    if report is not None:
+        report.update(preprocess_report)
+    return audio_bytes, filename
 
+# Function to transcribe several audio inputs (paths or bytes) concurrently, each one
+# preprocessed like in transcribe_audio_file (in the workers, so preprocessing overlaps
+# the uploads). Yields (index, audio, transcription) as each one finishes; failures use
+# the "Error: ..." text.
+def transcribe_audio_files(audio_files, max_workers=4, preprocess=None):
+    executor = ThreadPoolExecutor(max_workers=max_workers)
     try:
-        result = json.loads(cleaned_content)
-    except json.JSONDecodeError:
-        result = {
-            "person_name": None,
-            "products": []
+        futures = {
+            executor.submit(contextvars.copy_context().run, transcribe_audio_file, audio, preprocess=preprocess): (index, audio)
+            for index, audio in enumerate(audio_files)
         }
+        for future in as_completed(futures):
+            index, audio = futures[future]
+            yield index, audio, future.result()
+    finally:
+        # Drop queued work if the caller stops iterating early
+        executor.shutdown(wait=True, cancel_futures=True)
 
-    # Ensure missing fields are set as None
-    if "person_name" not in result or not result["person_name"]:
-        result["person_name"] = None
+# Function to extract product details from transcribed text and return JSON with null values
+def extract_products(text):
+    today = datetime.now().date()
+    today_str = today.strftime("%Y-%m-%d")
+
+    # Simple utterances are parsed locally; anything not fully understood goes to the model
+    if LOCAL_FAST_PATH:
+        start = time.perf_counter()
+        result = parse_simple_transaction(text, today, lookup_product=_catalog_lookup())
+        metrics.observe(
+            "products.local_hit" if result is not None else "products.local_miss",
+            duration_seconds=time.perf_counter() - start,
+        )
+        if result is not None:
+            result, _ = validate_transaction(result)
+            return json.dumps(_canonical_products(result), ensure_ascii=False, indent=2)
 
-    if "products" not in result or not isinstance(result["products"], list):
-        result["products"] = []
+    # Numbers become digits and dates are resolved in the text. A transcript longer than
+    # the prompt's input budget is read in pieces whose products are merged, so nothing
+    # past the budget is lost to truncation.
+    normalized_text, _ = normalize_transcript(text, today)
+    pieces = PRODUCTS_PROMPT.split_field(today=today_str, text=normalized_text)
+    if len(pieces) == 1:
+        result = _extract_products_with_model(normalized_text, today_str, context=text)
     else:
-        for product in result["products"]:
-            product.setdefault("product_name", None)
-            product.setdefault("quantity", None)
-            product.setdefault("price", None)
-            product.setdefault("transaction_type", None)
-            product.setdefault("payment_date", None)
+        metrics.observe("products.split", pieces=len(pieces))
+        result = {"person_name": None, "products": []}
+        for piece in pieces:
+            merge_extraction(result, _extract_products_with_model(piece, today_str, context=text))
+    result = _canonical_products(result)
 
     # Return as a JSON string to have null values (instead of Python's None)
     return json.dumps(result, ensure_ascii=False, indent=2)
+
+
+# Function to extract the person and products of a normalized transcript that fits the prompt
+def _extract_products_with_model(normalized_text, today_str, context):
+    # The static instructions come first and the day's date and transcript last so the
+    # prefix stays cacheable
+    messages = PRODUCTS_PROMPT.build_messages(today=today_str, text=normalized_text)
+    max_tokens = min(PRODUCTS_MAX_REPLY_TOKENS, PRODUCTS_MIN_REPLY_TOKENS + len(normalized_text))
+
+    def call(model, is_last):
+        response = create_chat_completion(
+            "products",
+            model=model,
+            messages=messages,
+            temperature=0,
+            max_tokens=max_tokens,
+            response_format=_response_format("transaction", TRANSACTION_SCHEMA),
+        )
+        content = (response.choices[0].message.content or "").strip()
+        return parse_validated_reply(
+            model, messages, content, validate_transaction, stage="products",
+            max_retries=MAX_FIELD_RETRIES if is_last else 0,
+            truncated=response.choices[0].finish_reason == "length",
+        )
+
+    # Simple orders are answered by the fast model; unreliable answers escalate
+    with deadline_scope(PRODUCTS_DEADLINE_SECONDS):
+        return products_cascade.run(call, context=context)
+
+
+# Function to get a product-name lookup for the local fast path, or None without a catalog
+def _catalog_lookup():
+    catalog = get_catalog()
+    if catalog is None:
+        return None
+
+    def lookup(name):
+        entry = match_product(catalog, name, CATALOG_SHORTCUT_MIN_SCORE)
+        return entry.name if entry else None
+
+    return lookup
+
+
+# Function to replace extracted product names by catalog names when a catalog is configured
+def _canonical_products(result):
+    catalog = get_catalog()
+    if catalog is not None:
+        canonicalize_transaction(result, catalog, CATALOG_MIN_SCORE)
+    return result
+
+
+# Streaming mode for long recordings: the audio is split on silences, chunks are
+# transcribed in parallel and each partial transcript goes to extract_products as soon
+# as it arrives. Yields progress updates (see Audio_Streaming.stream_products_from_chunks)
+# whose "result" holds the products merged and deduplicated across chunks so far.
+def extract_products_from_audio_stream(audio, transcribe_workers=4, extract_workers=2, **chunk_options):
+    audio = read_input_bytes(audio)
+    if AUDIO_PREPROCESS:
+        # Chunks are cut from 16-bit WAV, so the stream is always preprocessed to WAV
+        audio, _ = prepare_audio(audio, codec="wav")
+    chunks = split_audio_on_silence(audio, **chunk_options)
+
+    def transcribe(chunk):
+        return get_transcription_client().transcribe(chunk, filename="chunk.wav")
+
+    def extract(text):
+        return json.loads(extract_products(text))
+
+    yield from stream_products_from_chunks(
+        chunks, transcribe, extract, transcribe_workers=transcribe_workers, extract_workers=extract_workers
+    )
+
+
+# Function to report per-model hit rates and latency of the model cascades
+def cascade_stats():
+    return {"image": image_cascade.stats(), "products": products_cascade.stats()}
+
+
+# Function to report how often model calls were hedged, how often the duplicate won
+# and the latency it saved
+def hedge_stats():
+    return model_hedger.stats()
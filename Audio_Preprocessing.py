@@ -0,0 +1,234 @@
+import io
+import math
+import os
+import wave
+from fractions import Fraction
+
+# numpy does the signal processing and soundfile (libsndfile) decodes compressed
+# formats and encodes FLAC/Opus. Both are optional and imported on first use: without
+# numpy audio is uploaded unchanged, without soundfile only WAV is processed.
+_numpy = None
+_soundfile = None
+
+
+# Function to import numpy on first use (None when it is missing)
+def load_numpy():
+    global _numpy
+    if _numpy is None:
+        try:
+            import numpy
+        except ImportError:  # pragma: no cover - depends on the environment
+            numpy = False
+        _numpy = numpy
+    return _numpy or None
+
+
+# Function to import soundfile on first use (None when it is missing)
+def load_soundfile():
+    global _soundfile
+    if _soundfile is None:
+        try:
+            import soundfile
+        except (ImportError, OSError):  # pragma: no cover - missing package or libsndfile
+            soundfile = False
+        _soundfile = soundfile
+    return _soundfile or None
+
+# The transcription backend works on 16 kHz mono, so anything more is wasted upload
+DEFAULT_SAMPLE_RATE = 16000
+# "wav" (16-bit PCM) is always available; "flac" and "opus" need soundfile
+DEFAULT_CODEC = "wav"
+CODECS = {
+    "wav": ("WAV", "PCM_16", ".wav"),
+    "flac": ("FLAC", "PCM_16", ".flac"),
+    "opus": ("OGG", "OPUS", ".ogg"),
+}
+
+# Silence trimming: 30 ms frames below this RMS (16-bit scale) are silence, and this
+# much audio is kept around the speech so no word onset is clipped
+DEFAULT_SILENCE_THRESHOLD = 500
+TRIM_FRAME_SECONDS = 0.03
+TRIM_PADDING_SECONDS = 0.25
+# Resampling filter: half-width in samples at the lower rate, Kaiser window shape,
+# and the most filter phases used for rates that are not simple ratios
+RESAMPLE_HALF_TAPS = 12
+RESAMPLE_KAISER_BETA = 8.0
+RESAMPLE_MAX_PHASES = 1024
+
+
+# Function to decode audio into float samples in [-1, 1] shaped (frames, channels).
+# Returns (samples, sample_rate) or None when the format cannot be decoded here.
+def decode_audio(audio_bytes):
+    np = load_numpy()
+    if np is None:
+        return None
+    try:
+        with wave.open(io.BytesIO(audio_bytes), "rb") as wav:
+            params = wav.getparams()
+            pcm = wav.readframes(params.nframes)
+    except (wave.Error, EOFError):
+        params = None
+    if params is not None and params.sampwidth in (1, 2, 3, 4):
+        width = params.sampwidth
+        raw = np.frombuffer(pcm[: len(pcm) - len(pcm) % (width * params.nchannels)], dtype=np.uint8)
+        if width == 1:
+            samples = (raw.astype(np.float32) - 128) / 128
+        elif width == 3:
+            # 24-bit little-endian: widen to int32 with the sign in the top byte
+            triplets = raw.reshape(-1, 3).astype(np.int32)
+            values = (triplets[:, 0] << 8) | (triplets[:, 1] << 16) | (triplets[:, 2] << 24)
+            samples = values.astype(np.float32) / 2 ** 31
+        else:
+            dtype = np.dtype("<i2") if width == 2 else np.dtype("<i4")
+            samples = raw.view(dtype).astype(np.float32) / 2 ** (8 * width - 1)
+        return samples.reshape(-1, params.nchannels), params.framerate
+    soundfile = load_soundfile()
+    if soundfile is None:
+        return None
+    try:
+        samples, sample_rate = soundfile.read(io.BytesIO(audio_bytes), dtype="float32", always_2d=True)
+    except Exception:
+        return None
+    return samples, sample_rate
+
+
+# Function to find the first and last frames of speech (None when all is silence)
+def speech_bounds(mono, sample_rate, silence_threshold=DEFAULT_SILENCE_THRESHOLD):
+    np = load_numpy()
+    frame_length = max(1, int(sample_rate * TRIM_FRAME_SECONDS))
+    count = len(mono) // frame_length
+    if count == 0:
+        return None
+    frames = mono[: count * frame_length].reshape(count, frame_length)
+    energies = np.sqrt(np.mean(np.square(frames, dtype=np.float64), axis=1)) * 32768
+    voiced = np.flatnonzero(energies >= silence_threshold)
+    if len(voiced) == 0:
+        return None
+    padding = int(TRIM_PADDING_SECONDS * sample_rate)
+    start = max(0, voiced[0] * frame_length - padding)
+    end = min(len(mono), (voiced[-1] + 1) * frame_length + padding)
+    return start, end
+
+
+# Function to resample mono audio with a windowed-sinc (Kaiser) filter.
+# The rate ratio is reduced to L/M: output samples then cycle through L fixed filter
+# phases, and each phase is a weighted sum of input slices taken every M samples.
+# The cutoff follows the lower of the two rates, so downsampling is anti-aliased.
+def resample(mono, source_rate, target_rate):
+    np = load_numpy()
+    if source_rate == target_rate or len(mono) == 0:
+        return mono
+    # Unusual rates are approximated (e.g. 16001 Hz as 16000 Hz) to bound the phases
+    ratio = Fraction(target_rate, source_rate).limit_denominator(RESAMPLE_MAX_PHASES)
+    up, down = ratio.numerator, ratio.denominator
+    cutoff = min(1.0, up / down)
+    half = int(math.ceil(RESAMPLE_HALF_TAPS / cutoff))
+    padded = np.concatenate([np.zeros(half, np.float32), mono.astype(np.float32), np.zeros(half + 1, np.float32)])
+    length = len(mono) * up // down
+    output = np.empty(length, dtype=np.float32)
+    phases = min(up, length)
+    offsets = np.arange(-half + 1, half + 1)
+    # Filter weights of every (phase, tap), computed once
+    distances = (np.arange(phases) * down % up / up)[:, None] - offsets[None, :]
+    window = np.i0(RESAMPLE_KAISER_BETA * np.sqrt(np.clip(1 - (distances / half) ** 2, 0, 1)))
+    weights = (cutoff * np.sinc(cutoff * distances) * window / np.i0(RESAMPLE_KAISER_BETA)).astype(np.float32)
+    for phase in range(phases):
+        count = len(range(phase, length, up))
+        base = phase * down // up
+        total = np.zeros(count, dtype=np.float32)
+        for tap, offset in enumerate(offsets.tolist()):
+            start = base + offset + half
+            total += weights[phase, tap] * padded[start:start + down * (count - 1) + 1:down]
+        output[phase::up] = total
+    return output
+
+
+# Function to encode mono float samples; returns (bytes, codec actually used)
+def encode_audio(mono, sample_rate, codec=DEFAULT_CODEC):
+    np = load_numpy()
+    soundfile = load_soundfile() if codec != "wav" else None
+    if soundfile is not None:
+        file_format, subtype, _ = CODECS[codec]
+        buffer = io.BytesIO()
+        try:
+            soundfile.write(buffer, mono, sample_rate, format=file_format, subtype=subtype)
+            return buffer.getvalue(), codec
+        except Exception:
+            # libsndfile without this codec (Opus needs 1.0.29+): fall back to WAV
+            pass
+    pcm = (np.clip(mono, -1.0, 1.0) * 32767).round().astype("<i2")
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as out:
+        out.setnchannels(1)
+        out.setsampwidth(2)
+        out.setframerate(sample_rate)
+        out.writeframes(pcm.tobytes())
+    return buffer.getvalue(), "wav"
+
+
+# Function to shrink a recording before it is uploaded for transcription.
+# - Decodes it (WAV natively, other formats through soundfile) and downmixes to mono
+# - Trims leading and trailing silence
+# - Resamples to `sample_rate` and re-encodes with `codec` (falls back to WAV)
+# Returns (audio_bytes, filename, report); audio that cannot be decoded, or that
+# would not get smaller, is returned unchanged.
+def preprocess_audio(audio_bytes, filename=None, sample_rate=DEFAULT_SAMPLE_RATE, codec=DEFAULT_CODEC,
+                     trim_silence=True, silence_threshold=DEFAULT_SILENCE_THRESHOLD):
+    if codec not in CODECS:
+        raise ValueError(f"Unknown audio codec: {codec}")
+    original_bytes = audio_bytes if isinstance(audio_bytes, bytes) else bytes(audio_bytes)
+    report = {
+        "original_bytes": len(original_bytes),
+        "original_rate": None,
+        "original_channels": None,
+        "original_seconds": None,
+        "processed_bytes": len(original_bytes),
+        "processed_rate": None,
+        "processed_seconds": None,
+        "trimmed_seconds": 0.0,
+        "codec": None,
+        "preprocessed": False,
+    }
+
+    decoded = decode_audio(original_bytes)
+    if decoded is None:
+        return original_bytes, filename, report
+    samples, source_rate = decoded
+    report["original_rate"] = source_rate
+    report["original_channels"] = samples.shape[1]
+    report["original_seconds"] = len(samples) / source_rate if source_rate else 0.0
+
+    mono = samples.mean(axis=1) if samples.shape[1] > 1 else samples[:, 0]
+    if trim_silence:
+        # Recordings that are all silence are kept whole: the backend decides
+        bounds = speech_bounds(mono, source_rate, silence_threshold)
+        if bounds is not None:
+            start, end = bounds
+            report["trimmed_seconds"] = (len(mono) - (end - start)) / source_rate
+            mono = mono[start:end]
+
+    mono = resample(mono, source_rate, sample_rate)
+    processed, used_codec = encode_audio(mono, sample_rate, codec)
+    report["processed_seconds"] = len(mono) / sample_rate
+    if len(processed) >= len(original_bytes):
+        report["processed_seconds"] = report["original_seconds"]
+        report["trimmed_seconds"] = 0.0
+        return original_bytes, filename, report
+
+    report["processed_bytes"] = len(processed)
+    report["processed_rate"] = sample_rate
+    report["codec"] = used_codec
+    report["preprocessed"] = True
+    stem = os.path.splitext(filename or "audio")[0]
+    return processed, stem + CODECS[used_codec][2], report
+
+
+# Function to format an audio preprocessing report as a one-line summary
+def format_audio_report(report):
+    if not report["preprocessed"]:
+        return f"Audio uploaded unchanged ({report['original_bytes'] / 1024:.0f} KB)"
+    return (
+        f"Audio {report['original_bytes'] / 1024:.0f} KB → {report['processed_bytes'] / 1024:.0f} KB"
+        f" ({report['original_rate']} Hz x{report['original_channels']} → {report['processed_rate']} Hz mono"
+        f" {report['codec']}, {report['trimmed_seconds']:.1f}s of silence trimmed)"
+    )
@@ -0,0 +1,180 @@
+import io
+import math
+import re
+import sys
+import unicodedata
+import wave
+from array import array
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from Response_Parsing import PRODUCT_FIELDS
+
+# Chunking defaults: cut on pauses of at least 0.3s once a chunk is 5s long,
+# and force a cut at 30s so a chunk never waits on a monologue
+DEFAULT_MIN_CHUNK_SECONDS = 5.0
+DEFAULT_MAX_CHUNK_SECONDS = 30.0
+DEFAULT_MIN_SILENCE_SECONDS = 0.3
+DEFAULT_SILENCE_THRESHOLD = 500  # RMS on the 16-bit scale
+FRAME_SECONDS = 0.03
+
+# Function to compute the RMS energy of each fixed-size frame of 16-bit PCM audio
+def _frame_energies(pcm_bytes, channels, frame_length):
+    samples = array("h")
+    samples.frombytes(pcm_bytes[: len(pcm_bytes) - len(pcm_bytes) % 2])
+    if sys.byteorder == "big":
+        samples.byteswap()
+    step = frame_length * channels
+    # Roughly 240 samples per frame are plenty to tell speech from silence
+    stride = max(1, step // 240)
+    energies = []
+    for start in range(0, len(samples), step):
+        frame = samples[start:start + step:stride]
+        energies.append(math.sqrt(sum(s * s for s in frame) / len(frame)))
+    return energies
+
+# Function to write raw PCM frames back into a standalone WAV file
+def _to_wav(params, pcm_bytes):
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as out:
+        out.setnchannels(params.nchannels)
+        out.setsampwidth(params.sampwidth)
+        out.setframerate(params.framerate)
+        out.writeframes(pcm_bytes)
+    return buffer.getvalue()
+
+# Function to split a WAV recording into chunks bounded by silences.
+# Returns a list of WAV byte strings; audio that is not 16-bit PCM WAV (e.g. mp3)
+# comes back as a single chunk so the pipeline still works, just without parallelism.
+def split_audio_on_silence(audio_bytes, min_chunk_seconds=DEFAULT_MIN_CHUNK_SECONDS,
+                           max_chunk_seconds=DEFAULT_MAX_CHUNK_SECONDS,
+                           min_silence_seconds=DEFAULT_MIN_SILENCE_SECONDS,
+                           silence_threshold=DEFAULT_SILENCE_THRESHOLD):
+    try:
+        with wave.open(io.BytesIO(audio_bytes), "rb") as wav:
+            params = wav.getparams()
+            pcm = wav.readframes(params.nframes)
+    except (wave.Error, EOFError):
+        return [bytes(audio_bytes)]
+    if params.sampwidth != 2 or params.nframes == 0:
+        return [bytes(audio_bytes)]
+
+    frame_length = max(1, int(params.framerate * FRAME_SECONDS))
+    bytes_per_frame = frame_length * params.nchannels * params.sampwidth
+    energies = _frame_energies(pcm, params.nchannels, frame_length)
+
+    min_chunk_frames = int(min_chunk_seconds / FRAME_SECONDS)
+    max_chunk_frames = max(1, int(max_chunk_seconds / FRAME_SECONDS))
+    min_silence_frames = max(1, int(min_silence_seconds / FRAME_SECONDS))
+
+    cuts = []
+    chunk_start = 0
+    silence_run = 0
+    for index, energy in enumerate(energies):
+        silence_run = silence_run + 1 if energy < silence_threshold else 0
+        length = index + 1 - chunk_start
+        if length >= min_chunk_frames and silence_run >= min_silence_frames:
+            # Cut in the middle of the pause so no word is split
+            cut = index + 1 - silence_run // 2
+        elif length >= max_chunk_frames:
+            cut = index + 1
+        else:
+            continue
+        cuts.append(cut)
+        chunk_start = cut
+        silence_run = 0
+
+    chunks = []
+    start = 0
+    for cut in cuts + [len(energies)]:
+        if cut <= start:
+            continue
+        segment = energies[start:cut]
+        # Drop chunks that are silence from end to end
+        if max(segment) >= silence_threshold:
+            chunks.append(_to_wav(params, pcm[start * bytes_per_frame:cut * bytes_per_frame]))
+        start = cut
+    return chunks or [bytes(audio_bytes)]
+
+# Function to normalize a product name for deduplication (case, accents, spacing, plurals)
+def _product_key(name):
+    if not name:
+        return None
+    name = unicodedata.normalize("NFKD", str(name)).encode("ascii", "ignore").decode("ascii").lower()
+    words = [re.sub(r"(s|x)$", "", word) for word in re.findall(r"[a-z0-9]+", name)]
+    return " ".join(words) or None
+
+# Function to merge one chunk's extraction into the running result.
+# Products with the same normalized name and transaction type are merged when their
+# known fields agree (missing fields are filled in); otherwise they are kept apart.
+def merge_extraction(merged, result):
+    if not merged.get("person_name") and result.get("person_name"):
+        merged["person_name"] = result["person_name"]
+
+    for product in result.get("products") or []:
+        key = _product_key(product.get("product_name"))
+        for existing in merged["products"]:
+            if key is None or _product_key(existing.get("product_name")) != key:
+                continue
+            compatible = all(
+                existing.get(field) is None or product.get(field) is None
+                or str(existing.get(field)) == str(product.get(field))
+                for field in PRODUCT_FIELDS[1:]
+            )
+            if compatible:
+                for field in PRODUCT_FIELDS:
+                    if existing.get(field) is None:
+                        existing[field] = product.get(field)
+                break
+        else:
+            merged["products"].append({field: product.get(field) for field in PRODUCT_FIELDS})
+    return merged
+
+# Function to transcribe audio chunks in parallel and extract products from each partial
+# transcript as soon as it arrives. `transcribe(chunk_bytes)` returns text (raising on
+# failure) and `extract(text)` returns a dict with "person_name" and "products".
+# Yields an update after every finished step with the ordered transcript so far and the
+# merged, deduplicated products, so a UI can show the first products within seconds.
+def stream_products_from_chunks(chunks, transcribe, extract, transcribe_workers=4, extract_workers=2):
+    chunk_count = len(chunks)
+    transcripts = [None] * chunk_count
+    merged = {"person_name": None, "products": []}
+    errors = []
+
+    def update(stage, chunk_index):
+        return {
+            "stage": stage,
+            "chunk_index": chunk_index,
+            "chunk_count": chunk_count,
+            "transcription": " ".join(t for t in transcripts if t),
+            "result": {"person_name": merged["person_name"], "products": [dict(p) for p in merged["products"]]},
+            "errors": list(errors),
+        }
+
+    # Separate pools so extraction of early chunks never queues behind later transcriptions
+    transcribe_pool = ThreadPoolExecutor(max_workers=transcribe_workers)
+    extract_pool = ThreadPoolExecutor(max_workers=extract_workers)
+    try:
+        pending = {
+            transcribe_pool.submit(transcribe, chunk): ("transcribed", index)
+            for index, chunk in enumerate(chunks)
+        }
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                stage, index = pending.pop(future)
+                try:
+                    value = future.result()
+                except Exception as e:
+                    errors.append(f"Chunk {index + 1}: {e}")
+                    yield update("error", index)
+                    continue
+                if stage == "transcribed":
+                    transcripts[index] = value
+                    if value and value.strip():
+                        pending[extract_pool.submit(extract, value)] = ("extracted", index)
+                else:
+                    merge_extraction(merged, value)
+                yield update(stage, index)
+    finally:
+        transcribe_pool.shutdown(wait=True, cancel_futures=True)
+        extract_pool.shutdown(wait=True, cancel_futures=True)
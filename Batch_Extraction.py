@@ -0,0 +1,56 @@
+import argparse
+import json
+import sys
+
+import Api_Functions
+from Api_Functions import extract_image_product_info_batch, extract_image_product_info_packed
+from Rate_Limiter import priority_scope
+
+# Command-line entry point for bulk shelf-photo extraction.
+# Writes one JSON line per image, in completion order, as soon as each result is ready.
+# Its model calls use the "batch" priority, so interactive sessions sharing the API
+# quota are served first (see Rate_Limiter.py).
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Extract product information from many images at once.")
+    parser.add_argument("images", nargs="+", help="Image files to process")
+    parser.add_argument("-j", "--workers", type=int, default=4, help="Maximum concurrent OpenAI calls (default: 4)")
+    parser.add_argument("--max-retries", type=int, default=4, help="Retries per model call on rate limits and transient errors")
+    parser.add_argument("--max-dimension", type=int, help="Downscale so the longest side is at most this many pixels")
+    parser.add_argument("--jpeg-quality", type=int, help="JPEG quality used when re-encoding (1-95)")
+    parser.add_argument("--detail", choices=["low", "high", "auto"], help="OpenAI image detail level")
+    parser.add_argument("--pack", action="store_true",
+                        help="Send several images per model call, falling back to one call per image on bad replies")
+    parser.add_argument("-o", "--output", help="JSON-lines output file (default: stdout)")
+    args = parser.parse_args(argv)
+    Api_Functions.OPENAI_MAX_RETRIES = args.max_retries
+
+    out = open(args.output, "w", encoding="utf-8") if args.output else sys.stdout
+    failures = 0
+    extract = extract_image_product_info_packed if args.pack else extract_image_product_info_batch
+    try:
+        with priority_scope("batch"):
+            for index, path, product_json, error in extract(
+                args.images, max_workers=args.workers,
+                max_dimension=args.max_dimension, jpeg_quality=args.jpeg_quality, detail=args.detail,
+            ):
+                if error is not None:
+                    failures += 1
+                record = {
+                    "index": index,
+                    "image": path,
+                    "result": json.loads(product_json) if product_json is not None else None,
+                    "error": error,
+                }
+                out.write(json.dumps(record, ensure_ascii=False) + "\n")
+                out.flush()
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+    if failures:
+        print(f"{failures} of {len(args.images)} images failed", file=sys.stderr)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,170 @@
+import base64
+import hashlib
+import itertools
+import os
+import tempfile
+from collections import deque
+
+from Image_Preprocessing import make_thumbnail
+
+# Defaults per session: 100 bubbles within 2 MB
+DEFAULT_MAX_ENTRIES = 100
+DEFAULT_MEMORY_BUDGET = 2 * 1024 * 1024
+DEFAULT_THUMBNAIL_SIZE = 240
+DEFAULT_PAGE_SIZE = 10
+
+
+class BlobStore:
+    """
+    Spill-to-disk store for original uploads, addressed by content hash so the
+    same picture is only written once.
+
+    Files go to a temporary directory of its own under `parent`, removed by close()
+    or, at the latest, when the store is garbage collected with its session or the
+    process exits.
+    """
+
+    def __init__(self, parent=None):
+        if parent is not None:
+            os.makedirs(parent, exist_ok=True)
+        self._temporary = tempfile.TemporaryDirectory(prefix="blobs-", dir=parent, ignore_cleanup_errors=True)
+        self.directory = self._temporary.name
+
+    def _path(self, key):
+        return os.path.join(self.directory, key)
+
+    def put(self, data):
+        key = hashlib.sha256(data).hexdigest()
+        path = self._path(key)
+        if not os.path.exists(path):
+            temp_path = f"{path}.tmp"
+            with open(temp_path, "wb") as f:
+                f.write(data)
+            os.replace(temp_path, path)
+        return key
+
+    def get(self, key):
+        try:
+            with open(self._path(key), "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def delete(self, key):
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    def clear(self):
+        for name in os.listdir(self.directory):
+            self.delete(name)
+
+    def close(self):
+        self._temporary.cleanup()
+
+
+class ChatHistory:
+    """
+    Bounded chat history for one session.
+
+    Images are kept as small JPEG thumbnails (originals optionally go to a BlobStore),
+    and the oldest entries are evicted once either `max_entries` or the
+    `memory_budget` (bytes of stored text and thumbnails) is exceeded.
+    """
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, memory_budget=DEFAULT_MEMORY_BUDGET,
+                 thumbnail_size=DEFAULT_THUMBNAIL_SIZE, blob_store=None):
+        self.max_entries = max_entries
+        self.memory_budget = memory_budget
+        self.thumbnail_size = thumbnail_size
+        self.blob_store = blob_store
+        self.entries = deque()
+        self.size_bytes = 0
+        self.evicted = 0
+        self._ids = itertools.count()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __bool__(self):
+        return bool(self.entries)
+
+    def __iter__(self):
+        return iter(self.entries)
+
+    @staticmethod
+    def _entry_size(entry):
+        return sum(len(value) for value in entry.values() if isinstance(value, str))
+
+    def _append(self, entry):
+        entry["id"] = next(self._ids)
+        entry["size"] = self._entry_size(entry)
+        self.entries.append(entry)
+        self.size_bytes += entry["size"]
+        self._evict()
+        return entry
+
+    def _evict(self):
+        # Always keep the newest entry, even if it alone exceeds the budget
+        while len(self.entries) > 1 and (
+            len(self.entries) > self.max_entries or self.size_bytes > self.memory_budget
+        ):
+            entry = self.entries.popleft()
+            self.size_bytes -= entry["size"]
+            self.evicted += 1
+            if entry.get("blob") and self.blob_store is not None:
+                # Other entries may reference the same content
+                if not any(other.get("blob") == entry["blob"] for other in self.entries):
+                    self.blob_store.delete(entry["blob"])
+
+    def add_image(self, image_bytes, name, thumbnail=None):
+        """
+        Add an uploaded image; pass `thumbnail` (JPEG bytes) if one was already built.
+        """
+        if thumbnail is None:
+            thumbnail = make_thumbnail(image_bytes, size=self.thumbnail_size)
+        entry = {"role": "user", "name": name}
+        if thumbnail is not None:
+            entry["thumbnail"] = base64.b64encode(thumbnail).decode("utf-8")
+        if self.blob_store is not None:
+            entry["blob"] = self.blob_store.put(image_bytes)
+        return self._append(entry)
+
+    def add_message(self, role, message):
+        return self._append({"role": role, "message": message})
+
+    def original(self, entry):
+        """
+        Original upload for an image entry, if a blob store kept it.
+        """
+        if self.blob_store is None or not entry.get("blob"):
+            return None
+        return self.blob_store.get(entry["blob"])
+
+    def page_count(self, page_size=DEFAULT_PAGE_SIZE):
+        return max(1, -(-len(self.entries) // page_size))
+
+    def page(self, page=0, page_size=DEFAULT_PAGE_SIZE):
+        """
+        Entries of one page in chronological order; page 0 holds the newest entries.
+        """
+        end = len(self.entries) - page * page_size
+        start = max(0, end - page_size)
+        if end <= 0:
+            return []
+        return list(itertools.islice(self.entries, start, end))
+
+    def clear(self):
+        self.entries.clear()
+        self.size_bytes = 0
+        if self.blob_store is not None:
+            self.blob_store.clear()
+
+    def close(self):
+        """
+        Drop every entry and the blob store's directory; call when the history is replaced.
+        """
+        self.clear()
+        if self.blob_store is not None:
+            self.blob_store.close()
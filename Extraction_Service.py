@@ -0,0 +1,130 @@
+import json
+import os
+
+from fastapi import FastAPI, File, HTTPException, UploadFile
+from fastapi.responses import JSONResponse, PlainTextResponse
+from pydantic import BaseModel
+
+from Api_Clients import rate_limit_stats
+from Api_Functions import (
+    extract_image_product_info,
+    transcribe_audio_file,
+    extract_products,
+    image_cache_key,
+    transcription_cache_key,
+    products_cache_key,
+    cascade_stats,
+    hedge_stats,
+)
+from Instrumentation import metrics
+from Job_Queue import JobQueue, QueueFullError
+from Prompt_Registry import describe_prompts
+from Result_Cache import ResultCache
+from Transaction_Ledger import TransactionLedger
+
+# Headless extraction service: POS clients submit work here instead of going through
+# the Streamlit UI. Run with `uvicorn Extraction_Service:app --host 0.0.0.0 --port 8000`.
+# Work is queued and handled by a worker pool sized independently of the web server;
+# when the queue is full new submissions get 429 with a Retry-After hint.
+SERVICE_WORKERS = int(os.environ.get("SERVICE_WORKERS", 4))
+SERVICE_QUEUE_SIZE = int(os.environ.get("SERVICE_QUEUE_SIZE", 32))
+SERVICE_RETRY_AFTER = int(os.environ.get("SERVICE_RETRY_AFTER", 5))
+
+app = FastAPI(title="Proboutik extraction service")
+jobs = JobQueue(workers=SERVICE_WORKERS, max_pending=SERVICE_QUEUE_SIZE)
+cache = ResultCache(
+    max_entries=int(os.environ.get("RESULT_CACHE_MAX_ENTRIES", 256)),
+    db_path=os.environ.get("RESULT_CACHE_DB"),
+)
+# Extracted transactions are kept when LEDGER_DB is set
+ledger = TransactionLedger(os.environ["LEDGER_DB"]) if os.environ.get("LEDGER_DB") else None
+
+
+class ProductsRequest(BaseModel):
+    text: str
+
+
+# Job bodies: the cache is checked inside the worker so cached answers stay cheap
+def _image_job(image_bytes):
+    return json.loads(cache.get_or_compute(image_cache_key(image_bytes), lambda: extract_image_product_info(image_bytes)))
+
+def _transcription_job(audio_bytes, filename):
+    key = transcription_cache_key(audio_bytes)
+    transcription = cache.get(key)
+    if transcription is None:
+        transcription = transcribe_audio_file(audio_bytes, filename=filename)
+        if transcription.startswith("Error:"):
+            raise RuntimeError(transcription[len("Error:"):].strip())
+        cache.set(key, transcription)
+    return {"transcription": transcription}
+
+def _products_job(text):
+    key = products_cache_key(text)
+    result = json.loads(cache.get_or_compute(key, lambda: extract_products(text)))
+    if ledger is not None:
+        ledger.record(result, key)
+    return result
+
+def _submit(kind, func, *args):
+    try:
+        job_id = jobs.submit(kind, func, *args)
+    except QueueFullError:
+        return JSONResponse(
+            status_code=429,
+            content={"detail": "Too many jobs in progress, retry later."},
+            headers={"Retry-After": str(SERVICE_RETRY_AFTER)},
+        )
+    return JSONResponse(
+        status_code=202,
+        content={"job_id": job_id, "status": "queued", "status_url": f"/v1/jobs/{job_id}"},
+        headers={"Location": f"/v1/jobs/{job_id}"},
+    )
+
+
+@app.post("/v1/images", status_code=202)
+async def submit_image(file: UploadFile = File(...)):
+    return _submit("image", _image_job, await file.read())
+
+
+@app.post("/v1/transcriptions", status_code=202)
+async def submit_transcription(file: UploadFile = File(...)):
+    return _submit("transcription", _transcription_job, await file.read(), file.filename)
+
+
+@app.post("/v1/products", status_code=202)
+async def submit_products(request: ProductsRequest):
+    return _submit("products", _products_job, request.text)
+
+
+@app.get("/v1/jobs/{job_id}")
+async def job_status(job_id: str):
+    job = jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired job")
+    return job
+
+
+# Plain def: FastAPI runs these in its threadpool, so the SQLite work (the ledger query,
+# the rate limiter's BEGIN IMMEDIATE with its busy timeout) does not block the event loop
+@app.get("/v1/ledger")
+def ledger_summary(days: int = 30, limit: int = 10):
+    if ledger is None:
+        raise HTTPException(status_code=404, detail="The ledger is not enabled (LEDGER_DB)")
+    return ledger.summary(days=days, limit=limit)
+
+
+@app.get("/healthz")
+def health():
+    return {
+        "status": "ok",
+        "queue": jobs.stats(),
+        "routes": cascade_stats(),
+        "hedging": hedge_stats(),
+        "rate_limits": rate_limit_stats(),
+        "prompts": describe_prompts(),
+    }
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def prometheus_metrics():
+    return metrics.render_prometheus()
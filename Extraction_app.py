@@ -1,174 +1,327 @@
 import streamlit as st
-import base64
-import tempfile
-import uuid
-from Api_Functions import extract_image_product_info, sanitize_message, transcribe_audio_file, extract_products
+import json
+import os
+import re
+from collections import OrderedDict
+from Api_Functions import (
+    extract_image_product_info,
+    extract_image_product_info_batch,
+    extract_image_product_info_packed,
+    sanitize_message,
+    transcribe_audio_file,
+    extract_products,
+    extract_products_from_audio_stream,
+    image_cache_key,
+    stream_cache_key,
+    transcription_cache_key,
+    products_cache_key,
+)
+from Result_Cache import ResultCache
+from Instrumentation import metrics
+from Chat_History import ChatHistory, BlobStore, DEFAULT_PAGE_SIZE, DEFAULT_THUMBNAIL_SIZE
+from Transaction_Ledger import TransactionLedger
+from Near_Duplicates import NearDuplicateIndex, perceptual_hash, DEFAULT_MAX_DISTANCE, DEFAULT_MAX_ENTRIES
+from Audio_Preprocessing import format_audio_report
+from Hedged_Requests import DeadlineExceeded
+from Image_Preprocessing import (
+    format_preprocess_report,
+    make_thumbnail,
+    open_preview,
+    DEFAULT_MAX_DIMENSION,
+    DEFAULT_JPEG_QUALITY,
+    DEFAULT_DETAIL,
+)
+
+# Upload cache keys remembered per session (image and audio uploads together)
+UPLOAD_KEYS_MAX = int(os.environ.get("UPLOAD_KEYS_MAX", 256))
+
+@st.cache_resource
+def get_result_cache():
+    """
+    Shared result cache for all sessions; set RESULT_CACHE_DB to also persist results on disk.
+    """
+    return ResultCache(
+        max_entries=int(os.environ.get("RESULT_CACHE_MAX_ENTRIES", 256)),
+        db_path=os.environ.get("RESULT_CACHE_DB"),
+        ttl_seconds=int(os.environ.get("RESULT_CACHE_TTL_SECONDS", 7 * 24 * 3600)),
+    )
+
+@st.cache_resource
+def get_ledger():
+    """
+    Shared transaction ledger, written in batches for all sessions; None unless LEDGER_DB is set.
+    """
+    path = os.environ.get("LEDGER_DB")
+    return TransactionLedger(path) if path else None
+
+# Stylesheet of the app, compacted once at import; emitted by full reruns only,
+# since fragment reruns keep the elements already on the page
+APP_CSS = """
+@import url('https://fonts.googleapis.com/css2?family=Roboto:wght@400;500;700&display=swap');
+@import url('https://cdnjs.cloudflare.com/ajax/libs/font-awesome/6.0.0/css/all.min.css');
+
+body {
+    font-family: 'Roboto', sans-serif;
+    background: #f1f3f5;
+    color: #333;
+}
+.main, .stApp {
+    padding: 20px;
+}
+/* Sidebar */
+.css-1cypcdb {
+    background: #ffffff;
+    border-right: 1px solid #eee;
+    padding: 20px;
+}
+.app-title {
+    font-size: 1.6em;
+    font-weight: 700;
+    margin-bottom: 30px;
+    color: #2c3e50;
+    text-align: center;
+}
+.cards-container {
+    display: flex;
+    flex-direction: column;
+    gap: 20px;
+    align-items: center;
+}
+.stButton > button {
+    background: #ffffff;
+    border-radius: 8px;
+    box-shadow: 0 2px 6px rgba(0,0,0,0.05);
+    width: 250px;
+    height: 120px;
+    cursor: pointer;
+    font-size: 1em;
+    font-weight: 500;
+    color: #2c3e50;
+    display: flex;
+    flex-direction: column;
+    justify-content: center;
+    align-items: center;
+    border: none;
+    transition: transform 0.2s, box-shadow 0.2s;
+}
+.stButton > button:hover {
+    transform: translateY(-5px);
+    box-shadow: 0 4px 12px rgba(0,0,0,0.1);
+}
+/* Main titles */
+h1.main-title {
+    font-weight: 700;
+    color: #2c3e50;
+    font-size: 2.2em;
+    margin-bottom: 10px;
+    display: flex;
+    align-items: center;
+    gap: 10px;
+}
+h1.main-title i {
+    font-size: 1.3em;
+}
+.section-subtitle {
+    font-size: 1.1em;
+    color: #555;
+    margin-bottom: 30px;
+}
+h3.history-title {
+    font-size: 1.3em;
+    border-bottom: 2px solid #eee;
+    padding-bottom: 10px;
+    color: #2c3e50;
+    margin-top: 40px;
+    font-weight: 600;
+}
+/* Chat container and bubbles */
+.chat-container {
+    max-width: 600px;
+    margin: 0 auto;
+}
+.chat-bubble {
+    padding: 15px;
+    border-radius: 10px;
+    margin-bottom: 20px;
+    line-height: 1.4;
+    font-size: 15px;
+    max-width: 80%;
+    word-wrap: break-word;
+    position: relative;
+}
+.chat-bubble.user {
+    background: #d9ecff;
+    margin-left: auto;
+    text-align: left;
+    border: 1px solid #c6ddf7;
+}
+.chat-bubble.system {
+    background: #ffffff;
+    margin-right: auto;
+    text-align: left;
+    border: 1px solid #eaeaea;
+}
+.chat-image {
+    max-width: 120px;
+    border-radius: 8px;
+    display: block;
+    margin-bottom: 10px;
+    border: 1px solid #ddd;
+}
+/* Info card styling */
+.info-card {
+    background: #fefefe;
+    border-radius: 8px;
+    padding: 15px;
+    box-shadow: 0 2px 6px rgba(0, 0, 0, 0.05);
+    font-size: 15px;
+}
+.info-card strong {
+    color: #2c3e50;
+}
+/* File uploaders */
+.stFileUploader, .stCameraInput, .stAudioInput {
+    border: 2px dashed #ccc;
+    border-radius: 6px;
+    padding: 20px;
+    margin-bottom: 20px;
+    text-align: center;
+    background: #fafafa;
+}
+.stFileUploader > div, .stCameraInput > div {
+    width: 100%;
+}
+"""
+APP_CSS_HTML = "<style>" + re.sub(r"\s+", " ", re.sub(r"/\*.*?\*/", "", APP_CSS)).strip() + "</style>"
 
 def custom_css():
     """
     Inject custom CSS to style the Streamlit app nicely.
     """
-    st.markdown(
-        """
-        <style>
-        @import url('https://fonts.googleapis.com/css2?family=Roboto:wght@400;500;700&display=swap');
-        @import url('https://cdnjs.cloudflare.com/ajax/libs/font-awesome/6.0.0/css/all.min.css');
-
-        body {
-            font-family: 'Roboto', sans-serif;
-            background: #f1f3f5;
-            color: #333;
-        }
-        .main, .stApp {
-            padding: 20px;
-        }
-        /* Sidebar */
-        .css-1cypcdb {
-            background: #ffffff;
-            border-right: 1px solid #eee;
-            padding: 20px;
-        }
-        .app-title {
-            font-size: 1.6em;
-            font-weight: 700;
-            margin-bottom: 30px;
-            color: #2c3e50;
-            text-align: center;
-        }
-        .cards-container {
-            display: flex;
-            flex-direction: column;
-            gap: 20px;
-            align-items: center;
-        }
-        .stButton > button {
-            background: #ffffff;
-            border-radius: 8px;
-            box-shadow: 0 2px 6px rgba(0,0,0,0.05);
-            width: 250px;
-            height: 120px;
-            cursor: pointer;
-            font-size: 1em;
-            font-weight: 500;
-            color: #2c3e50;
-            display: flex;
-            flex-direction: column;
-            justify-content: center;
-            align-items: center;
-            border: none;
-            transition: transform 0.2s, box-shadow 0.2s;
-        }
-        .stButton > button:hover {
-            transform: translateY(-5px);
-            box-shadow: 0 4px 12px rgba(0,0,0,0.1);
-        }
-        /* Main titles */
-        h1.main-title {
-            font-weight: 700;
-            color: #2c3e50;
-            font-size: 2.2em;
-            margin-bottom: 10px;
-            display: flex;
-            align-items: center;
-            gap: 10px;
-        }
-        h1.main-title i {
-            font-size: 1.3em;
-        }
-        .section-subtitle {
-            font-size: 1.1em;
-            color: #555;
-            margin-bottom: 30px;
-        }
-        h3.history-title {
-            font-size: 1.3em;
-            border-bottom: 2px solid #eee;
-            padding-bottom: 10px;
-            color: #2c3e50;
-            margin-top: 40px;
-            font-weight: 600;
-        }
-        /* Chat container and bubbles */
-        .chat-container {
-            max-width: 600px;
-            margin: 0 auto;
-        }
-        .chat-bubble {
-            padding: 15px;
-            border-radius: 10px;
-            margin-bottom: 20px;
-            line-height: 1.4;
-            font-size: 15px;
-            max-width: 80%;
-            word-wrap: break-word;
-            position: relative;
-        }
-        .chat-bubble.user {
-            background: #d9ecff;
-            margin-left: auto;
-            text-align: left;
-            border: 1px solid #c6ddf7;
-        }
-        .chat-bubble.system {
-            background: #ffffff;
-            margin-right: auto;
-            text-align: left;
-            border: 1px solid #eaeaea;
-        }
-        .chat-image {
-            max-width: 120px;
-            border-radius: 8px;
-            display: block;
-            margin-bottom: 10px;
-            border: 1px solid #ddd;
-        }
-        /* Info card styling */
-        .info-card {
-            background: #fefefe;
-            border-radius: 8px;
-            padding: 15px;
-            box-shadow: 0 2px 6px rgba(0, 0, 0, 0.05);
-            font-size: 15px;
-        }
-        .info-card strong {
-            color: #2c3e50;
-        }
-        /* File uploaders */
-        .stFileUploader, .stCameraInput, .stAudioInput {
-            border: 2px dashed #ccc;
-            border-radius: 6px;
-            padding: 20px;
-            margin-bottom: 20px;
-            text-align: center;
-            background: #fafafa;
-        }
-        .stFileUploader > div, .stCameraInput > div {
-            width: 100%;
-        }
-        </style>
-        """,
-        unsafe_allow_html=True,
+    st.markdown(APP_CSS_HTML, unsafe_allow_html=True)
+
+# Chat bubble templates, filled once per history entry (see render_history)
+USER_BUBBLE = '<div class="chat-bubble user">{thumbnail}<strong>You uploaded:</strong> {name}</div>'
+CHAT_IMAGE = '<img class="chat-image" src="data:image/jpeg;base64,{data}" alt="{name}"/>'
+SYSTEM_BUBBLE = '<div class="chat-bubble system">{message}</div>'
+IMAGE_INFO_CARD = (
+    '<div class="info-card"><strong>Extracted Information:</strong><ul>'
+    "<li><strong>Product Name:</strong> {product_name}</li>"
+    "<li><strong>Company:</strong> {company}</li>"
+    "<li><strong>Start Date:</strong> {start_date}</li>"
+    "<li><strong>End Date:</strong> {end_date}</li>"
+    "</ul></div>"
+)
+AUDIO_PRODUCT_ITEM = (
+    "<li>"
+    "<strong>Product Name:</strong> {product_name}<br>"
+    "<strong>Quantity:</strong> {quantity} {unit}<br>"
+    "<strong>Price:</strong> {price}<br>"
+    "<strong>Transaction Type:</strong> {transaction_type}<br>"
+    "<strong>Payment Date:</strong> {payment_date}"
+    "</li>"
+)
+AUDIO_INFO_CARD = (
+    "<div class='info-card'>"
+    "<strong>File:</strong> {audio_name}<br><br>"
+    "<strong>Transcription:</strong><br>"
+    "<div>{transcription}</div><br>"
+    "<strong>Person Name:</strong> {person_name}<br><br>"
+    "<strong>Extracted Product Information:</strong>"
+    "{products}"
+    "</div>"
+)
+NO_PRODUCTS = "<p>No product information found.</p>"
+
+def new_chat_history(kind):
+    """
+    Bounded per-session history; limits come from CHAT_HISTORY_MAX_ENTRIES and
+    CHAT_HISTORY_MEMORY_BUDGET (bytes). Set CHAT_HISTORY_BLOB_DIR to keep original uploads on disk.
+    """
+    blob_store = None
+    blob_dir = os.environ.get("CHAT_HISTORY_BLOB_DIR")
+    if blob_dir and kind == "image":
+        # A directory of its own, removed with the history (see BlobStore)
+        blob_store = BlobStore(parent=blob_dir)
+    return ChatHistory(
+        max_entries=int(os.environ.get("CHAT_HISTORY_MAX_ENTRIES", 100)),
+        memory_budget=int(os.environ.get("CHAT_HISTORY_MEMORY_BUDGET", 2 * 1024 * 1024)),
+        blob_store=blob_store,
     )
 
-def main():
-    custom_css()
+def history_page(history, key):
+    """
+    Pagination controls for a chat history; returns the entries of the selected page.
+    """
+    page_count = history.page_count(DEFAULT_PAGE_SIZE)
+    page = 0
+    if page_count > 1:
+        page = st.number_input(
+            "Page (1 = most recent)", min_value=1, max_value=page_count, value=1, key=key
+        ) - 1
+    if history.evicted:
+        st.caption(f"{history.evicted} older messages were removed to keep this session light.")
+    return history.page(page, DEFAULT_PAGE_SIZE)
+
+def render_history(history_key, entries, render_entry):
+    """
+    Show a page of chat entries as one HTML block. Bubbles are formatted on every
+    rerun rather than cached, so the history's memory budget bounds the session.
+    """
+    parts = [render_entry(entry) for entry in entries]
+    st.markdown(f'<div class="chat-container">{"".join(parts)}</div>', unsafe_allow_html=True)
+
+def upload_cache_key(upload, make_key, **options):
+    """
+    Cache key of an uploaded file, hashed once per upload rather than on every rerun.
+    """
+    # Least recently used first; only the last UPLOAD_KEYS_MAX uploads are remembered
+    keys = st.session_state.setdefault("upload_cache_keys", OrderedDict())
+    memo_key = (upload.file_id, make_key.__name__, tuple(sorted(options.items())))
+    if memo_key in keys:
+        keys.move_to_end(memo_key)
+    else:
+        keys[memo_key] = make_key(upload.getvalue(), **options)
+        while len(keys) > UPLOAD_KEYS_MAX:
+            keys.popitem(last=False)
+    return keys[memo_key]
+
+def init_session_state():
+    """
+    Per-session state of every mode, set up on the first run of the session.
+    """
+    if st.session_state.get("session_initialized"):
+        return
+    st.session_state.session_initialized = True
 
     # Initialize session state for images
     if "image_chat_history" not in st.session_state:
-        st.session_state.image_chat_history = []
+        st.session_state.image_chat_history = new_chat_history("image")
     if "last_processed_input_image" not in st.session_state:
         st.session_state.last_processed_input_image = None
-    
+    if "processed_image_keys" not in st.session_state:
+        st.session_state.processed_image_keys = set()
+    if "recent_images" not in st.session_state:
+        # Hashes of this session's recent images, to spot repeated captures of the same product
+        st.session_state.recent_images = NearDuplicateIndex(
+            max_distance=int(os.environ.get("NEAR_DUPLICATE_DISTANCE", DEFAULT_MAX_DISTANCE)),
+            max_entries=int(os.environ.get("NEAR_DUPLICATE_MAX_ENTRIES", DEFAULT_MAX_ENTRIES)),
+        )
+
     # Initialize session state for audio
     if "audio_chat_history" not in st.session_state:
-        st.session_state.audio_chat_history = []
+        st.session_state.audio_chat_history = new_chat_history("audio")
     if "last_processed_input_audio" not in st.session_state:
         st.session_state.last_processed_input_audio = None
-    
+
     # App mode
     if "app_mode" not in st.session_state:
         st.session_state.app_mode = "image_extraction"
 
+def main():
+    custom_css()
+    init_session_state()
+
     with st.sidebar:
         st.markdown("<h2 class='app-title'>PROBOUTIK APP</h2>", unsafe_allow_html=True)
         st.markdown('<div class="cards-container">', unsafe_allow_html=True)
@@ -179,192 +332,413 @@ def main():
         if st.button("🎤 Speech to Text"):
             st.session_state.app_mode = "speech_to_text"
 
+        if st.button("📒 Ledger"):
+            st.session_state.app_mode = "ledger"
+
         st.markdown('</div>', unsafe_allow_html=True)
 
-    # Decide which mode to run
+    # Only the active mode runs; each mode is a fragment, so its own widgets rerun it
+    # alone. Sidebar settings live out here (fragments cannot write to the sidebar)
     if st.session_state.app_mode == "image_extraction":
-        image_extraction_chat()
+        image_options = image_upload_settings()
+        reuse_duplicates = st.sidebar.toggle(
+            "Reuse results for repeated captures", value=True,
+            help="A picture very close to a recent one reuses its result instead of calling the model again.",
+        )
+        image_extraction_chat(image_options, reuse_duplicates)
+    elif st.session_state.app_mode == "ledger":
+        days = st.sidebar.slider("Upcoming payments (days)", 7, 90, 30, step=7)
+        ledger_dashboard(days)
     else:
-        speech_extraction()
+        streaming = st.sidebar.toggle(
+            "Streaming mode (long recordings)",
+            help="Split the recording on pauses, transcribe the pieces in parallel and show products as they are found.",
+        )
+        speech_extraction(streaming)
+
+    if st.sidebar.checkbox("Show performance metrics"):
+        metrics_panel()
+
+def metrics_panel():
+    """
+    Debug panel with per-stage latency, payload, token and retry statistics for this process.
+    """
+    rows = []
+    for stage, fields in metrics.snapshot().items():
+        duration = fields.get("duration_seconds", {})
+        rows.append({
+            "stage": stage,
+            "calls": duration.get("count", 0),
+            "errors": fields.get("errors", 0),
+            "p50 (s)": duration.get("p50"),
+            "p95 (s)": duration.get("p95"),
+            "avg bytes": fields.get("payload_bytes", {}).get("mean"),
+            "avg prompt tok": fields.get("prompt_tokens", {}).get("mean"),
+            "avg completion tok": fields.get("completion_tokens", {}).get("mean"),
+            "retries": fields.get("retries", {}).get("sum"),
+        })
+    with st.sidebar.expander("Performance metrics", expanded=True):
+        if rows:
+            st.dataframe(rows, hide_index=True)
+        else:
+            st.caption("No extraction calls recorded yet.")
 
-def image_extraction_chat():
+@st.fragment
+def image_extraction_chat(image_options, reuse_duplicates):
+    with metrics.stage("ui.image_extraction"):
+        image_extraction_body(image_options, reuse_duplicates)
+
+def image_extraction_body(image_options, reuse_duplicates):
     st.markdown("<h1 class='main-title'><i class='fa fa-image'></i> Image-Based Product Information</h1>", unsafe_allow_html=True)
     st.markdown("<p class='section-subtitle'>Upload or capture an image and we’ll extract the key product details for you!</p>", unsafe_allow_html=True)
 
-    uploaded_image = st.file_uploader("Upload an image...", type=["jpg", "jpeg", "png"])
+    uploaded_images = st.file_uploader("Upload one or more images...", type=["jpg", "jpeg", "png"], accept_multiple_files=True)
     camera_image = st.camera_input("Take a picture")
 
     if camera_image is not None:
-        # Generate a unique name each time so it never collides with a previous capture
-        unique_id = str(uuid.uuid4())
-        image_name = f"captured_image_{unique_id}"
-        # Check if we have processed this *exact* unique name before
-        if image_name != st.session_state.get("last_processed_input_image"):
-            process_image(camera_image, image_name)
-            st.session_state.last_processed_input_image = image_name
-
-    elif uploaded_image is not None:
-        # Combine user-provided filename with a UUID for uniqueness
-        unique_id = str(uuid.uuid4())
-        image_name = f"{uploaded_image.name}_{unique_id}"
-        if image_name != st.session_state.get("last_processed_input_image"):
-            process_image(uploaded_image, image_name)
-            st.session_state.last_processed_input_image = image_name
+        image_bytes = camera_image.getvalue()
+        cache_key = upload_cache_key(camera_image, image_cache_key, **image_options)
+        # Named after its content so reruns with the same picture are recognised
+        image_name = f"captured_image_{cache_key[:12]}"
+        # Check if we have processed this *exact* capture before
+        if cache_key != st.session_state.get("last_processed_input_image"):
+            process_image(image_bytes, image_name, cache_key, image_options, reuse_duplicates)
+            st.session_state.last_processed_input_image = cache_key
+
+    elif uploaded_images:
+        # Only images not seen yet in this session are sent for extraction
+        pending = []
+        current_keys = set()
+        for uploaded_image in uploaded_images:
+            image_bytes = uploaded_image.getvalue()
+            cache_key = upload_cache_key(uploaded_image, image_cache_key, **image_options)
+            current_keys.add(cache_key)
+            if cache_key not in st.session_state.processed_image_keys:
+                pending.append((image_bytes, uploaded_image.name, cache_key))
+        # Files removed from the uploader are forgotten, so the set never outgrows the upload list
+        st.session_state.processed_image_keys &= current_keys
+
+        if len(pending) == 1:
+            process_image(*pending[0], image_options, reuse_duplicates)
+            st.session_state.processed_image_keys.add(pending[0][2])
+        elif pending:
+            st.session_state.processed_image_keys.update(process_image_batch(pending, image_options, reuse_duplicates))
+    else:
+        st.session_state.processed_image_keys.clear()
 
     display_image_chat_history()
 
-def process_image(image_file, image_name):
-    # Save the uploaded/captured image to a temporary file to get a file path
-    with tempfile.NamedTemporaryFile(delete=False, suffix=".jpg") as temp_image_file:
-        temp_image_file.write(image_file.getvalue())
-        temp_image_path = temp_image_file.name
-
-    # Store the user image in the chat history
-    base64_image = base64.b64encode(image_file.getvalue()).decode("utf-8")
-    st.session_state.image_chat_history.append({
-        "role": "user",
-        "image": base64_image,
-        "name": image_name
-    })
-
-    
-    with st.spinner("Processing image..."):
-        product_info = extract_image_product_info(temp_image_path)
+def image_upload_settings():
+    """
+    Sidebar controls for the upload preprocessing (size, quality and OpenAI detail level).
+    """
+    details = ["auto", "high", "low"]
+    with st.sidebar.expander("Image upload settings"):
+        max_dimension = st.slider("Max dimension (px)", 512, 2048, DEFAULT_MAX_DIMENSION, step=128)
+        jpeg_quality = st.slider("JPEG quality", 50, 95, DEFAULT_JPEG_QUALITY, step=5)
+        detail = st.selectbox("Detail level", details, index=details.index(DEFAULT_DETAIL))
+    return {"max_dimension": max_dimension, "jpeg_quality": jpeg_quality, "detail": detail}
+
+def process_image(image_bytes, image_name, cache_key, image_options, reuse_duplicates=True):
+    cache = get_result_cache()
+    product_json = cache.get(cache_key)
+    # One reduced-scale decode gives both the hash and, for cached results, the thumbnail
+    preview = open_preview(image_bytes, DEFAULT_THUMBNAIL_SIZE)
+    image_hash = perceptual_hash(preview)
+    thumbnail = None
+    if product_json is None:
+        product_json = near_duplicate_result(image_name, image_hash, reuse_duplicates)
+    if product_json is None:
+        report = {}
+        try:
+            with st.spinner("Processing image..."):
+                product_json = extract_image_product_info(
+                    image_bytes, report=report, thumbnail_size=DEFAULT_THUMBNAIL_SIZE, **image_options
+                )
+        except DeadlineExceeded:
+            st.error(f"{image_name} took too long to process, please try again.")
+            return
+        cache.set(cache_key, product_json)
+        thumbnail = report.get("thumbnail")
+        st.toast(format_preprocess_report(report))
+
+    st.session_state.recent_images.add(image_hash, (image_name, product_json))
+    if thumbnail is None:
+        thumbnail = make_thumbnail(preview, DEFAULT_THUMBNAIL_SIZE)
+    append_image_result(image_bytes, image_name, json.loads(product_json), thumbnail)
+
+def near_duplicate_result(image_name, image_hash, reuse_duplicates):
+    """
+    Result of a recent image that this one nearly duplicates, or None. With reuse off,
+    near-duplicates are only flagged and extracted again.
+    """
+    match = st.session_state.recent_images.find(image_hash)
+    if match is None:
+        return None
+    distance, (previous_name, product_json) = match
+    if reuse_duplicates:
+        st.toast(f"{image_name} looks like {previous_name} (distance {distance}): reused its result.")
+        return product_json
+    st.toast(f"{image_name} looks like {previous_name} (distance {distance}).")
+    return None
+
+def process_image_batch(pending, image_options, reuse_duplicates=True):
+    """
+    Extract several uploads concurrently, reporting each image as soon as it finishes.
+    Returns the cache keys of the images that were processed successfully.
+    """
+    cache = get_result_cache()
+    max_workers = int(os.environ.get("BATCH_MAX_WORKERS", 4))
+    # PACK_IMAGES=1 sends several uploads per model call (see extract_image_product_info_packed)
+    extract = extract_image_product_info_packed if os.environ.get("PACK_IMAGES") == "1" else extract_image_product_info_batch
+
+    results = {}
+    to_extract = []
+    hashes = {}
+    thumbnails = {}
+    for index, (image_bytes, image_name, cache_key) in enumerate(pending):
+        # Each upload is decoded once here, at a reduced scale, for its hash and thumbnail
+        preview = open_preview(image_bytes, DEFAULT_THUMBNAIL_SIZE)
+        hashes[index] = perceptual_hash(preview)
+        thumbnails[index] = make_thumbnail(preview, DEFAULT_THUMBNAIL_SIZE)
+        product_json = cache.get(cache_key)
+        if product_json is None:
+            product_json = near_duplicate_result(image_name, hashes[index], reuse_duplicates)
+        if product_json is not None:
+            results[index] = product_json
+        else:
+            to_extract.append((index, image_bytes))
+
+    errors = {}
+    with st.status(f"Processing {len(pending)} images...", expanded=True) as status:
+        progress = st.progress(len(results) / len(pending))
+        batch = extract(
+            [image_bytes for _, image_bytes in to_extract], max_workers=max_workers, **image_options
+        )
+        for batch_index, _, product_json, error in batch:
+            index = to_extract[batch_index][0]
+            _, image_name, cache_key = pending[index]
+            if error is not None:
+                errors[index] = error
+                status.write(f"❌ {image_name}: {error}")
+            else:
+                results[index] = product_json
+                cache.set(cache_key, product_json)
+                product_name = json.loads(product_json).get("product_name") or "N/A"
+                status.write(f"✅ {image_name}: {product_name}")
+            progress.progress((len(results) + len(errors)) / len(pending))
+        status.update(
+            label=f"Processed {len(results)} of {len(pending)} images",
+            state="error" if errors else "complete",
+            expanded=bool(errors),
+        )
+
+    # Add results to the history in upload order
+    for index, (image_bytes, image_name, _) in enumerate(pending):
+        if index in results:
+            st.session_state.recent_images.add(hashes[index], (image_name, results[index]))
+            append_image_result(image_bytes, image_name, json.loads(results[index]), thumbnails[index])
+
+    return {pending[index][2] for index in results}
+
+def append_image_result(image_bytes, image_name, product_info, thumbnail=None):
+    # Store a thumbnail of the user image in the chat history
+    st.session_state.image_chat_history.add_image(image_bytes, image_name, thumbnail=thumbnail)
 
     # Build a nice HTML response
-    formatted_message = f"""
-    <div class="info-card">
-        <strong>Extracted Information:</strong>
-        <ul>
-            <li><strong>Product Name:</strong> {product_info.get('product_name', 'N/A')}</li>
-            <li><strong>Company:</strong> {product_info.get('company', 'N/A')}</li>
-            <li><strong>Start Date:</strong> {product_info.get('start_date', 'N/A')}</li>
-            <li><strong>End Date:</strong> {product_info.get('end_date', 'N/A')}</li>
-        </ul>
-    </div>
-    """
+    formatted_message = IMAGE_INFO_CARD.format(
+        product_name=product_info.get('product_name', 'N/A'),
+        company=product_info.get('company', 'N/A'),
+        start_date=product_info.get('start_date', 'N/A'),
+        end_date=product_info.get('end_date', 'N/A'),
+    )
+
+    st.session_state.image_chat_history.add_message("system", sanitize_message(formatted_message))
 
-    st.session_state.image_chat_history.append({
-        "role": "system",
-        "message": sanitize_message(formatted_message)
-    })
+def render_image_entry(chat):
+    if chat["role"] == "user":
+        thumbnail = ""
+        if "thumbnail" in chat:
+            thumbnail = CHAT_IMAGE.format(data=chat["thumbnail"], name=chat["name"])
+        return USER_BUBBLE.format(thumbnail=thumbnail, name=chat["name"])
+    if chat["role"] == "system":
+        return SYSTEM_BUBBLE.format(message=chat["message"])
+    return ""
 
 def display_image_chat_history():
     if st.session_state.image_chat_history:
         st.markdown("<h3 class='history-title'>Chat History</h3>", unsafe_allow_html=True)
-        st.markdown('<div class="chat-container">', unsafe_allow_html=True)
-        for chat in st.session_state.image_chat_history:
-            if chat["role"] == "user":
-                if "image" in chat:
-                    st.markdown(f"""
-                    <div class="chat-bubble user">
-                        <img class="chat-image" src="data:image/png;base64,{chat['image']}" alt="{chat['name']}"/>
-                        <strong>You uploaded:</strong> {chat['name']}
-                    
-                    """, unsafe_allow_html=True)
-            elif chat["role"] == "system":
-                st.markdown(f"""
-                <div class="chat-bubble system">
-                    {chat["message"]}
-                
-                """, unsafe_allow_html=True)
-        st.markdown('</div>', unsafe_allow_html=True)
+        entries = history_page(st.session_state.image_chat_history, "image_history_page")
+        render_history("image_chat_history", entries, render_image_entry)
+
 
+@st.fragment
+def speech_extraction(streaming):
+    with metrics.stage("ui.speech_to_text"):
+        speech_extraction_body(streaming)
 
-def speech_extraction():
+def speech_extraction_body(streaming):
     st.markdown("<h1 class='main-title'><i class='fa fa-microphone'></i> Speech-Based Product Information</h1>", unsafe_allow_html=True)
     st.markdown("<p class='section-subtitle'>Upload or record an audio file and we’ll transcribe the spoken product details for you!</p>", unsafe_allow_html=True)
 
     uploaded_audio = st.file_uploader("Upload an audio file...", type=["wav", "mp3"])
     recorded_audio = st.audio_input("Record audio")
+    process = process_audio_streaming if streaming else process_audio
+    make_key = stream_cache_key if streaming else transcription_cache_key
 
     # If user records an audio
     if recorded_audio:
-        unique_id = str(uuid.uuid4())
-        audio_name = f"recorded_audio_{unique_id}"
-        if audio_name != st.session_state["last_processed_input_audio"]:
-            process_audio(recorded_audio, audio_name)
-            st.session_state["last_processed_input_audio"] = audio_name
+        audio_bytes = recorded_audio.getvalue()
+        cache_key = upload_cache_key(recorded_audio, make_key)
+        audio_name = f"recorded_audio_{cache_key[:12]}.wav"
+        if cache_key != st.session_state["last_processed_input_audio"]:
+            process(audio_bytes, audio_name, cache_key)
+            st.session_state["last_processed_input_audio"] = cache_key
 
     # If user uploads an audio file
     elif uploaded_audio:
-        unique_id = str(uuid.uuid4())
-        audio_name = f"{uploaded_audio.name}_{unique_id}"
-        if audio_name != st.session_state["last_processed_input_audio"]:
-            process_audio(uploaded_audio, audio_name)
-            st.session_state["last_processed_input_audio"] = audio_name
+        audio_bytes = uploaded_audio.getvalue()
+        cache_key = upload_cache_key(uploaded_audio, make_key)
+        audio_name = uploaded_audio.name
+        if cache_key != st.session_state["last_processed_input_audio"]:
+            process(audio_bytes, audio_name, cache_key)
+            st.session_state["last_processed_input_audio"] = cache_key
 
     # Show chat
     display_audio_chat_history()
 
-def process_audio(audio_file, audio_name):
-    # Write audio to disk
-    with tempfile.NamedTemporaryFile(delete=False, suffix=".wav") as temp_audio:
-        temp_audio.write(audio_file.getvalue())
-        temp_audio_path = temp_audio.name
-
-    # Transcribe
-    with st.spinner("Transcribing audio..."):
-        transcription = transcribe_audio_file(temp_audio_path)
+def process_audio(audio_bytes, audio_name, cache_key):
+    cache = get_result_cache()
+
+    transcription = cache.get(cache_key)
+    if transcription is None:
+        # Transcribe straight from memory
+        report = {}
+        with st.spinner("Transcribing audio..."):
+            transcription = transcribe_audio_file(audio_bytes, filename=audio_name, report=report)
+        if report:
+            st.toast(format_audio_report(report))
+        # Failed transcriptions are not cached so the next attempt retries
+        if not transcription.startswith("Error:"):
+            cache.set(cache_key, transcription)
 
     # Extract products
-    extracted_data = extract_products(transcription)
+    products_key = products_cache_key(transcription)
+    try:
+        extracted_json = cache.get_or_compute(products_key, lambda: extract_products(transcription))
+    except DeadlineExceeded:
+        st.error(f"Extracting the products of {audio_name} took too long, please try again.")
+        return
+    extracted_data = json.loads(extracted_json)
+    record_transaction(extracted_data, cache_key)
+
+    # Store result in audio chat
+    st.session_state["audio_chat_history"].add_message(
+        "system", build_audio_message(audio_name, transcription, extracted_data)
+    )
+
+def process_audio_streaming(audio_bytes, audio_name, cache_key):
+    """
+    Streaming variant of process_audio: products are shown while the rest of the
+    recording is still being transcribed.
+    """
+    cache = get_result_cache()
+    cached = cache.get(cache_key)
+    if cached is not None:
+        cached = json.loads(cached)
+        transcription, extracted_data = cached["transcription"], cached["result"]
+    else:
+        live_result = st.empty()
+        transcription, extracted_data, errors = "", {"person_name": None, "products": []}, []
+        with st.spinner("Transcribing and extracting..."):
+            for update in extract_products_from_audio_stream(audio_bytes):
+                transcription, extracted_data, errors = update["transcription"], update["result"], update["errors"]
+                live_result.markdown(
+                    f"<div class='chat-bubble system'>{build_audio_message(audio_name, transcription, extracted_data)}</div>",
+                    unsafe_allow_html=True,
+                )
+        live_result.empty()
+        for error in errors:
+            st.warning(error)
+        # Partial results are not cached so the next attempt retries the failed chunks
+        if not errors:
+            cache.set(cache_key, json.dumps({"transcription": transcription, "result": extracted_data}, ensure_ascii=False))
+            record_transaction(extracted_data, cache_key)
+
+    st.session_state["audio_chat_history"].add_message(
+        "system", build_audio_message(audio_name, transcription, extracted_data)
+    )
+
+def record_transaction(extracted_data, source_key):
+    # Queued for the ledger's writer thread; the same recording is only counted once
+    ledger = get_ledger()
+    if ledger is not None:
+        ledger.record(extracted_data, source_key)
+
+def build_audio_message(audio_name, transcription, extracted_data):
     person_name = extracted_data.get("person_name", "N/A")
 
     # Build HTML for product list
-    product_html = ""
-    if isinstance(extracted_data, dict) and "products" in extracted_data:
-        products = extracted_data["products"]
-        if products:
-            product_html = "<ul>"
-            for prod in products:
-                product_html += (
-                    "<li>"
-                    f"<strong>Product Name:</strong> {prod.get('product_name', 'N/A')}<br>"
-                    f"<strong>Quantity:</strong> {prod.get('quantity', 'N/A')}<br>"
-                    f"<strong>Price:</strong> {prod.get('price', 'N/A')}<br>"
-                    f"<strong>Transaction Type:</strong> {prod.get('transaction_type', 'N/A')}<br>"
-                    f"<strong>Payment Date:</strong> {prod.get('payment_date', 'N/A')}"
-                    "</li>"
-                )
-            product_html += "</ul>"
-        else:
-            product_html = "<p>No product information found.</p>"
-    else:
-        product_html = "<p>No product information found.</p>"
+    product_html = NO_PRODUCTS
+    if isinstance(extracted_data, dict) and extracted_data.get("products"):
+        product_html = "<ul>" + "".join(
+            AUDIO_PRODUCT_ITEM.format(
+                product_name=prod.get('product_name', 'N/A'),
+                quantity=prod.get('quantity', 'N/A'),
+                unit=prod.get('unit') or '',
+                price=prod.get('price', 'N/A'),
+                transaction_type=prod.get('transaction_type', 'N/A'),
+                payment_date=prod.get('payment_date', 'N/A'),
+            )
+            for prod in extracted_data["products"]
+        ) + "</ul>"
 
     # Combine everything into a final HTML snippet
-    msg_html = (
-        "<div class='info-card'>"
-        f"<strong>File:</strong> {audio_name}<br><br>"
-        "<strong>Transcription:</strong><br>"
-        f"<div>{transcription}</div><br>"
-        f"<strong>Person Name:</strong> {person_name}<br><br>"
-        "<strong>Extracted Product Information:</strong>"
-        f"{product_html}"
-        "</div>"
+    return AUDIO_INFO_CARD.format(
+        audio_name=audio_name, transcription=transcription, person_name=person_name, products=product_html,
     )
 
-    # Store result in audio chat
-    st.session_state["audio_chat_history"].append({
-        "role": "system",
-        "message": msg_html
-    })
+def render_audio_entry(chat_item):
+    return SYSTEM_BUBBLE.format(message=chat_item["message"]) if chat_item["role"] == "system" else ""
 
 def display_audio_chat_history():
     if st.session_state["audio_chat_history"]:
         st.markdown("<h3 class='history-title'>Chat History</h3>", unsafe_allow_html=True)
-        st.markdown("<div class='chat-container'>", unsafe_allow_html=True)
-
-        for chat_item in st.session_state["audio_chat_history"]:
-            if chat_item["role"] == "system":
-                # Render system bubble
-                st.markdown(
-                    f"<div class='chat-bubble system'>{chat_item['message']}</div>",
-                    unsafe_allow_html=True
-                )
+        entries = history_page(st.session_state["audio_chat_history"], "audio_history_page")
+        render_history("audio_chat_history", entries, render_audio_entry)
+
+@st.fragment
+def ledger_dashboard(days):
+    with metrics.stage("ui.ledger"):
+        ledger_dashboard_body(days)
+
+def ledger_dashboard_body(days):
+    st.markdown("<h1 class='main-title'><i class='fa fa-book'></i> Transaction Ledger</h1>", unsafe_allow_html=True)
+    ledger = get_ledger()
+    if ledger is None:
+        st.info("Set LEDGER_DB to the path of a database file to keep the extracted transactions.")
+        return
+
+    totals = ledger.sales_vs_purchases()
+    sales, purchases = st.columns(2)
+    sales.metric("Sales", f"{totals['vente']['amount']:,.0f}", f"{totals['vente']['line_count']} lines", delta_color="off")
+    purchases.metric("Purchases", f"{totals['achat']['amount']:,.0f}", f"{totals['achat']['line_count']} lines", delta_color="off")
+
+    st.markdown("<h3 class='history-title'>Upcoming payments</h3>", unsafe_allow_html=True)
+    upcoming = ledger.upcoming_payments(days)
+    if upcoming["lines"]:
+        st.dataframe(upcoming["lines"], hide_index=True)
+    else:
+        st.caption(f"No payment due in the next {days} days.")
 
-        st.markdown("</div>", unsafe_allow_html=True)
+    st.markdown("<h3 class='history-title'>Customers</h3>", unsafe_allow_html=True)
+    customers = ledger.customer_totals(limit=50)
+    if customers:
+        st.dataframe(customers, hide_index=True)
+    else:
+        st.caption("No transactions recorded yet.")
 
 if __name__ == "__main__":
-    main()
+    # Whole-script time of a full rerun (fragment reruns are recorded as ui.<mode>)
+    with metrics.stage("ui.app"):
+        main()
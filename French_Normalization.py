@@ -0,0 +1,493 @@
+import calendar
+import re
+from datetime import date, timedelta
+
+# Local normalization of French transcripts: spelled-out numbers, amounts and
+# absolute/relative dates. Used to answer simple utterances without the model and to
+# hand the model pre-resolved text (and a shorter prompt) otherwise.
+
+UNITS = {
+    "zéro": 0, "zero": 0, "un": 1, "une": 1, "deux": 2, "trois": 3, "quatre": 4, "cinq": 5,
+    "six": 6, "sept": 7, "huit": 8, "neuf": 9, "dix": 10, "onze": 11, "douze": 12,
+    "treize": 13, "quatorze": 14, "quinze": 15, "seize": 16,
+}
+TENS = {
+    "vingt": 20, "vingts": 20, "trente": 30, "quarante": 40, "cinquante": 50, "soixante": 60,
+    "septante": 70, "huitante": 80, "octante": 80, "nonante": 90,
+}
+SCALES = {"cent": 100, "cents": 100, "mille": 1000, "million": 10 ** 6, "millions": 10 ** 6,
+          "milliard": 10 ** 9, "milliards": 10 ** 9}
+FRENCH_NUMBER_WORDS = tuple(UNITS) + tuple(TENS) + tuple(SCALES)
+# Number words that are also articles or adjectives ("un peu", "un sac neuf"): on their
+# own they only become digits in a quantity position, i.e. before a noun or a unit
+AMBIGUOUS_NUMBER_WORDS = {"un", "une", "neuf"}
+# Words after which an ambiguous number word is not a quantity
+NOT_COUNTED = {
+    "peu", "autre", "autres", "certain", "certaine", "tel", "telle", "seul", "seule", "jour", "moment",
+    "fois", "à", "a", "de", "des", "du", "et", "ou", "pour", "par", "sur", "avec", "que", "qui",
+    "le", "la", "les", "ce", "cet", "cette",
+}
+# Words before which an ambiguous number word is not a quantity ("c'est un bon client")
+NOT_COUNTING = {"est", "était", "sera", "c'est", "c’est"}
+
+# Units of measure, by the canonical symbol stored in the "unit" field
+MEASURE_UNITS = {
+    "g": ("g", "gr", "gramme", "grammes"),
+    "kg": ("kg", "kilo", "kilos", "kilogramme", "kilogrammes"),
+    "l": ("l", "litre", "litres"),
+    "cl": ("cl", "centilitre", "centilitres"),
+    "ml": ("ml", "millilitre", "millilitres"),
+}
+UNIT_ALIASES = {alias: unit for unit, aliases in MEASURE_UNITS.items() for alias in aliases}
+# Words naming one unit in a price ("600 le kilo")
+UNIT_PRICE_WORDS = {"kilo": "kg", "kg": "kg", "litre": "l", "gramme": "g"}
+
+WEEKDAYS = {"lundi": 0, "mardi": 1, "mercredi": 2, "jeudi": 3, "vendredi": 4, "samedi": 5, "dimanche": 6}
+MONTHS = {
+    "janvier": 1, "février": 2, "fevrier": 2, "mars": 3, "avril": 4, "mai": 5, "juin": 6,
+    "juillet": 7, "août": 8, "aout": 8, "septembre": 9, "octobre": 10, "novembre": 11,
+    "décembre": 12, "decembre": 12,
+}
+# Words that suggest a date the patterns below may not understand
+DATE_HINTS = (
+    "jour", "jours", "semaine", "semaines", "mois", "an", "ans", "année", "demain", "hier",
+    "prochain", "prochaine", "dernier", "dernière", "passé", "fin", "début", "debut", "aujourd'hui",
+) + tuple(WEEKDAYS) + tuple(MONTHS)
+
+CURRENCY = r"(?:f\s?cfa|cfa|xof|francs?|fr|f|€|euros?)"
+
+_WORD = r"[a-zàâäçéèêëîïôöûùüÿœ]+"
+_NUMBER_TOKEN = re.compile(r"\d+(?:[   .]\d{3})*(?:,\d+)?|%s(?:-%s)*" % (_WORD, _WORD), re.IGNORECASE)
+_MENTIONS_NUMBER = re.compile(r"\d|\b(?:%s)\b" % "|".join(FRENCH_NUMBER_WORDS), re.IGNORECASE)
+_DATE_HINT = re.compile(r"\b(?:%s)\b" % "|".join(re.escape(word) for word in DATE_HINTS), re.IGNORECASE)
+
+
+# Function to tell whether a text mentions any number, in digits or words
+def mentions_numbers(text):
+    return bool(text and _MENTIONS_NUMBER.search(text))
+
+
+# Function to map a unit of measure to its symbol ("kilos" -> "kg"); None if not a unit
+def normalize_unit(word):
+    if word is None:
+        return None
+    return UNIT_ALIASES.get(str(word).strip().lower().rstrip("."))
+
+
+# Function to tell whether a text looks like it talks about a date
+def mentions_date(text):
+    return bool(text and _DATE_HINT.search(text))
+
+
+def _is_number_word(word):
+    return all(part in UNITS or part in TENS or part in SCALES or part == "et" for part in word.lower().split("-"))
+
+
+# Function to convert spelled-out French number words into an integer
+# ("cinq mille", "quatre-vingt-dix-sept", "deux cent cinquante"); None if not a number
+def words_to_number(text):
+    parts = [part for part in re.split(r"[\s-]+", text.strip().lower()) if part and part != "et"]
+    if not parts:
+        return None
+    total = 0
+    current = 0
+    previous = None
+    for part in parts:
+        if part in UNITS:
+            current += UNITS[part]
+        elif part in ("vingt", "vingts") and previous == "quatre":
+            # quatre-vingt(s): the 4 already added becomes 80
+            current += 76
+        elif part in TENS:
+            current += TENS[part]
+        elif part in ("cent", "cents"):
+            current = (current or 1) * 100
+        elif part in SCALES:
+            total += (current or 1) * SCALES[part]
+            current = 0
+        else:
+            return None
+        previous = part
+    return total + current
+
+
+# Function to parse digits written the usual local ways ("5 000", "1.500", "2,5")
+def parse_digits(text):
+    number = re.sub(r"[\s  ]", "", text)
+    if "," in number:
+        number = number.replace(".", "").replace(",", ".")
+    elif re.fullmatch(r"-?\d{1,3}(\.\d{3})+", number):
+        number = number.replace(".", "")
+    value = float(number)
+    return int(value) if value.is_integer() else value
+
+
+# Function to tell whether the ambiguous number word tokens[index] stands in a quantity
+# position: before a noun, unit or currency, and not after "est" or an elided article
+def _counts_something(text, tokens, index):
+    token = tokens[index]
+    before = text[:token.start()]
+    if before.endswith(("'", "’")) or (before.split() or [""])[-1].lower() in NOT_COUNTING:
+        return False
+    if index + 1 >= len(tokens):
+        return False
+    following = tokens[index + 1]
+    if text[token.end():following.start()].strip():
+        return False
+    return following.group(0).lower() not in NOT_COUNTED
+
+
+# Function to replace spelled-out numbers with digits ("deux sacs à cinq mille" -> "2 sacs à 5000").
+# A digit directly followed by a scale word is folded in too ("5 mille" -> "5000").
+def replace_number_words(text):
+    tokens = list(_NUMBER_TOKEN.finditer(text))
+    pieces = []
+    position = 0
+    index = 0
+    while index < len(tokens):
+        token = tokens[index]
+        word = token.group(0)
+        is_digit = word[0].isdigit()
+        run = []
+        if is_digit:
+            following = tokens[index + 1] if index + 1 < len(tokens) else None
+            if following is not None and following.group(0).lower() in SCALES \
+                    and not text[token.end():following.start()].strip():
+                run = [token, following]
+        elif _is_number_word(word) and word.lower() != "et":
+            run = [token]
+            if word.lower() in AMBIGUOUS_NUMBER_WORDS and not _counts_something(text, tokens, index):
+                run = []
+        if not run:
+            index += 1
+            continue
+
+        # Extend the run over adjacent number words; "et" only inside "vingt et un" and the like
+        end = index + len(run)
+        while end < len(tokens) and not text[tokens[end - 1].end():tokens[end].start()].strip():
+            candidate = tokens[end].group(0).lower()
+            if candidate == "et":
+                following = tokens[end + 1].group(0).lower() if end + 1 < len(tokens) else ""
+                if tokens[end - 1].group(0).lower().split("-")[-1] in TENS and following in ("un", "une", "onze"):
+                    run.extend(tokens[end:end + 2])
+                    end += 2
+                    continue
+                break
+            if candidate[0].isdigit() or not _is_number_word(candidate):
+                break
+            run.append(tokens[end])
+            end += 1
+
+        if is_digit:
+            value = parse_digits(run[0].group(0)) * (words_to_number(" ".join(t.group(0) for t in run[1:])) or 1)
+        else:
+            value = words_to_number(" ".join(t.group(0) for t in run))
+        if value is None:
+            index += 1
+            continue
+        pieces.append(text[position:run[0].start()])
+        pieces.append(str(int(value) if float(value).is_integer() else value))
+        position = run[-1].end()
+        index = end
+    pieces.append(text[position:])
+    return "".join(pieces)
+
+
+# Function to read the first amount in a text ("5 000 FCFA", "1.500 francs", "cinq mille")
+def parse_amount(text):
+    text = replace_number_words(text)
+    match = re.search(r"(\d[\d   .]*(?:,\d+)?)\s*%s?" % CURRENCY, text, re.IGNORECASE)
+    if not match:
+        return None
+    return parse_digits(match.group(1).strip())
+
+
+# Function to add calendar months to a date, clipping the day to the month's length
+def add_months(day, months):
+    month_index = day.month - 1 + months
+    year, month = day.year + month_index // 12, month_index % 12 + 1
+    return date(year, month, min(day.day, calendar.monthrange(year, month)[1]))
+
+
+def _expand_year(year):
+    year = int(year)
+    return year + 2000 if year < 100 else year
+
+
+def _future(candidate, today, step):
+    # Dates without a year (or month) are taken as the next occurrence
+    return candidate if candidate >= today else step(candidate)
+
+
+def _safe_date(year, month, day):
+    try:
+        return date(year, month, day)
+    except ValueError:
+        return None
+
+
+_MONTH_NAMES = "|".join(MONTHS)
+_WEEKDAY_NAMES = "|".join(WEEKDAYS)
+_DATE_PATTERNS = [
+    ("iso", re.compile(r"\b(\d{4})-(\d{1,2})-(\d{1,2})\b")),
+    ("numeric", re.compile(r"\b(\d{1,2})[/.-](\d{1,2})[/.-](\d{4}|\d{2})\b")),
+    ("named", re.compile(r"\b(?:le\s+)?(\d{1,2}|1er|premier)\s+(%s)(?:\s+(\d{4}))?\b" % _MONTH_NAMES, re.IGNORECASE)),
+    ("day_of_month", re.compile(r"\ble\s+(\d{1,2}|1er)(?:\s+du\s+mois(\s+prochain)?)?(?=\s*(?:[,.;!?]|$))", re.IGNORECASE)),
+    ("after_tomorrow", re.compile(r"\bapr[eè]s[- ]demain\b", re.IGNORECASE)),
+    ("before_yesterday", re.compile(r"\bavant[- ]hier\b", re.IGNORECASE)),
+    ("today", re.compile(r"\b(?:aujourd['’]hui|ce soir)\b", re.IGNORECASE)),
+    ("tomorrow", re.compile(r"\bdemain\b", re.IGNORECASE)),
+    ("yesterday", re.compile(r"\bhier\b", re.IGNORECASE)),
+    ("in", re.compile(r"\bdans\s+(\d+)\s+(jours?|semaines?|mois|ans?)\b", re.IGNORECASE)),
+    ("next_week", re.compile(r"\b(?:la\s+)?semaine\s+prochaine\b", re.IGNORECASE)),
+    ("end_of_month", re.compile(r"\b(?:à\s+la\s+)?fin\s+(?:du|de)\s+mois(\s+prochain)?\b", re.IGNORECASE)),
+    ("start_of_month", re.compile(r"\b(?:au\s+)?d[ée]but\s+du\s+mois\s+prochain\b", re.IGNORECASE)),
+    ("next_month", re.compile(r"\b(?:le\s+)?mois\s+prochain\b", re.IGNORECASE)),
+    ("weekday", re.compile(r"\b(%s)(?:\s+(prochain|dernier|pass[ée]))?\b" % _WEEKDAY_NAMES, re.IGNORECASE)),
+]
+
+
+def _resolve(kind, match, today):
+    if kind == "iso":
+        return _safe_date(int(match.group(1)), int(match.group(2)), int(match.group(3)))
+    if kind == "numeric":
+        return _safe_date(_expand_year(match.group(3)), int(match.group(2)), int(match.group(1)))
+    if kind == "named":
+        day = 1 if match.group(1).lower() in ("1er", "premier") else int(match.group(1))
+        month = MONTHS[match.group(2).lower()]
+        if match.group(3):
+            return _safe_date(int(match.group(3)), month, day)
+        candidate = _safe_date(today.year, month, day)
+        return candidate and _future(candidate, today, lambda d: _safe_date(d.year + 1, d.month, d.day))
+    if kind == "day_of_month":
+        day = 1 if match.group(1).lower() == "1er" else int(match.group(1))
+        if match.group(2):
+            next_month = add_months(today.replace(day=1), 1)
+            return _safe_date(next_month.year, next_month.month, day)
+        candidate = _safe_date(today.year, today.month, day)
+        return candidate and _future(candidate, today, lambda d: add_months(d, 1))
+    if kind == "after_tomorrow":
+        return today + timedelta(days=2)
+    if kind == "before_yesterday":
+        return today - timedelta(days=2)
+    if kind == "today":
+        return today
+    if kind == "tomorrow":
+        return today + timedelta(days=1)
+    if kind == "yesterday":
+        return today - timedelta(days=1)
+    if kind == "in":
+        count, unit = int(match.group(1)), match.group(2).lower()
+        if unit.startswith("jour"):
+            return today + timedelta(days=count)
+        if unit.startswith("semaine"):
+            return today + timedelta(weeks=count)
+        if unit == "mois":
+            return add_months(today, count)
+        return add_months(today, 12 * count)
+    if kind == "next_week":
+        return today + timedelta(weeks=1)
+    if kind == "end_of_month":
+        month = add_months(today.replace(day=1), 1 if match.group(1) else 0)
+        return month.replace(day=calendar.monthrange(month.year, month.month)[1])
+    if kind == "start_of_month":
+        return add_months(today.replace(day=1), 1)
+    if kind == "next_month":
+        return add_months(today, 1)
+    if kind == "weekday":
+        weekday = WEEKDAYS[match.group(1).lower()]
+        if match.group(2) and match.group(2).lower() != "prochain":
+            # "vendredi dernier" / "vendredi passé": the last Friday before today
+            return today - timedelta(days=(today.weekday() - weekday - 1) % 7 + 1)
+        # "vendredi" and "vendredi prochain" both mean the next Friday after today
+        return today + timedelta(days=(weekday - today.weekday() - 1) % 7 + 1)
+    return None
+
+
+# Function to find the dates in a (number-normalized) text.
+# Returns non-overlapping (start, end, date) tuples in text order.
+def find_dates(text, today=None):
+    today = today or date.today()
+    found = []
+    for kind, pattern in _DATE_PATTERNS:
+        for match in pattern.finditer(text):
+            if any(match.start() < end and start < match.end() for start, end, _ in found):
+                continue
+            resolved = _resolve(kind, match, today)
+            if resolved is not None:
+                found.append((match.start(), match.end(), resolved))
+    return sorted(found)
+
+
+# Function to resolve the first date mentioned in a text, or None
+def resolve_date(text, today=None):
+    dates = find_dates(replace_number_words(text), today)
+    return dates[0][2] if dates else None
+
+
+# Function to read a date value as printed on a label or returned by the model:
+# dd/mm/yy(yy) with - / . or space, yyyy-mm-dd, mm/yy, "15 mars 2025", "mars 2025",
+# and, when `today` is given, relative phrases. Returns a date or None.
+def parse_date_value(value, today=None):
+    text = str(value).strip().lower()
+    match = re.fullmatch(r"(\d{4})[-/.](\d{1,2})[-/.](\d{1,2})", text)
+    if match:
+        return _safe_date(int(match.group(1)), int(match.group(2)), int(match.group(3)))
+    match = re.fullmatch(r"(\d{1,2})[-/. ](\d{1,2})[-/. ](\d{4}|\d{2})", text)
+    if match:
+        return _safe_date(_expand_year(match.group(3)), int(match.group(2)), int(match.group(1)))
+    match = re.fullmatch(r"(\d{1,2})[-/. ](\d{4}|\d{2})", text)
+    if match and 1 <= int(match.group(1)) <= 12:
+        return _safe_date(_expand_year(match.group(2)), int(match.group(1)), 1)
+    match = re.fullmatch(r"(?:(\d{1,2}|1er)\s+)?(%s)\.?\s+(\d{4}|\d{2})" % _MONTH_NAMES, text)
+    if match:
+        day = 1 if match.group(1) in (None, "1er") else int(match.group(1))
+        return _safe_date(_expand_year(match.group(3)), MONTHS[match.group(2)], day)
+    if today is not None:
+        return resolve_date(text, today)
+    return None
+
+
+# Function to prepare a transcript for the model: numbers become digits and each date
+# expression is followed by its resolved value, e.g. "vendredi prochain [2024-05-17]".
+# Returns (normalized_text, dates) where dates lists the resolved date objects.
+def normalize_transcript(text, today=None):
+    text = replace_number_words(text)
+    dates = find_dates(text, today)
+    pieces = []
+    position = 0
+    for start, end, resolved in dates:
+        pieces.append(text[position:end])
+        pieces.append(f" [{resolved.isoformat()}]")
+        position = end
+    pieces.append(text[position:])
+    return "".join(pieces), [resolved for _, _, resolved in dates]
+
+
+_TITLES = r"(?:Madame|Monsieur|Mademoiselle|Mme|Mlle|M\.)"
+_PRONOUNS = {"il", "elle", "on", "nous", "vous", "ils", "elles", "ce", "cette", "tu"}
+# Words that do not belong in a product name: a buyer ("à Madame Sakho"), payment terms
+# ("à crédit") or another clause ("mais elle n'a pas payé") the patterns do not read
+_NOT_IN_NAME = {
+    "à", "a", "au", "chez", "pour", "avec", "sans", "crédit", "credit", "mais", "pas", "ne", "n",
+    "ou", "puis", "sauf", "madame", "monsieur", "mademoiselle", "mme", "mlle",
+}
+_SIMPLE_SALE = re.compile(
+    r"^(?:(?P<me>[Jj]['’]ai|[Nn]ous avons)|(?P<person>(?:%s\s+)?[A-ZÀ-Ý][\w'’-]+)\s+a)\s+"
+    r"(?P<verb>achet[ée]|vendu)\s+(?P<rest>.+)$" % _TITLES
+)
+_PAYMENT = re.compile(
+    r"[,;]?\s*(?:et\s+)?(?:(?:il|elle|je|j['’]|nous|on|ils|elles)\s*)?"
+    r"(?:paiera|payera|paieront|payeront|va payer|vais payer|allons payer|doit payer|doivent payer|réglera|reglera)\b"
+    r"(?P<when>.*)$",
+    re.IGNORECASE,
+)
+_BUYER = re.compile(r"\s+(?:à|a)\s+(?P<buyer>%s\s+[A-ZÀ-Ý][\w'’-]+)$" % _TITLES)
+_UNIT_NAMES = "|".join(sorted((re.escape(alias) for alias in UNIT_ALIASES), key=len, reverse=True))
+_ITEM_PATTERN = (
+    r"^(?P<quantity>\d+(?:,\d+)?)(?:\s*(?P<unit>%s)\b\.?\s+(?:de\s+|d['’])?|\s+)(?P<name>%s)"
+    r"(?:\s+(?P<price_word>à|a|pour)\s+(?P<price>\d[\d   .]*(?:,\d+)?)\s*%s?"
+    r"(?:\s+(?P<per>chacun|chacune|l['’]unité|la pièce|pièce|le sac|le (?:kilo|kg|litre|gramme)))?)?$"
+)
+_ITEM = re.compile(_ITEM_PATTERN % (_UNIT_NAMES, r"[^\d,]+?", CURRENCY), re.IGNORECASE)
+# Catalog names may hold digits ("huile Lesieur 1L"): only trusted when the catalog knows them
+_CATALOG_ITEM = re.compile(_ITEM_PATTERN % (_UNIT_NAMES, r"[^,]+?", CURRENCY), re.IGNORECASE)
+
+
+# Function to tell whether an item name holds only the product: no dates ("riz hier"),
+# buyers, payment terms or negations
+def _plain_name(name):
+    words = re.findall(r"\w+", name.lower())
+    return not mentions_date(name) and not _NOT_IN_NAME.intersection(words)
+
+
+# Function to read the unit price of an _ITEM match: "à 500" and "500 chacun" are per
+# item, "pour 5000" is the whole line, "600 le kilo" is per unit of measure.
+# Returns (price, understood); prices that may mean either are not understood.
+def _unit_price(item, quantity, unit):
+    if not item.group("price"):
+        return None, True
+    price = parse_digits(item.group("price").strip())
+    per = (item.group("per") or "").lower()
+    per_unit = UNIT_PRICE_WORDS.get(per[3:]) if per.startswith("le ") and per != "le sac" else None
+    if unit is not None:
+        # "250 g de sucre à 500" may be the line or the gram price: only "le kilo" is clear
+        return (price, True) if per_unit == unit else (None, False)
+    if per_unit is not None:
+        return None, False
+    if item.group("price_word").lower() == "pour" and not per and quantity:
+        price = price / quantity
+        price = int(price) if float(price).is_integer() else round(price, 2)
+    return price, True
+
+
+# Function to extract a transaction locally from a simple utterance such as
+# "Madame Sakho a acheté deux sacs de riz à cinq mille francs, elle paiera vendredi prochain."
+# Returns a result shaped like validate_transaction's, or None whenever anything in the
+# sentence is not understood so the caller can fall back to the model.
+# With `lookup_product` (a function returning the catalog name for a product name, or
+# None), items whose name the patterns reject are accepted when the catalog knows it.
+def parse_simple_transaction(text, today=None, lookup_product=None):
+    today = today or date.today()
+    sentence = replace_number_words(text.strip()).rstrip(".!").strip()
+    match = _SIMPLE_SALE.match(sentence)
+    if not match:
+        return None
+    person_name = match.group("person")
+    if person_name and (person_name.lower() in _PRONOUNS or re.fullmatch(_TITLES, person_name)):
+        # "Monsieur a acheté ...": a title alone names nobody
+        return None
+    buying = match.group("verb").lower().startswith("achet")
+    if person_name:
+        # Someone else buying means the shop sold; other third-person forms are ambiguous
+        if not buying:
+            return None
+        transaction_type = "vente"
+    else:
+        transaction_type = "achat" if buying else "vente"
+
+    rest = match.group("rest").strip()
+    payment_date = None
+    payment = _PAYMENT.search(rest)
+    if payment:
+        when = payment.group("when").strip(" ,.")
+        dates = find_dates(when, today)
+        # The whole clause must be a single date expression
+        if len(dates) != 1 or when[:dates[0][0]].strip() or when[dates[0][1]:].strip():
+            return None
+        payment_date = dates[0][2].isoformat()
+        rest = rest[:payment.start()].strip()
+
+    if person_name is None and transaction_type == "vente":
+        buyer = _BUYER.search(rest)
+        if buyer:
+            person_name = buyer.group("buyer")
+            rest = rest[:buyer.start()].strip()
+
+    products = []
+    for segment in re.split(r"\s*,\s*|\s+et\s+", rest):
+        item = _ITEM.match(segment.strip())
+        name = item.group("name").strip() if item else None
+        if not item and lookup_product is not None:
+            item = _CATALOG_ITEM.match(segment.strip())
+            name = item.group("name").strip() if item else None
+            name = lookup_product(name) if name and _plain_name(name) else None
+        if not name or not _plain_name(name):
+            return None
+        quantity = parse_digits(item.group("quantity"))
+        unit = normalize_unit(item.group("unit"))
+        price, understood = _unit_price(item, quantity, unit)
+        if not understood:
+            return None
+        products.append({
+            "product_name": name,
+            "quantity": quantity,
+            "unit": unit,
+            "price": price,
+            "transaction_type": transaction_type,
+            "payment_date": payment_date,
+        })
+    if not products:
+        return None
+    return {"person_name": person_name, "products": products}
+
@@ -0,0 +1,228 @@
+import contextvars
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, wait
+from contextlib import contextmanager
+
+from Instrumentation import metrics
+
+# End-to-end deadlines and hedged requests for model calls.
+#
+# A deadline is set once per user request (deadline_scope) and every call made
+# inside it (cascade escalations, field retries, backoff sleeps) only gets the time
+# that is left. A hedged call sends a duplicate request when the first one is slower
+# than a recent latency percentile, and returns whichever valid answer comes first.
+
+# Hedge once the first request is slower than this fraction of recent calls
+DEFAULT_HEDGE_QUANTILE = 0.95
+# Delay used until enough latencies are known, and bounds on the computed delay
+DEFAULT_INITIAL_DELAY = 4.0
+DEFAULT_MIN_DELAY = 0.5
+DEFAULT_MAX_DELAY = 30.0
+DEFAULT_MIN_SAMPLES = 20
+# At most this fraction of calls may send a duplicate (plus a small burst allowance)
+DEFAULT_MAX_HEDGE_RATE = 0.1
+HEDGE_BURST = 2
+LATENCY_SAMPLES = 500
+
+_current_deadline = contextvars.ContextVar("deadline", default=None)
+
+
+class DeadlineExceeded(TimeoutError):
+    """
+    Raised when a request's end-to-end time budget is used up.
+    """
+
+
+class Deadline:
+    """
+    An absolute point in time (monotonic clock) by which a request must be answered.
+    """
+
+    def __init__(self, seconds):
+        self.seconds = seconds
+        self.expires_at = time.monotonic() + seconds
+
+    def remaining(self):
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def check(self, what="request"):
+        if self.remaining() <= 0:
+            raise DeadlineExceeded(f"{what} did not finish within {self.seconds:g}s")
+
+
+# Function to get the deadline of the request being handled (None outside deadline_scope)
+def current_deadline():
+    return _current_deadline.get()
+
+
+# Context manager giving the calls inside it a time budget; a nested scope can only
+# shorten the enclosing one. None leaves the current deadline unchanged.
+@contextmanager
+def deadline_scope(seconds):
+    outer = _current_deadline.get()
+    if seconds is None or (outer is not None and outer.remaining() <= seconds):
+        yield outer
+        return
+    token = _current_deadline.set(Deadline(seconds))
+    try:
+        yield _current_deadline.get()
+    finally:
+        _current_deadline.reset(token)
+
+
+class Hedger:
+    """
+    Sends a duplicate request when the first one is slow, keeping the first valid answer.
+
+    The hedge delay is the `quantile` of recent successful latencies for the same key
+    (e.g. stage and model), clamped to [min_delay, max_delay]. Hedges are capped to
+    `max_hedge_rate` of calls so a slow provider does not get twice the load
+    ("capped"), and `can_hedge` may refuse one, e.g. without quota ("vetoed"). The
+    losing request cannot be aborted mid-flight with a synchronous HTTP client: its
+    answer is dropped, and its own timeout keeps it from outliving the deadline.
+
+    Each attempt gets its own thread, started at once: a shared pool would cap the
+    concurrency of every caller in the process, and time spent queued for a worker
+    would count as latency, triggering hedges and skewing the percentile.
+    """
+
+    def __init__(self, name, quantile=DEFAULT_HEDGE_QUANTILE, initial_delay=DEFAULT_INITIAL_DELAY,
+                 min_delay=DEFAULT_MIN_DELAY, max_delay=DEFAULT_MAX_DELAY, min_samples=DEFAULT_MIN_SAMPLES,
+                 max_hedge_rate=DEFAULT_MAX_HEDGE_RATE):
+        self.name = name
+        self.quantile = quantile
+        self.initial_delay = initial_delay
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.min_samples = min_samples
+        self.max_hedge_rate = max_hedge_rate
+        self._latencies = {}
+        self._lock = threading.Lock()
+        self._stats = {"calls": 0, "hedged": 0, "hedge_wins": 0, "capped": 0, "vetoed": 0, "saved_seconds": 0.0}
+        # Hedges past the rate cap whose veto is still being asked
+        self._pending_hedges = 0
+
+    def delay(self, key):
+        with self._lock:
+            samples = self._latencies.get(key)
+            if not samples or len(samples) < self.min_samples:
+                return self.initial_delay
+            ordered = sorted(samples)
+        value = ordered[min(len(ordered) - 1, int(self.quantile * len(ordered)))]
+        return min(self.max_delay, max(self.min_delay, value))
+
+    def _observe(self, key, seconds):
+        with self._lock:
+            self._latencies.setdefault(key, deque(maxlen=LATENCY_SAMPLES)).append(seconds)
+
+    def _allow_hedge(self, can_hedge=None):
+        # The rate cap is checked under the lock, the veto outside it: can_hedge may wait
+        # on a shared quota database, and every other call takes this lock too
+        with self._lock:
+            if self._stats["hedged"] + self._pending_hedges >= self.max_hedge_rate * self._stats["calls"] + HEDGE_BURST:
+                self._stats["capped"] += 1
+                return False
+            self._pending_hedges += 1
+        allowed = False
+        try:
+            allowed = can_hedge is None or can_hedge()
+        finally:
+            with self._lock:
+                self._pending_hedges -= 1
+                self._stats["hedged" if allowed else "vetoed"] += 1
+        return allowed
+
+    def _start(self, call, key):
+        # Latency is measured from inside the thread, from the moment the call starts
+        future = Future()
+
+        def attempt():
+            future.set_running_or_notify_cancel()
+            started = time.monotonic()
+            try:
+                result = call()
+            except BaseException as e:
+                future.set_exception(e)
+                return
+            self._observe(key, time.monotonic() - started)
+            future.set_result(result)
+
+        threading.Thread(target=attempt, name=f"hedge-{self.name}", daemon=True).start()
+        return future
+
+    def run(self, call, key=None, deadline=None, is_valid=None, can_hedge=None):
+        """
+        Return the result of `call()`, hedged with a second `call()` if the first is slow.
+        The first result accepted by `is_valid` wins; when no attempt gives one, a rejected
+        result is returned, or else the first error raised. Raises DeadlineExceeded when
+        `deadline` passes first. `can_hedge()` may veto a duplicate (e.g. no quota left).
+        """
+        with self._lock:
+            self._stats["calls"] += 1
+        started = time.monotonic()
+        attempts = {self._start(call, key): "primary"}
+        hedge_at = started + self.delay(key)
+        hedged = False
+        errors = []
+        rejected = []
+
+        while attempts:
+            timeout = deadline.remaining() if deadline is not None else None
+            if not hedged:
+                wait_for_hedge = max(0.0, hedge_at - time.monotonic())
+                timeout = wait_for_hedge if timeout is None else min(timeout, wait_for_hedge)
+            done, _ = wait(attempts, timeout=timeout, return_when=FIRST_COMPLETED)
+
+            for future in done:
+                label = attempts.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    errors.append(e)
+                    continue
+                if is_valid is not None and not is_valid(result):
+                    rejected.append(result)
+                    continue
+                self._finish(label, attempts)
+                return result
+
+            if deadline is not None and deadline.remaining() <= 0:
+                raise DeadlineExceeded(f"{self.name} call did not finish within {deadline.seconds:g}s")
+            if attempts and not hedged:
+                # Only the one slow attempt is hedged; an attempt that already failed is
+                # left to the caller's retries
+                hedged = True
+                if self._allow_hedge(can_hedge):
+                    attempts[self._start(call, key)] = "hedge"
+                    metrics.observe(f"{self.name}.hedge", duration_seconds=time.monotonic() - started)
+        if rejected:
+            return rejected[0]
+        raise errors[0]
+
+    def _finish(self, winner, losers):
+        won_at = time.monotonic()
+        if winner == "hedge":
+            with self._lock:
+                self._stats["hedge_wins"] += 1
+        for future in losers:
+            # Running attempts are left to finish and dropped. When the slow first
+            # request does finish, the time the hedge saved is known
+            if winner == "hedge":
+                future.add_done_callback(lambda _, won_at=won_at: self._add_saved(time.monotonic() - won_at))
+
+    def _add_saved(self, seconds):
+        with self._lock:
+            self._stats["saved_seconds"] += seconds
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            keys = list(self._latencies)
+        delays = {"/".join(map(str, key)) if isinstance(key, tuple) else str(key): self.delay(key) for key in keys}
+        calls = stats["calls"]
+        stats["hedge_rate"] = stats["hedged"] / calls if calls else None
+        stats["hedge_win_rate"] = stats["hedge_wins"] / stats["hedged"] if stats["hedged"] else None
+        stats["delays"] = delays
+        return stats
@@ -0,0 +1,187 @@
+import io
+import math
+
+# Pillow is optional (without it images are uploaded unchanged) and only imported
+# when the first image is processed, which keeps module import fast
+_pillow_modules = None
+
+
+# Function to import Pillow on first use; returns (Image, ImageOps), or Nones without Pillow
+def load_pillow():
+    global _pillow_modules
+    if _pillow_modules is None:
+        try:
+            from PIL import Image, ImageOps
+        except ImportError:  # pragma: no cover - depends on the environment
+            Image = ImageOps = None
+        _pillow_modules = (Image, ImageOps)
+    return _pillow_modules
+
+# Defaults tuned for label reading: large enough for small print on dates,
+# small enough to stay at a few hundred KB per upload
+DEFAULT_MAX_DIMENSION = 1536
+DEFAULT_JPEG_QUALITY = 85
+DEFAULT_DETAIL = "auto"
+
+# With detail="low" OpenAI works on a 512px version, so anything larger is wasted upload
+LOW_DETAIL_MAX_DIMENSION = 512
+
+# EXIF tag holding the camera orientation
+EXIF_ORIENTATION = 0x0112
+
+# Function to guess the MIME type of raw image bytes from their signature
+def detect_mime_type(image_bytes):
+    header = bytes(image_bytes[:12])
+    if header.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "image/png"
+    if header[:4] == b"RIFF" and header[8:12] == b"WEBP":
+        return "image/webp"
+    if header.startswith((b"GIF87a", b"GIF89a")):
+        return "image/gif"
+    return "image/jpeg"
+
+# Function to estimate the vision input tokens OpenAI bills for an image of the given size.
+# Follows the published tiling rule: fit in 2048x2048, shorten the short side to 768,
+# then 170 tokens per 512px tile plus 85 base tokens ("low" is a flat 85).
+def estimate_image_tokens(width, height, detail=DEFAULT_DETAIL):
+    if detail == "low":
+        return 85
+    scale = min(1.0, 2048 / max(width, height))
+    width, height = width * scale, height * scale
+    scale = min(1.0, 768 / min(width, height))
+    width, height = width * scale, height * scale
+    tiles = math.ceil(width / 512) * math.ceil(height / 512)
+    return 85 + 170 * tiles
+
+# Function to estimate the size of a base64 data URI for a payload of n bytes
+def base64_size(n_bytes):
+    return 4 * math.ceil(n_bytes / 3)
+
+# Function to shrink and re-encode an image before it is base64-encoded for the API.
+# - Applies the EXIF orientation so rotated phone pictures are read upright
+# - Optionally crops to a label region given as fractions (left, top, right, bottom)
+# - Downscales so the longest side is at most max_dimension and re-encodes as JPEG
+# Returns (image_bytes, mime_type, report) where report holds sizes and token estimates
+# before and after, so the speed/accuracy tradeoff can be tuned.
+# With `thumbnail_size` set, report["thumbnail"] also gets a small JPEG made from the
+# already decoded and downscaled image, so callers do not decode the upload twice.
+def preprocess_image(image_bytes, max_dimension=DEFAULT_MAX_DIMENSION, jpeg_quality=DEFAULT_JPEG_QUALITY,
+                     detail=DEFAULT_DETAIL, crop_box=None, thumbnail_size=None):
+    original_bytes = image_bytes if isinstance(image_bytes, bytes) else bytes(image_bytes)
+    original_mime = detect_mime_type(original_bytes)
+    report = {
+        "detail": detail,
+        "original_bytes": len(original_bytes),
+        "original_size": None,
+        "original_tokens": None,
+        "processed_bytes": len(original_bytes),
+        "processed_size": None,
+        "processed_tokens": None,
+        "preprocessed": False,
+        "thumbnail": None,
+    }
+
+    Image, ImageOps = load_pillow()
+    if Image is None:
+        return original_bytes, original_mime, report
+
+    try:
+        image = Image.open(io.BytesIO(original_bytes))
+        image.load()
+    except Exception:
+        # Unreadable by Pillow: let the model try the original bytes
+        return original_bytes, original_mime, report
+
+    report["original_size"] = image.size
+    report["original_tokens"] = estimate_image_tokens(*image.size, detail=detail)
+
+    # exif_transpose always returns a copy, so whether the image was rotated is read
+    # from the Orientation tag (1 = upright)
+    changed = image.getexif().get(EXIF_ORIENTATION, 1) != 1
+    if changed:
+        image = ImageOps.exif_transpose(image)
+
+    if crop_box is not None:
+        left, top, right, bottom = crop_box
+        width, height = image.size
+        image = image.crop((
+            int(left * width), int(top * height),
+            int(math.ceil(right * width)), int(math.ceil(bottom * height)),
+        ))
+        changed = True
+
+    if detail == "low":
+        max_dimension = min(max_dimension or LOW_DETAIL_MAX_DIMENSION, LOW_DETAIL_MAX_DIMENSION)
+    if max_dimension and max(image.size) > max_dimension:
+        image.thumbnail((max_dimension, max_dimension), Image.LANCZOS)
+        changed = True
+
+    if image.mode != "RGB":
+        # JPEG has no alpha channel: flatten transparent PNGs onto white
+        if image.mode in ("RGBA", "LA") or (image.mode == "P" and "transparency" in image.info):
+            rgba = image.convert("RGBA")
+            background = Image.new("RGB", rgba.size, (255, 255, 255))
+            background.paste(rgba, mask=rgba.split()[-1])
+            image = background
+        else:
+            image = image.convert("RGB")
+
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG", quality=jpeg_quality, optimize=True)
+    processed = buffer.getvalue()
+
+    # An untouched JPEG that is already smaller than its re-encoding is sent as is
+    if not changed and original_mime == "image/jpeg" and len(original_bytes) <= len(processed):
+        processed = original_bytes
+
+    report["processed_bytes"] = len(processed)
+    report["processed_size"] = image.size
+    report["processed_tokens"] = estimate_image_tokens(*image.size, detail=detail)
+    report["preprocessed"] = processed is not original_bytes
+    if thumbnail_size:
+        thumbnail = image.copy()
+        thumbnail.thumbnail((thumbnail_size, thumbnail_size))
+        buffer = io.BytesIO()
+        thumbnail.save(buffer, format="JPEG", quality=70, optimize=True)
+        report["thumbnail"] = buffer.getvalue()
+    return processed, ("image/jpeg" if report["preprocessed"] else original_mime), report
+
+# Function to format a preprocessing report as a one-line summary
+def format_preprocess_report(report):
+    line = (
+        f"Upload {report['original_bytes'] / 1024:.0f} KB → {report['processed_bytes'] / 1024:.0f} KB"
+        f" (base64 {base64_size(report['processed_bytes']) / 1024:.0f} KB)"
+    )
+    if report["original_tokens"] is not None:
+        line += f", ~{report['original_tokens']} → ~{report['processed_tokens']} image tokens"
+    return line + f", detail={report['detail']}"
+
+# Function to decode an image for previews (thumbnail, perceptual hash): JPEGs are
+# decoded at a reduced scale of at least `size` px, and the EXIF orientation is applied.
+# Returns a PIL image, or None without Pillow or for unreadable bytes.
+def open_preview(image_bytes, size=240):
+    Image, ImageOps = load_pillow()
+    if Image is None:
+        return None
+    try:
+        image = Image.open(io.BytesIO(image_bytes))
+        image.draft("RGB", (size, size))
+        return ImageOps.exif_transpose(image)
+    except Exception:
+        return None
+
+# Function to build a small JPEG thumbnail (for chat history) or None without Pillow.
+# `image` is raw bytes or an image already decoded by open_preview.
+def make_thumbnail(image, size=240, jpeg_quality=70):
+    if not hasattr(image, "thumbnail"):
+        image = open_preview(image, size)
+    if image is None:
+        return None
+    try:
+        image = image.copy()
+        image.thumbnail((size, size))
+        buffer = io.BytesIO()
+        image.convert("RGB").save(buffer, format="JPEG", quality=jpeg_quality, optimize=True)
+        return buffer.getvalue()
+    except Exception:
+        return None
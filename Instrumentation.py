@@ -0,0 +1,160 @@
+import bisect
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+# Bucket upper bounds per measured field (Prometheus-style cumulative histograms)
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+BYTES_BUCKETS = (1e3, 1e4, 5e4, 1e5, 2.5e5, 5e5, 1e6, 2.5e6, 5e6, 1e7)
+TOKEN_BUCKETS = (10, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 25000)
+RETRY_BUCKETS = (0, 1, 2, 3, 5, 10)
+
+FIELD_BUCKETS = {
+    "duration_seconds": DURATION_BUCKETS,
+    "payload_bytes": BYTES_BUCKETS,
+    "prompt_tokens": TOKEN_BUCKETS,
+    "completion_tokens": TOKEN_BUCKETS,
+    "cached_tokens": TOKEN_BUCKETS,
+    "retries": RETRY_BUCKETS,
+}
+
+# Recent samples kept per histogram for percentile estimates in the debug panel
+RECENT_SAMPLES = 1024
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.recent = deque(maxlen=RECENT_SAMPLES)
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.recent.append(value)
+
+    def quantile(self, q):
+        if not self.recent:
+            return None
+        ordered = sorted(self.recent)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class Metrics:
+    """
+    Per-stage histograms of wall time, payload bytes, tokens and retries.
+
+    Stages are recorded with the `stage()` context manager; every observation can
+    also be appended to a JSON-lines log, and the whole registry rendered in the
+    Prometheus text format.
+    """
+
+    def __init__(self, log_path=None):
+        self.log_path = log_path
+        self._histograms = {}
+        self._errors = {}
+        self._lock = threading.Lock()
+        self._log_lock = threading.Lock()
+
+    def observe(self, stage, error=False, **values):
+        with self._lock:
+            if error:
+                self._errors[stage] = self._errors.get(stage, 0) + 1
+            for field, value in values.items():
+                if value is None or field not in FIELD_BUCKETS:
+                    continue
+                key = (stage, field)
+                if key not in self._histograms:
+                    self._histograms[key] = Histogram(FIELD_BUCKETS[field])
+                self._histograms[key].observe(value)
+        if self.log_path:
+            record = {"ts": round(time.time(), 3), "stage": stage, "error": error}
+            record.update({k: v for k, v in values.items() if v is not None})
+            with self._log_lock, open(self.log_path, "a", encoding="utf-8") as log:
+                log.write(json.dumps(record) + "\n")
+
+    @contextmanager
+    def stage(self, name):
+        """
+        Time a block; the yielded dict takes extra fields (payload_bytes, prompt_tokens, ...).
+        """
+        span = {}
+        start = time.perf_counter()
+        error = False
+        try:
+            yield span
+        except BaseException:
+            error = True
+            raise
+        finally:
+            span["duration_seconds"] = time.perf_counter() - start
+            self.observe(name, error=error, **span)
+
+    def snapshot(self):
+        """
+        Summary per stage and field: count, sum, mean and recent p50/p95/p99.
+        """
+        with self._lock:
+            summary = {}
+            for (stage, field), histogram in sorted(self._histograms.items()):
+                summary.setdefault(stage, {})[field] = {
+                    "count": histogram.count,
+                    "sum": histogram.sum,
+                    "mean": histogram.sum / histogram.count if histogram.count else None,
+                    "p50": histogram.quantile(0.50),
+                    "p95": histogram.quantile(0.95),
+                    "p99": histogram.quantile(0.99),
+                }
+            for stage, errors in self._errors.items():
+                summary.setdefault(stage, {})["errors"] = errors
+            return summary
+
+    def render_prometheus(self, prefix="proboutik"):
+        lines = []
+        with self._lock:
+            for field in FIELD_BUCKETS:
+                name = f"{prefix}_stage_{field}"
+                series = [(stage, h) for (stage, f), h in sorted(self._histograms.items()) if f == field]
+                if not series:
+                    continue
+                lines.append(f"# TYPE {name} histogram")
+                for stage, histogram in series:
+                    cumulative = 0
+                    for bound, count in zip(histogram.buckets, histogram.counts):
+                        cumulative += count
+                        lines.append(f'{name}_bucket{{stage="{stage}",le="{bound:g}"}} {cumulative}')
+                    lines.append(f'{name}_bucket{{stage="{stage}",le="+Inf"}} {histogram.count}')
+                    lines.append(f'{name}_sum{{stage="{stage}"}} {histogram.sum:g}')
+                    lines.append(f'{name}_count{{stage="{stage}"}} {histogram.count}')
+            if self._errors:
+                lines.append(f"# TYPE {prefix}_stage_errors_total counter")
+                for stage, errors in sorted(self._errors.items()):
+                    lines.append(f'{prefix}_stage_errors_total{{stage="{stage}"}} {errors}')
+        return "\n".join(lines) + "\n"
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+            self._errors.clear()
+
+
+# Function to copy token usage from an OpenAI response into a stage span
+def record_usage(span, response):
+    usage = getattr(response, "usage", None)
+    if usage is None:
+        return
+    span["prompt_tokens"] = getattr(usage, "prompt_tokens", None)
+    span["completion_tokens"] = getattr(usage, "completion_tokens", None)
+    details = getattr(usage, "prompt_tokens_details", None)
+    if details is not None:
+        span["cached_tokens"] = getattr(details, "cached_tokens", None)
+
+
+# Process-wide registry; set METRICS_LOG to also write every observation as JSON lines
+metrics = Metrics(log_path=os.environ.get("METRICS_LOG"))
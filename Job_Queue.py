@@ -0,0 +1,115 @@
+import queue
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+
+class QueueFullError(Exception):
+    """
+    Raised by JobQueue.submit when the backlog is at capacity.
+    """
+
+
+class JobQueue:
+    """
+    Bounded in-process job queue served by a fixed pool of worker threads.
+
+    submit() never blocks: when `max_pending` jobs are already waiting it raises
+    QueueFullError so callers can push back (HTTP 429). Finished jobs are kept for
+    polling until `result_ttl` seconds have passed or `max_finished` is reached.
+    """
+
+    def __init__(self, workers=4, max_pending=32, result_ttl=3600, max_finished=1000):
+        self.workers = workers
+        self.result_ttl = result_ttl
+        self.max_finished = max_finished
+        self._pending = queue.Queue(maxsize=max_pending)
+        self._jobs = {}
+        self._finished = OrderedDict()
+        self._lock = threading.Lock()
+        self._threads = []
+        self._stopping = False
+        for index in range(workers):
+            thread = threading.Thread(target=self._work, name=f"job-worker-{index}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def submit(self, kind, func, *args, **kwargs):
+        job = {
+            "id": uuid.uuid4().hex,
+            "kind": kind,
+            "status": "queued",
+            "result": None,
+            "error": None,
+            "created_at": time.time(),
+            "started_at": None,
+            "finished_at": None,
+        }
+        with self._lock:
+            self._jobs[job["id"]] = job
+        try:
+            self._pending.put_nowait((job, func, args, kwargs))
+        except queue.Full:
+            with self._lock:
+                del self._jobs[job["id"]]
+            raise QueueFullError(f"{self._pending.maxsize} jobs already waiting")
+        return job["id"]
+
+    def get(self, job_id):
+        with self._lock:
+            self._expire()
+            job = self._jobs.get(job_id)
+            return dict(job) if job is not None else None
+
+    def stats(self):
+        with self._lock:
+            self._expire()
+            statuses = [job["status"] for job in self._jobs.values()]
+        return {
+            "workers": self.workers,
+            "queued": statuses.count("queued"),
+            "running": statuses.count("running"),
+            "finished": len(self._finished),
+            "capacity": self._pending.maxsize,
+        }
+
+    def _expire(self):
+        # Called with the lock held: forget old results so polling memory stays bounded
+        now = time.time()
+        while self._finished:
+            job_id, finished_at = next(iter(self._finished.items()))
+            if len(self._finished) <= self.max_finished and now - finished_at <= self.result_ttl:
+                break
+            self._finished.popitem(last=False)
+            self._jobs.pop(job_id, None)
+
+    def _work(self):
+        while True:
+            item = self._pending.get()
+            if item is None:
+                break
+            job, func, args, kwargs = item
+            with self._lock:
+                job["status"] = "running"
+                job["started_at"] = time.time()
+            try:
+                result = func(*args, **kwargs)
+                status, error = "done", None
+            except Exception as e:
+                result, status, error = None, "failed", str(e)
+            with self._lock:
+                job["result"] = result
+                job["error"] = error
+                job["status"] = status
+                job["finished_at"] = time.time()
+                self._finished[job["id"]] = job["finished_at"]
+                self._expire()
+            self._pending.task_done()
+
+    def shutdown(self):
+        # Workers finish the jobs already queued, then exit
+        for _ in self._threads:
+            self._pending.put(None)
+        for thread in self._threads:
+            thread.join()
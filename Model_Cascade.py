@@ -0,0 +1,107 @@
+import threading
+import time
+
+from French_Normalization import mentions_numbers
+from Hedged_Requests import DeadlineExceeded
+from Instrumentation import metrics
+
+
+class ModelCascade:
+    """
+    Tries models from cheapest to most capable and stops at the first result that
+    passes `accept(result, failed_fields, context)`; only rejected results escalate.
+
+    Per model it keeps call counts, accepted/escalated counts and latency; wall time
+    is also recorded under the "<name>.route.<model>" metrics stage. When the request
+    deadline runs out during an escalation, the cheaper model's answer is kept.
+    """
+
+    def __init__(self, name, models, accept):
+        self.name = name
+        self.models = tuple(models)
+        self.accept = accept
+        self._lock = threading.Lock()
+        self._stats = {
+            model: {"calls": 0, "accepted": 0, "escalated": 0, "timed_out": 0, "seconds": 0.0} for model in self.models
+        }
+
+    @property
+    def signature(self):
+        # Part of result-cache keys: a different cascade can give different answers
+        return ">".join(self.models)
+
+    def run(self, call, context=None):
+        """
+        `call(model, is_last)` returns (result, failed_fields); the last result is
+        returned even when it is rejected.
+        """
+        result = None
+        for index, model in enumerate(self.models):
+            is_last = index == len(self.models) - 1
+            start = time.perf_counter()
+            try:
+                with metrics.stage(f"{self.name}.route.{model}"):
+                    result, failed_fields = call(model, is_last)
+            except DeadlineExceeded:
+                with self._lock:
+                    self._stats[model]["timed_out"] += 1
+                if result is None:
+                    raise
+                break
+            elapsed = time.perf_counter() - start
+            accepted, _ = self.accept(result, failed_fields, context)
+            with self._lock:
+                stats = self._stats[model]
+                stats["calls"] += 1
+                stats["seconds"] += elapsed
+                if accepted:
+                    stats["accepted"] += 1
+                elif not is_last:
+                    stats["escalated"] += 1
+            if accepted:
+                break
+        return result
+
+    def stats(self):
+        with self._lock:
+            summary = {}
+            for model, stats in self._stats.items():
+                calls = stats["calls"]
+                summary[model] = {
+                    "calls": calls,
+                    "accepted": stats["accepted"],
+                    "escalated": stats["escalated"],
+                    "timed_out": stats["timed_out"],
+                    "hit_rate": stats["accepted"] / calls if calls else None,
+                    "mean_seconds": stats["seconds"] / calls if calls else None,
+                }
+            return summary
+
+
+# Function to judge a transcript extraction from a fast model.
+# Rejects schema failures, products without a name, and answers that found nothing
+# (or no quantity/price at all) although the transcript clearly contains numbers.
+def accept_transaction(result, failed_fields, text):
+    if failed_fields:
+        return False, "schema"
+    products = result.get("products") or []
+    has_numbers = mentions_numbers(text)
+    if not products:
+        return (False, "empty") if has_numbers else (True, "ok")
+    if any(not product.get("product_name") for product in products):
+        return False, "unnamed product"
+    if has_numbers and all(
+        product.get("quantity") is None and product.get("price") is None for product in products
+    ):
+        return False, "numbers ignored"
+    return True, "ok"
+
+
+# Function to judge an image extraction from a fast model: schema failures or a reply
+# with neither a product name nor a company escalate to the larger model.
+def accept_image_product(result, failed_fields, context=None):
+    if failed_fields:
+        return False, "schema"
+    if not result.get("product_name") and not result.get("company"):
+        return False, "nothing identified"
+    return True, "ok"
@@ -0,0 +1,143 @@
+import io
+import threading
+from collections import OrderedDict
+
+from Image_Preprocessing import load_pillow
+
+# Near-duplicate detection for repeated captures of the same packaging: each image gets
+# a 64-bit difference hash, and recent hashes are kept in a BK-tree so captures within a
+# small Hamming distance of an earlier one can reuse its extraction result.
+
+# Hash bits that may differ for two captures to count as the same product shot (of 64)
+DEFAULT_MAX_DISTANCE = 8
+DEFAULT_MAX_ENTRIES = 200
+
+
+# Function to compute the difference hash (dHash) of an image: the grayscale image is
+# shrunk to 9x8 pixels and each bit says whether a pixel is brighter than its right
+# neighbour. Small reframing, rescaling or recompression barely changes it.
+# `image` is raw bytes or an image already decoded (e.g. by Image_Preprocessing.open_preview).
+# Returns an int, or None without Pillow or for unreadable bytes.
+def perceptual_hash(image, hash_size=8):
+    Image, ImageOps = load_pillow()
+    if Image is None or image is None:
+        return None
+    try:
+        if not hasattr(image, "convert"):
+            image = Image.open(io.BytesIO(image))
+            # JPEG decoding at reduced scale is much faster than decoding the full capture
+            image.draft("L", (hash_size * 16, hash_size * 16))
+            image = ImageOps.exif_transpose(image)
+        image = image.convert("L").resize((hash_size + 1, hash_size), Image.BILINEAR)
+    except Exception:
+        return None
+    pixels = list(image.getdata())
+    value = 0
+    for row in range(hash_size):
+        for column in range(hash_size):
+            offset = row * (hash_size + 1) + column
+            value = (value << 1) | (pixels[offset] > pixels[offset + 1])
+    return value
+
+
+# Function to count the differing bits of two hashes
+def hamming_distance(a, b):
+    return bin(a ^ b).count("1")
+
+
+class BKTree:
+    """
+    Burkhard-Keller tree over hashes with the Hamming distance: a radius query only
+    visits children whose edge distance is within the radius of the query's distance
+    to their parent (triangle inequality), instead of every stored hash.
+    """
+
+    def __init__(self):
+        self._root = None
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def add(self, key, value):
+        node = [key, value, {}]
+        self._size += 1
+        if self._root is None:
+            self._root = node
+            return
+        current = self._root
+        while True:
+            distance = hamming_distance(key, current[0])
+            child = current[2].get(distance)
+            if child is None:
+                current[2][distance] = node
+                return
+            current = child
+
+    def search(self, key, max_distance):
+        """
+        Return (distance, key, value) for every stored key within max_distance, closest first.
+        """
+        found = []
+        pending = [self._root] if self._root is not None else []
+        while pending:
+            node = pending.pop()
+            distance = hamming_distance(key, node[0])
+            if distance <= max_distance:
+                found.append((distance, node[0], node[1]))
+            for edge, child in node[2].items():
+                if distance - max_distance <= edge <= distance + max_distance:
+                    pending.append(child)
+        found.sort(key=lambda item: item[0])
+        return found
+
+
+class NearDuplicateIndex:
+    """
+    The most recent `max_entries` image hashes with a value each (e.g. the extraction
+    result). BK-trees cannot delete, so the tree is rebuilt from the live entries once
+    evicted ones make up half of it.
+    """
+
+    def __init__(self, max_distance=DEFAULT_MAX_DISTANCE, max_entries=DEFAULT_MAX_ENTRIES):
+        self.max_distance = max_distance
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._tree = BKTree()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def find(self, image_hash):
+        """
+        Return (distance, value) of the closest recent image within max_distance, or None.
+        """
+        if image_hash is None:
+            return None
+        with self._lock:
+            for distance, key, _ in self._tree.search(image_hash, self.max_distance):
+                # Entries evicted since the last rebuild are still in the tree
+                if key in self._entries:
+                    self.hits += 1
+                    self._entries.move_to_end(key)
+                    return distance, self._entries[key]
+            self.misses += 1
+            return None
+
+    def add(self, image_hash, value):
+        if image_hash is None:
+            return
+        with self._lock:
+            if image_hash not in self._entries:
+                self._tree.add(image_hash, None)
+            self._entries[image_hash] = value
+            self._entries.move_to_end(image_hash)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            if len(self._tree) >= 2 * max(len(self._entries), 1):
+                self._tree = BKTree()
+                for key in self._entries:
+                    self._tree.add(key, None)
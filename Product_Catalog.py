@@ -0,0 +1,334 @@
+import csv
+import hashlib
+import math
+import re
+import threading
+import unicodedata
+from array import array
+from collections import Counter, namedtuple
+from itertools import islice
+
+from Api_Clients import get_setting
+
+# Product catalog with a trigram index for fuzzy lookups of extracted names.
+# The catalog is a CSV file with a "name" column and optional "company", "sku" and
+# "aliases" ("|"-separated) columns; set PRODUCT_CATALOG to its path to enable it.
+
+CatalogEntry = namedtuple("CatalogEntry", ["sku", "name", "company"])
+
+# Scores are Dice coefficients over character trigrams (1.0 = same normalized text)
+DEFAULT_MIN_SCORE = 0.5
+# Words per window when looking for catalog products inside a longer text
+MAX_MENTION_WORDS = 4
+# Posting entries a lookup may count beyond the minimum needed; more counting means
+# fewer candidates to verify one by one
+SCAN_BUDGET = 20000
+# Single-result lookups first try the names sharing the query's rarest whole words,
+# verifying at most WORD_VERIFY_LIMIT of them
+WORD_LISTS = 2
+WORD_LIST_MAX = 1000
+WORD_VERIFY_LIMIT = 150
+# Single-result lookups give up when even the rarest trigrams of the query are shared by
+# this many posting entries, instead of verifying every name they contain, and count
+# at most BEST_MATCH_SCAN_BUDGET entries
+BEST_MATCH_SCAN_LIMIT = 3000
+BEST_MATCH_SCAN_BUDGET = 6000
+
+_catalog = None
+_catalog_lock = threading.Lock()
+
+
+# Function to normalize a name for matching: no accents, lowercase, single spaces
+def normalize_name(text):
+    text = unicodedata.normalize("NFKD", str(text))
+    text = "".join(char for char in text if not unicodedata.combining(char)).lower()
+    return " ".join(re.findall(r"[a-z0-9]+", text))
+
+
+def _trigrams(normalized):
+    padded = f" {normalized} "
+    return {padded[index:index + 3] for index in range(len(padded) - 2)}
+
+
+class ProductCatalog:
+    """
+    In-memory catalog with a compact trigram index.
+
+    Each name or alias is stored as a sorted run of trigram ids in one flat array,
+    and every trigram has a posting list of the names containing it. A lookup only
+    counts the posting lists of the query's rarest trigrams (enough to find every
+    name that can reach `min_score`), then scores the candidates that were counted
+    often enough. Exact names are answered from a dictionary, and best_match only
+    considers the few names sharing the query's rarest words when there are such
+    words, which trades exhaustiveness for speed; search() with limit > 1 is exact.
+    """
+
+    def __init__(self):
+        self.entries = []
+        self._vocabulary = {}
+        self._postings = []
+        self._key_entries = array("I")
+        self._key_trigrams = array("I")
+        self._key_offsets = array("I", [0])
+        self._exact = {}
+        self._words = {}
+        self._word_postings = []
+        self._word_trigrams = {}
+        self._word_sizes = array("I")
+        self._signature = None
+
+    def __len__(self):
+        return len(self.entries)
+
+    @property
+    def signature(self):
+        # Part of result-cache keys: results are canonicalized against this content
+        if self._signature is None:
+            digest = hashlib.sha256()
+            for entry in self.entries:
+                digest.update(f"{entry.sku}\x00{entry.name}\x00{entry.company}\x01".encode("utf-8"))
+            digest.update(str(len(self._key_entries)).encode("ascii"))
+            self._signature = digest.hexdigest()[:16]
+        return self._signature
+
+    def add(self, name, company=None, sku=None, aliases=()):
+        """
+        Add a product; its aliases resolve to the same entry. Returns the entry.
+        """
+        entry = CatalogEntry(sku, name, company)
+        self.entries.append(entry)
+        self._signature = None
+        for key in (name, *aliases):
+            normalized = normalize_name(key)
+            if not normalized:
+                continue
+            key_id = len(self._key_entries)
+            self._key_entries.append(len(self.entries) - 1)
+            self._exact.setdefault(normalized, len(self.entries) - 1)
+            for word in set(normalized.split()):
+                word_id = self._words.setdefault(word, len(self._words))
+                if word_id == len(self._word_postings):
+                    self._word_postings.append(array("I"))
+                    self._word_sizes.append(len(_trigrams(word)))
+                    for trigram in _trigrams(word):
+                        self._word_trigrams.setdefault(trigram, array("I")).append(word_id)
+                self._word_postings[word_id].append(key_id)
+            for trigram in sorted(_trigrams(normalized)):
+                trigram_id = self._vocabulary.setdefault(trigram, len(self._vocabulary))
+                if trigram_id == len(self._postings):
+                    self._postings.append(array("I"))
+                self._postings[trigram_id].append(key_id)
+                self._key_trigrams.append(trigram_id)
+            self._key_offsets.append(len(self._key_trigrams))
+        return entry
+
+    @classmethod
+    def from_csv(cls, path):
+        catalog = cls()
+        with open(path, newline="", encoding="utf-8-sig") as f:
+            for row in csv.DictReader(f):
+                name = (row.get("name") or "").strip()
+                if not name:
+                    continue
+                aliases = [alias.strip() for alias in (row.get("aliases") or "").split("|") if alias.strip()]
+                catalog.add(
+                    name,
+                    company=(row.get("company") or "").strip() or None,
+                    sku=(row.get("sku") or "").strip() or None,
+                    aliases=aliases,
+                )
+        return catalog
+
+    def search(self, query, limit=5, min_score=DEFAULT_MIN_SCORE):
+        """
+        Return up to `limit` (score, entry) pairs with score >= min_score, best first.
+        """
+        normalized = normalize_name(query)
+        if limit == 1 and normalized in self._exact:
+            return [(1.0, self.entries[self._exact[normalized]])]
+        query_trigrams = _trigrams(normalized)
+        size = len(query_trigrams)
+        if size == 0 or not self._key_entries:
+            return []
+        known = [self._vocabulary[t] for t in query_trigrams if t in self._vocabulary]
+        if limit == 1:
+            # Most words of a misspelled name are usually intact (or close to a known word):
+            # when they are rare enough, the names sharing them are the only candidates
+            matches = self._search_by_words(normalized, set(known), size, min_score)
+            if matches is not None:
+                return matches
+        # A name reaching min_score shares at least `needed` trigrams with the query, so it
+        # must appear in the posting list of one of the (size - needed + 1) rarest trigrams
+        needed = max(1, math.ceil(min_score * size / (2 - min_score)))
+        scanned = size - needed + 1 - (size - len(known))
+        if scanned <= 0:
+            return []
+        known.sort(key=lambda trigram_id: len(self._postings[trigram_id]))
+        # Count further lists while it is cheap: each one raises the count a candidate
+        # needs before it is worth verifying
+        total = sum(len(self._postings[trigram_id]) for trigram_id in known[:scanned])
+        if limit == 1 and total > BEST_MATCH_SCAN_LIMIT:
+            # Only common trigrams left (no rare word survived the misspelling): verifying
+            # the thousands of names they share costs tens of ms for a rare, weak match
+            return []
+        budget = BEST_MATCH_SCAN_BUDGET if limit == 1 else SCAN_BUDGET
+        while scanned < len(known) and total + len(self._postings[known[scanned]]) <= budget:
+            total += len(self._postings[known[scanned]])
+            scanned += 1
+        counts = Counter()
+        for trigram_id in known[:scanned]:
+            counts.update(self._postings[trigram_id])
+        threshold = needed - (len(known) - scanned)
+        return self._score(counts, threshold, len(known) > scanned, set(known), size, limit, min_score)
+
+    def _search_by_words(self, normalized, query_ids, size, min_score):
+        # One list of name ids per query word: the names containing it, or for an unknown
+        # (misspelled) word, the names containing one of its closest known words
+        words = set(normalized.split())
+        lists = [self._word_postings[self._words[word]] for word in words if word in self._words]
+        if sum(len(postings) <= WORD_LIST_MAX for postings in lists) < WORD_LISTS:
+            for word in words:
+                if word not in self._words and len(word) >= 3:
+                    similar = [self._word_postings[word_id] for word_id in self._similar_words(word)]
+                    # Lists too long to be counted are not worth building
+                    if similar and sum(map(len, similar)) <= WORD_LIST_MAX:
+                        lists.append(array("I", [key_id for postings in similar for key_id in postings]))
+        lists = sorted(lists, key=len)[:WORD_LISTS]
+        if not lists or len(lists[0]) > WORD_LIST_MAX:
+            # No selective word: the caller falls back to the full trigram search
+            return None
+        counts = Counter()
+        for postings in lists:
+            if len(postings) <= WORD_LIST_MAX:
+                counts.update(postings)
+        # Names found through the most lists are verified first, names missing more of the
+        # query's rare words only when none of those matches; at most WORD_VERIFY_LIMIT
+        # names in all, those from the rarest word first
+        groups = [{} for _ in range(len(lists) + 1)]
+        for key_id, count in counts.items():
+            groups[count][key_id] = count
+        budget = WORD_VERIFY_LIMIT
+        for group in reversed(groups[1:]):
+            if len(group) > budget:
+                group = dict(islice(group.items(), budget))
+            budget -= len(group)
+            matches = self._score(group, 1, True, query_ids, size, 1, min_score)
+            if matches or budget <= 0:
+                return matches
+        return []
+
+    def _similar_words(self, word, min_score=0.45, limit=3):
+        trigrams = _trigrams(word)
+        counts = Counter()
+        for trigram in trigrams:
+            counts.update(self._word_trigrams.get(trigram, ()))
+        scored = []
+        for word_id, overlap in counts.items():
+            score = 2 * overlap / (len(trigrams) + self._word_sizes[word_id])
+            if score >= min_score:
+                scored.append((score, word_id))
+        return [word_id for _, word_id in sorted(scored, reverse=True)[:limit]]
+
+    def _score(self, counts, threshold, verify, query_ids, size, limit, min_score):
+        # Names much longer or shorter than the query cannot reach min_score
+        max_length = size * (2 - min_score) / min_score
+        min_length = size * min_score / (2 - min_score)
+        offsets = self._key_offsets
+        key_trigrams = self._key_trigrams
+        shared = query_ids.intersection
+        best = {}
+        for key_id, count in counts.items():
+            if count < threshold:
+                continue
+            start, end = offsets[key_id], offsets[key_id + 1]
+            length = end - start
+            if length > max_length or length < min_length:
+                continue
+            overlap = len(shared(key_trigrams[start:end])) if verify else count
+            score = 2 * overlap / (size + length)
+            if score >= min_score:
+                entry_id = self._key_entries[key_id]
+                if score > best.get(entry_id, 0):
+                    best[entry_id] = score
+        ranked = sorted(best.items(), key=lambda item: -item[1])[:limit]
+        return [(score, self.entries[entry_id]) for entry_id, score in ranked]
+
+    def best_match(self, query, min_score=0.8):
+        """
+        Return (score, entry) for the closest product, or None below min_score.
+        """
+        matches = self.search(query, limit=1, min_score=min_score)
+        return matches[0] if matches else None
+
+    def find_mentions(self, text, min_score=0.85, max_words=MAX_MENTION_WORDS):
+        """
+        Find catalog products named inside a longer text (transcript, label text).
+        Returns (score, entry, words) tuples, longest and best matches first, without overlaps.
+        """
+        words = normalize_name(text).split()
+        found = []
+        used = set()
+        for length in range(min(max_words, len(words)), 0, -1):
+            for start in range(len(words) - length + 1):
+                span = set(range(start, start + length))
+                if span & used:
+                    continue
+                window = " ".join(words[start:start + length])
+                match = self.best_match(window, min_score=min_score)
+                if match:
+                    used |= span
+                    found.append((match[0], match[1], window))
+        return found
+
+
+# Function to get the shared catalog, loaded from PRODUCT_CATALOG on first use (None when unset)
+def get_catalog():
+    global _catalog
+    if _catalog is None:
+        with _catalog_lock:
+            if _catalog is None:
+                path = get_setting("PRODUCT_CATALOG")
+                _catalog = ProductCatalog.from_csv(path) if path else False
+    return _catalog or None
+
+
+# Function to install a catalog (or None to disable matching) in place of PRODUCT_CATALOG
+def set_catalog(catalog):
+    global _catalog
+    with _catalog_lock:
+        _catalog = catalog if catalog is not None else False
+
+
+# Function to find the catalog product behind an extracted name: the whole name first,
+# then a single product named inside it ("2 sacs de riz parfume" -> "Riz parfumé 5kg")
+def match_product(catalog, name, min_score=0.8):
+    match = catalog.best_match(name, min_score=min_score)
+    if match:
+        return match[1]
+    mentions = catalog.find_mentions(name, min_score=max(min_score, 0.85))
+    if len({entry for _, entry, _ in mentions}) == 1:
+        return mentions[0][1]
+    return None
+
+
+# Function to replace extracted product names in a transaction result by their catalog
+# names; products that match nothing keep the extracted text
+def canonicalize_transaction(result, catalog, min_score=0.8):
+    for product in result.get("products", []):
+        if product.get("product_name"):
+            entry = match_product(catalog, product["product_name"], min_score)
+            if entry:
+                product["product_name"] = entry.name
+    return result
+
+
+# Function to canonicalize an image extraction: the catalog name replaces the extracted
+# one and supplies the company when the label did not show it
+def canonicalize_image_product(product_info, catalog, min_score=0.8):
+    if product_info.get("product_name"):
+        entry = match_product(catalog, product_info["product_name"], min_score)
+        if entry:
+            product_info["product_name"] = entry.name
+            if entry.company and not product_info.get("company"):
+                product_info["company"] = entry.company
+    return product_info
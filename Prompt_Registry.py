@@ -0,0 +1,291 @@
+import hashlib
+import math
+import re
+
+# Providers only cache prompt prefixes from this many tokens on
+PROMPT_CACHE_MIN_TOKENS = 1024
+
+_encodings = {}
+_tiktoken = None
+
+
+# Function to import tiktoken on first use (None when it is missing)
+def load_tiktoken():
+    global _tiktoken
+    if _tiktoken is None:
+        try:
+            import tiktoken
+        except ImportError:  # optional: token counts fall back to an estimate from the byte length
+            tiktoken = False
+        _tiktoken = tiktoken
+    return _tiktoken or None
+
+
+# Function to count the tokens of a text for a model (estimated when tiktoken is missing)
+def count_tokens(text, model="gpt-4o"):
+    tiktoken = load_tiktoken()
+    if tiktoken is None:
+        return math.ceil(len(text.encode("utf-8")) / 4)
+    if model not in _encodings:
+        try:
+            _encodings[model] = tiktoken.encoding_for_model(model)
+        except KeyError:
+            _encodings[model] = tiktoken.get_encoding("o200k_base")
+    return len(_encodings[model].encode(text))
+
+
+# Function to cut a text down to a token budget, keeping its beginning
+def truncate_to_tokens(text, budget, model="gpt-4o"):
+    if budget <= 0:
+        return ""
+    if count_tokens(text, model) <= budget:
+        return text
+    low, high = 0, len(text)
+    while low < high:
+        middle = (low + high + 1) // 2
+        if count_tokens(text[:middle] + "…", model) <= budget:
+            low = middle
+        else:
+            high = middle - 1
+    return text[:low] + "…"
+
+
+# Function to split a text into pieces of at most `budget` tokens, cutting between
+# sentences, or between words for a sentence that does not fit on its own
+def split_to_tokens(text, budget, model="gpt-4o"):
+    if count_tokens(text, model) <= budget:
+        return [text]
+    pieces, current = [], ""
+    for sentence in re.split(r"(?<=[.!?…;])\s+", text.strip()):
+        parts = [sentence] if count_tokens(sentence, model) <= budget else sentence.split()
+        for part in parts:
+            candidate = f"{current} {part}" if current else part
+            if count_tokens(candidate, model) <= budget:
+                current = candidate
+                continue
+            if current:
+                pieces.append(current)
+            # A single word over the budget is the only thing still truncated
+            current = truncate_to_tokens(part, budget, model)
+    if current:
+        pieces.append(current)
+    return pieces
+
+
+class Prompt:
+    """
+    A versioned prompt: a static system prefix shared by every call, followed by a
+    user message holding the per-request content. Keeping everything that changes
+    at the end lets the provider serve the prefix from its prompt cache.
+
+    `max_input_tokens` caps the whole prompt; `budget_field` names the template
+    value that is truncated to stay within it. Callers that cannot lose the end of
+    that value split it first with `split_field`; truncations are counted in `describe`.
+    """
+
+    def __init__(self, name, version, system, user_template, max_input_tokens=None, budget_field=None):
+        self.name = name
+        self.version = version
+        self.system = system
+        self.user_template = user_template
+        self.max_input_tokens = max_input_tokens
+        self.budget_field = budget_field
+        digest = hashlib.sha256(f"{system}\x00{user_template}".encode("utf-8")).hexdigest()
+        # Editing a prompt without bumping its version still invalidates cached results
+        self.cache_version = f"{name}-{version}-{digest[:8]}"
+        self._prefix_tokens = None
+        self.truncations = 0
+
+    @property
+    def prefix_tokens(self):
+        if self._prefix_tokens is None:
+            self._prefix_tokens = count_tokens(self.system)
+        return self._prefix_tokens
+
+    def build_messages(self, attachments=None, model="gpt-4o", **values):
+        """
+        Return chat messages for one call; `attachments` are extra content parts
+        (e.g. images) placed after the user text.
+        """
+        if self.max_input_tokens and self.budget_field in values:
+            field = values[self.budget_field]
+            values[self.budget_field] = truncate_to_tokens(field, self.field_budget(model, **values), model)
+            if values[self.budget_field] != field:
+                self.truncations += 1
+        user_text = self.user_template.format(**values)
+        content = [{"type": "text", "text": user_text}, *attachments] if attachments else user_text
+        return [
+            {"role": "system", "content": self.system},
+            {"role": "user", "content": content},
+        ]
+
+    def field_budget(self, model="gpt-4o", **values):
+        """Return the tokens left for the budget field once the rest of the prompt is counted."""
+        fixed = self.prefix_tokens + count_tokens(self.user_template.format(**{**values, self.budget_field: ""}), model)
+        return self.max_input_tokens - fixed
+
+    def split_field(self, model="gpt-4o", **values):
+        """
+        Return the budget field cut into pieces that each fit the prompt whole,
+        so a long input can be read in several calls instead of being truncated.
+        """
+        field = values[self.budget_field]
+        if not self.max_input_tokens:
+            return [field]
+        return split_to_tokens(field, self.field_budget(model, **values), model)
+
+    def describe(self):
+        return {
+            "version": self.cache_version,
+            "prefix_tokens": self.prefix_tokens,
+            "prefix_cacheable": self.prefix_tokens >= PROMPT_CACHE_MIN_TOKENS,
+            "max_input_tokens": self.max_input_tokens,
+            "truncated_inputs": self.truncations,
+        }
+
+
+PROMPTS = {}
+
+
+# Function to add a prompt to the registry
+def register_prompt(prompt):
+    PROMPTS[prompt.name] = prompt
+    return prompt
+
+
+# Function to look up a registered prompt by name
+def get_prompt(name):
+    return PROMPTS[name]
+
+
+# Function to summarize the registered prompts (version, prefix size, cacheability)
+def describe_prompts():
+    return {name: prompt.describe() for name, prompt in PROMPTS.items()}
+
+
+IMAGE_PROMPT = register_prompt(Prompt(
+    name="image",
+    version="v3",
+    system=(
+        "You are an expert at extracting structured information from images. "
+        "You are given an image that may contain a product (like a packaged good, a poster, a label, etc.). "
+        "Your task is to extract the following information and return it as a Python dictionary with the exact keys: "
+        "\"product_name\", \"company\", \"start_date\", and \"end_date\".\n\n"
+        "Requirements:\n"
+        "- If any piece of information is not present or cannot be deduced, return null for that field.\n"
+        "- The dates should be returned in the format 'jj-mm-aa' (day-month-year). For example, '01-09-24' would represent 1 September 2024.\n"
+        "- If the product name or company name is unclear, do your best to infer it from logos, text fragments, or any textual clues.\n"
+        "- For start and end dates, carefully inspect the image for dates that might represent a production date, expiration date, "
+        "promotion period, or validity window. Dates may be partially visible or formatted in various ways (dd/mm/yy, dd-mm-yy, mm/yy, etc.). "
+        "Try to interpret and standardize them into 'jj-mm-aa' as best as you can.\n"
+        "- If multiple potential dates are visible, choose the ones that most reasonably represent a start and end timeframe for the product "
+        "(e.g., a promotional period or a product's valid shelf life). If no logical inference can be made, return null for those dates.\n"
+        "- Use advanced reasoning and be creative in interpreting unclear or incomplete clues. Consider language nuances, brand hints, or numeric sequences that could represent dates.\n"
+        "- Always return strictly a single Python dictionary in the following format:\n\n"
+        "{\n"
+        "  \"product_name\": \"...\" or null,\n"
+        "  \"company\": \"...\" or null,\n"
+        "  \"start_date\": \"jj-mm-aa\" or null,\n"
+        "  \"end_date\": \"jj-mm-aa\" or null\n"
+        "}\n"
+    ),
+    user_template="Extract the product information from this image.",
+))
+
+# Several photos of one package (e.g. its front and its back) read in one call
+IMAGE_VIEWS_PROMPT = register_prompt(Prompt(
+    name="image_views",
+    version="v1",
+    system=(
+        "You are an expert at extracting structured information from images. "
+        "You are given several photos of the same product, for example the front and the back of one package. "
+        "Combine what all the photos show and return one Python dictionary with the exact keys: "
+        "\"product_name\", \"company\", \"start_date\", and \"end_date\".\n\n"
+        "Requirements:\n"
+        "- The name and brand are usually on the front, dates and the manufacturer often on the back or the bottom: "
+        "take each piece of information from the photo where it is readable.\n"
+        "- If any piece of information is not present on any photo or cannot be deduced, return null for that field.\n"
+        "- The dates should be returned in the format 'jj-mm-aa' (day-month-year). For example, '01-09-24' would represent 1 September 2024.\n"
+        "- For start and end dates, look for a production date, expiration date, promotion period or validity window. "
+        "Dates may be partially visible or formatted in various ways (dd/mm/yy, dd-mm-yy, mm/yy, etc.); standardize them into 'jj-mm-aa'.\n"
+        "- Always return strictly a single Python dictionary in the following format:\n\n"
+        "{\n"
+        "  \"product_name\": \"...\" or null,\n"
+        "  \"company\": \"...\" or null,\n"
+        "  \"start_date\": \"jj-mm-aa\" or null,\n"
+        "  \"end_date\": \"jj-mm-aa\" or null\n"
+        "}\n"
+    ),
+    user_template="Extract the product information from these {count} photos of the same product.",
+))
+
+# Several unrelated products read in one call, one numbered entry per image
+IMAGE_PACK_PROMPT = register_prompt(Prompt(
+    name="image_pack",
+    version="v1",
+    system=(
+        "You are an expert at extracting structured information from images. "
+        "You are given several images, each announced by a line \"Image N:\" with N counting from 0. "
+        "Each image shows a different product (like a packaged good, a poster, a label, etc.). "
+        "For every image, extract \"product_name\", \"company\", \"start_date\" and \"end_date\" "
+        "from that image only; never mix information between images.\n\n"
+        "Requirements:\n"
+        "- If any piece of information is not present or cannot be deduced, return null for that field.\n"
+        "- The dates should be returned in the format 'jj-mm-aa' (day-month-year). For example, '01-09-24' would represent 1 September 2024.\n"
+        "- For start and end dates, look for a production date, expiration date, promotion period or validity window. "
+        "Dates may be partially visible or formatted in various ways (dd/mm/yy, dd-mm-yy, mm/yy, etc.); standardize them into 'jj-mm-aa'.\n"
+        "- Return exactly one entry per image, with its number as \"index\", strictly in the following format:\n\n"
+        "{\n"
+        "  \"products\": [\n"
+        "    {\"index\": 0, \"product_name\": \"...\" or null, \"company\": \"...\" or null, "
+        "\"start_date\": \"jj-mm-aa\" or null, \"end_date\": \"jj-mm-aa\" or null}\n"
+        "  ]\n"
+        "}\n"
+    ),
+    user_template="Extract the product information from each of these {count} images.",
+))
+
+PRODUCTS_PROMPT = register_prompt(Prompt(
+    name="products",
+    version="v5",
+    system='''Vous recevez la date du jour et un texte en français décrivant une transaction. Veuillez :
+
+1. Extraire le nom de la personne mentionnée dans le texte (par exemple "M. Dupont", "Alice", "Jean Martin", "Madame Sakho", etc.).
+   - Incluez les titres honorifiques (par exemple, "Madame", "Monsieur") si mentionnés dans le texte.
+   - S'il n'y a pas de nom explicite, retournez "None".
+
+2. Extraire les informations sur les produits et retourner STRICTEMENT le format JSON suivant :
+
+{
+  "person_name": "Nom de la personne ou None",
+  "products": [
+    {
+      "product_name": "Nom du produit",
+      "quantity": "Nombre ou None",
+      "unit": "g, kg, l, cl, ml ou None",
+      "price": "Prix unitaire ou None",
+      "transaction_type": "vente ou achat",
+      "payment_date": "Date de paiement au format YYYY-MM-DD ou None"
+    }
+  ]
+}
+
+Contraintes supplémentaires :
+- N'incluez aucun texte supplémentaire comme des traductions ou des introductions dans la réponse.
+- "transaction_type" doit être "vente" ou "achat" selon ce qui est trouvé dans le texte.
+- Les dates déjà résolues apparaissent entre crochets au format YYYY-MM-DD (ex : "vendredi prochain [2024-05-17]") : utilisez-les telles quelles.
+- Identifiez toute autre date ou période de paiement mentionnée dans le texte, qu'elle soit absolue (ex : "15 janvier 2024") ou relative (ex : "dans deux semaines", "le mois prochain", ou "vendredi prochain").
+  - Convertissez cette information en une date exacte au format YYYY-MM-DD en vous basant sur la date du jour indiquée avec le texte.
+  - Si aucune date n'est trouvée, retournez "None".
+- "quantity" doit être un nombre si trouvé, sinon "None".
+- "unit" est l'unité de mesure de la quantité ("250 grammes de sucre" : quantity 250, unit "g", product_name "sucre") ; "None" pour des articles comptés (sacs, boîtes...).
+- "price" est le prix d'une unité (un article, ou un kg, un litre...) : un montant donné pour toute la ligne ("deux sacs pour 10000") est divisé par la quantité. Un nombre si trouvé, sinon "None".
+- Le JSON doit STRICTEMENT respecter ce format (n'ajoutez ni ne retirez aucune clé).
+- Si plusieurs dates sont mentionnées, choisissez celle qui semble la plus logiquement liée au paiement.
+- Soyez créatif dans l'interprétation des dates implicites ou relatives, mais conservez un format rigoureux.
+
+IMPORTANT : Ne retournez rien d'autre que la structure JSON demandée.''',
+    user_template='Nous sommes le {today}.\nTexte : "{text}"',
+    max_input_tokens=4000,
+    budget_field="text",
+))
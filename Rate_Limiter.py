@@ -0,0 +1,292 @@
+import contextvars
+import hashlib
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+from Hedged_Requests import DeadlineExceeded
+from Instrumentation import metrics
+
+# Rate limits shared by every thread and process using the same API key.
+#
+# Each key has a token bucket for requests per minute and one for tokens per minute.
+# The buckets live in a small SQLite file and are updated under its write lock
+# (BEGIN IMMEDIATE), so Streamlit sessions, service workers and batch jobs on one host
+# draw from the same quota. Callers wait in a shared queue: interactive work goes
+# before batch work, and callers of the same class are served in arrival order.
+
+PRIORITIES = {"interactive": 0, "batch": 1}
+DEFAULT_PRIORITY = "interactive"
+# Batch callers that waited this long are served like interactive ones, so they are not starved
+PRIORITY_AGING_SECONDS = 30.0
+# Fraction of the provider quota actually used, leaving room for clock skew and estimates
+QUOTA_HEADROOM = 0.95
+# Burst allowed after an idle period, in seconds of quota. Providers enforce per-minute
+# limits over shorter windows too, so a full minute's quota at once would still get 429s
+BURST_SECONDS = 1.0
+# Waiters refresh their place in the queue while they poll; entries of crashed
+# processes stop counting after WAITER_TIMEOUT_SECONDS
+POLL_SECONDS = 0.02
+# The first waiter books its slot this long before the quota is there and leaves the
+# queue, so the next one is already waiting its turn and no slot is lost to polling
+RESERVE_AHEAD_SECONDS = 0.25
+WAITER_TIMEOUT_SECONDS = 5.0
+BUSY_TIMEOUT_SECONDS = 30.0
+DEFAULT_DB_PATH = os.path.join(tempfile.gettempdir(), "proboutik_rate_limits.sqlite")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS buckets (
+    name TEXT PRIMARY KEY,
+    requests REAL NOT NULL,
+    tokens REAL NOT NULL,
+    updated REAL NOT NULL,
+    paused_until REAL NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS waiters (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT NOT NULL,
+    priority INTEGER NOT NULL,
+    enqueued REAL NOT NULL,
+    heartbeat REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS waiters_by_name ON waiters (name, priority, id);
+"""
+
+_current_priority = contextvars.ContextVar("priority", default=DEFAULT_PRIORITY)
+
+
+# Function to get the priority class of the work being done ("interactive" or "batch")
+def current_priority():
+    return _current_priority.get()
+
+
+# Context manager running the calls inside it with another priority class
+@contextmanager
+def priority_scope(priority):
+    if priority not in PRIORITIES:
+        raise ValueError(f"Unknown priority: {priority}")
+    token = _current_priority.set(priority)
+    try:
+        yield
+    finally:
+        _current_priority.reset(token)
+
+
+# Function to name a bucket after an API key without storing the key itself
+def bucket_name(service, api_key):
+    return f"{service}:{hashlib.sha256(api_key.encode('utf-8')).hexdigest()[:16]}"
+
+
+class SharedRateLimiter:
+    """
+    Requests-per-minute and tokens-per-minute budget shared across processes.
+
+    `acquire(tokens)` blocks until the caller is first in the queue and both buckets
+    hold enough, then takes one request and `tokens` tokens. Token counts are estimates
+    made before the call; `settle` corrects the bucket with the real usage afterwards.
+    `pause(seconds)` stops every caller of the key, e.g. after a 429 with Retry-After,
+    so processes wait together instead of retrying into the limit one by one.
+    A limit of None is not enforced.
+    """
+
+    def __init__(self, name, requests_per_minute=None, tokens_per_minute=None, path=DEFAULT_DB_PATH):
+        self.name = name
+        self.request_rate = requests_per_minute * QUOTA_HEADROOM / 60 if requests_per_minute else None
+        self.token_rate = tokens_per_minute * QUOTA_HEADROOM / 60 if tokens_per_minute else None
+        self.request_capacity = max(1.0, self.request_rate * BURST_SECONDS) if self.request_rate else None
+        self.token_capacity = self.token_rate * BURST_SECONDS if self.token_rate else None
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=BUSY_TIMEOUT_SECONDS, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        # Bucket state is cheap to lose, so commits skip the fsync
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+        self._stats = {"acquired": 0, "waited": 0, "wait_seconds": 0.0, "paused": 0, "timed_out": 0}
+
+    @contextmanager
+    def _transaction(self):
+        # BEGIN IMMEDIATE takes the database write lock, serializing all processes
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield self._conn
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+
+    def _refill(self, conn, now):
+        row = conn.execute(
+            "SELECT requests, tokens, updated, paused_until FROM buckets WHERE name = ?", (self.name,)
+        ).fetchone()
+        if row is None:
+            requests, tokens, paused_until = self.request_capacity or 0.0, self.token_capacity or 0.0, 0.0
+        else:
+            requests, tokens, updated, paused_until = row
+            elapsed = max(0.0, now - updated)
+            if self.request_rate:
+                requests = min(self.request_capacity, requests + elapsed * self.request_rate)
+            if self.token_rate:
+                tokens = min(self.token_capacity, tokens + elapsed * self.token_rate)
+        return requests, tokens, paused_until
+
+    def _store(self, conn, now, requests, tokens, paused_until):
+        conn.execute(
+            "INSERT INTO buckets (name, requests, tokens, updated, paused_until) VALUES (?, ?, ?, ?, ?) "
+            "ON CONFLICT(name) DO UPDATE SET requests = excluded.requests, tokens = excluded.tokens, "
+            "updated = excluded.updated, paused_until = excluded.paused_until",
+            (self.name, requests, tokens, now, paused_until),
+        )
+
+    def _wait_seconds(self, requests, tokens, needed_tokens):
+        # Time until both buckets can cover the request; a request larger than the
+        # whole token bucket only waits for a full bucket and may then overdraw it
+        wait = 0.0
+        if self.request_rate and requests < 1:
+            wait = max(wait, (1 - requests) / self.request_rate)
+        if self.token_rate:
+            needed_tokens = min(needed_tokens, self.token_capacity)
+            if tokens < needed_tokens:
+                wait = max(wait, (needed_tokens - tokens) / self.token_rate)
+        return wait
+
+    def _try_acquire(self, waiter_id, tokens, now):
+        """
+        One attempt under the write lock. Returns (granted, seconds): a granted request
+        may start after `seconds`, otherwise try again after `seconds`.
+        """
+        with self._transaction() as conn:
+            conn.execute("UPDATE waiters SET heartbeat = ? WHERE id = ?", (now, waiter_id))
+            head = conn.execute(
+                "SELECT id FROM waiters WHERE name = ? AND heartbeat >= ? "
+                "ORDER BY CASE WHEN enqueued <= ? THEN 0 ELSE priority END, id LIMIT 1",
+                (self.name, now - WAITER_TIMEOUT_SECONDS, now - PRIORITY_AGING_SECONDS),
+            ).fetchone()
+            if head is not None and head[0] != waiter_id:
+                return False, POLL_SECONDS
+            requests, tokens_left, paused_until = self._refill(conn, now)
+            if paused_until > now:
+                return False, paused_until - now
+            wait = self._wait_seconds(requests, tokens_left, tokens)
+            if wait > RESERVE_AHEAD_SECONDS:
+                return False, wait - RESERVE_AHEAD_SECONDS
+            if self.request_rate:
+                requests -= 1
+            if self.token_rate:
+                tokens_left -= tokens
+            self._store(conn, now, requests, tokens_left, paused_until)
+            conn.execute("DELETE FROM waiters WHERE id = ?", (waiter_id,))
+            # The buckets may go briefly negative: that is the booked slot
+            return True, wait
+
+    def acquire(self, tokens=0, priority=None, deadline=None):
+        """
+        Wait for one request and `tokens` tokens of quota. Raises DeadlineExceeded
+        when `deadline` (see Hedged_Requests.Deadline) passes while waiting.
+        """
+        priority = PRIORITIES[priority or current_priority()]
+        started = time.time()
+        with self._transaction() as conn:
+            # Stale entries of processes that died while waiting are dropped on the way
+            conn.execute("DELETE FROM waiters WHERE heartbeat < ?", (started - WAITER_TIMEOUT_SECONDS,))
+            waiter_id = conn.execute(
+                "INSERT INTO waiters (name, priority, enqueued, heartbeat) VALUES (?, ?, ?, ?)",
+                (self.name, priority, started, started),
+            ).lastrowid
+        granted = False
+        try:
+            while True:
+                granted, wait = self._try_acquire(waiter_id, tokens, time.time())
+                if granted:
+                    break
+                if deadline is not None and deadline.remaining() <= wait:
+                    with self._lock:
+                        self._stats["timed_out"] += 1
+                    raise DeadlineExceeded(f"no {self.name} quota within {deadline.seconds:g}s")
+                # Short sleeps keep the queue position fresh and react to other processes
+                time.sleep(min(wait, POLL_SECONDS * 5))
+        finally:
+            if not granted:
+                with self._transaction() as conn:
+                    conn.execute("DELETE FROM waiters WHERE id = ?", (waiter_id,))
+        time.sleep(wait)
+        waited = time.time() - started
+        with self._lock:
+            self._stats["acquired"] += 1
+            if waited >= POLL_SECONDS:
+                self._stats["waited"] += 1
+                self._stats["wait_seconds"] += waited
+        metrics.observe("ratelimit.wait", duration_seconds=waited)
+        return waited
+
+    def try_acquire(self, tokens=0):
+        """
+        Take one request and `tokens` tokens only if nobody is waiting and the quota
+        is there right now; for optional work such as hedged duplicates.
+        """
+        now = time.time()
+        with self._transaction() as conn:
+            waiting = conn.execute(
+                "SELECT 1 FROM waiters WHERE name = ? AND heartbeat >= ? LIMIT 1",
+                (self.name, now - WAITER_TIMEOUT_SECONDS),
+            ).fetchone()
+            requests, tokens_left, paused_until = self._refill(conn, now)
+            if waiting or paused_until > now or self._wait_seconds(requests, tokens_left, tokens) > 0:
+                return False
+            if self.request_rate:
+                requests -= 1
+            if self.token_rate:
+                tokens_left -= tokens
+            self._store(conn, now, requests, tokens_left, paused_until)
+        with self._lock:
+            self._stats["acquired"] += 1
+        return True
+
+    def settle(self, estimated_tokens, actual_tokens):
+        """
+        Give back (or take more of) the token budget once the real usage is known.
+        """
+        if not self.token_rate or actual_tokens is None or actual_tokens == estimated_tokens:
+            return
+        now = time.time()
+        with self._transaction() as conn:
+            requests, tokens, paused_until = self._refill(conn, now)
+            tokens = min(self.token_capacity, tokens + estimated_tokens - actual_tokens)
+            self._store(conn, now, requests, tokens, paused_until)
+
+    def pause(self, seconds):
+        """
+        Hold every caller of this key for `seconds`, e.g. when the provider answered 429.
+        """
+        now = time.time()
+        with self._transaction() as conn:
+            requests, tokens, paused_until = self._refill(conn, now)
+            self._store(conn, now, requests, tokens, max(paused_until, now + seconds))
+        with self._lock:
+            self._stats["paused"] += 1
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        now = time.time()
+        with self._transaction() as conn:
+            requests, tokens, paused_until = self._refill(conn, now)
+            queued = conn.execute(
+                "SELECT COUNT(*) FROM waiters WHERE name = ? AND heartbeat >= ?",
+                (self.name, now - WAITER_TIMEOUT_SECONDS),
+            ).fetchone()[0]
+        stats.update({
+            "requests_available": requests if self.request_rate else None,
+            "tokens_available": tokens if self.token_rate else None,
+            "paused_seconds": max(0.0, paused_until - now),
+            "queued": queued,
+        })
+        return stats
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,315 @@
+import json
+import re
+from datetime import date
+
+from French_Normalization import normalize_unit, parse_date_value, words_to_number
+
+# JSON schemas for the model replies, used both for OpenAI structured outputs
+# and to validate what comes back
+IMAGE_PRODUCT_FIELDS = ("product_name", "company", "start_date", "end_date")
+PRODUCT_FIELDS = ("product_name", "quantity", "unit", "price", "transaction_type", "payment_date")
+TRANSACTION_FIELDS = ("person_name", "products")
+TRANSACTION_TYPES = ("vente", "achat")
+
+IMAGE_PRODUCT_SCHEMA = {
+    "type": "object",
+    "properties": {field: {"type": ["string", "null"]} for field in IMAGE_PRODUCT_FIELDS},
+    "required": list(IMAGE_PRODUCT_FIELDS),
+    "additionalProperties": False,
+}
+
+# Several images in one request: one indexed entry per image
+IMAGE_PRODUCTS_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "products": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {"index": {"type": "integer"}, **IMAGE_PRODUCT_SCHEMA["properties"]},
+                "required": ["index", *IMAGE_PRODUCT_FIELDS],
+                "additionalProperties": False,
+            },
+        },
+    },
+    "required": ["products"],
+    "additionalProperties": False,
+}
+
+TRANSACTION_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "person_name": {"type": ["string", "null"]},
+        "products": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "product_name": {"type": ["string", "null"]},
+                    "quantity": {"type": ["number", "null"]},
+                    "unit": {"type": ["string", "null"]},
+                    "price": {"type": ["number", "null"]},
+                    "transaction_type": {"type": ["string", "null"], "enum": ["vente", "achat", None]},
+                    "payment_date": {"type": ["string", "null"]},
+                },
+                "required": list(PRODUCT_FIELDS),
+                "additionalProperties": False,
+            },
+        },
+    },
+    "required": list(TRANSACTION_FIELDS),
+    "additionalProperties": False,
+}
+
+# Values the models use for "nothing found" besides a real null
+NULL_STRINGS = {"", "none", "null", "n/a", "na", "nan", "inconnu", "aucun", "aucune"}
+
+# Function to build the OpenAI response_format for strict structured outputs
+def json_schema_response_format(name, schema):
+    return {"type": "json_schema", "json_schema": {"name": name, "strict": True, "schema": schema}}
+
+# Function to find the first balanced {...} object in a reply (ignoring braces inside strings)
+def _first_json_object(content):
+    start = content.find("{")
+    while start != -1:
+        depth = 0
+        in_string = False
+        escaped = False
+        for index in range(start, len(content)):
+            char = content[index]
+            if in_string:
+                if escaped:
+                    escaped = False
+                elif char == "\\":
+                    escaped = True
+                elif char == '"':
+                    in_string = False
+            elif char == '"':
+                in_string = True
+            elif char == "{":
+                depth += 1
+            elif char == "}":
+                depth -= 1
+                if depth == 0:
+                    return content[start:index + 1]
+        # Unbalanced: return the tail so the repair pass can try to close it
+        return content[start:]
+    return None
+
+# Function to apply cheap textual fixes for the usual ways model JSON goes wrong
+def _repair_json(candidate):
+    # Python literals instead of JSON ones (the image prompt asks for a "Python dictionary")
+    candidate = re.sub(r"(?<![\w\"'])None(?![\w\"'])", "null", candidate)
+    candidate = re.sub(r"(?<![\w\"'])True(?![\w\"'])", "true", candidate)
+    candidate = re.sub(r"(?<![\w\"'])False(?![\w\"'])", "false", candidate)
+    # Single-quoted keys and values
+    candidate = re.sub(r"'([^'\\\n]*)'(\s*[:,}\]])", r'"\1"\2', candidate)
+    candidate = re.sub(r"([{\[,]\s*)'([^'\\\n]*)'", r'\1"\2"', candidate)
+    # Trailing commas
+    candidate = re.sub(r",\s*([}\]])", r"\1", candidate)
+    # Close a truncated reply (e.g. cut by max_tokens)
+    if candidate.count('"') % 2 == 1:
+        candidate += '"'
+    stack = []
+    in_string = False
+    escaped = False
+    for char in candidate:
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char in "{[":
+            stack.append("}" if char == "{" else "]")
+        elif char in "}]" and stack:
+            stack.pop()
+    candidate = re.sub(r",\s*$", "", candidate)
+    return candidate + "".join(reversed(stack))
+
+# Function to decode a model reply into a dict: strict JSON first, then a tolerant
+# repair pass. Returns None when nothing usable can be recovered.
+def parse_json_reply(content):
+    if not content:
+        return None
+    content = content.strip()
+    try:
+        data = json.loads(content)
+        return data if isinstance(data, dict) else None
+    except json.JSONDecodeError:
+        pass
+
+    candidate = _first_json_object(content)
+    if candidate is None:
+        return None
+    for attempt in (candidate, _repair_json(candidate)):
+        try:
+            data = json.loads(attempt)
+        except json.JSONDecodeError:
+            continue
+        if isinstance(data, dict):
+            return data
+    return None
+
+# Function to turn "None"-like strings into real nulls
+def _null_if_empty(value):
+    if value is None:
+        return None
+    if isinstance(value, str) and value.strip().lower() in NULL_STRINGS:
+        return None
+    return value
+
+# Function to coerce a quantity or price into a number (accepts "5 000", "5000 FCFA", "2,5", "cinq mille")
+def _to_number(value):
+    value = _null_if_empty(value)
+    if value is None or isinstance(value, bool):
+        return None
+    if isinstance(value, int):
+        return value
+    if isinstance(value, float):
+        return int(value) if value.is_integer() else value
+    match = re.search(r"-?\d(?:[\d\s  .]|,(?=\d))*", str(value))
+    if not match:
+        # Spelled-out numbers ("cinq mille") are converted locally
+        number = words_to_number(str(value))
+        if number is None:
+            raise ValueError(value)
+        return number
+    number = re.sub(r"[\s  ]", "", match.group(0)).rstrip(".")
+    if "," in number and "." in number:
+        # "1.500,00" or "1,500.00": the last separator is the decimal one
+        thousands = "." if number.rfind(",") > number.rfind(".") else ","
+        number = number.replace(thousands, "").replace(",", ".")
+    elif number.count(",") > 1:
+        number = number.replace(",", "")
+    elif "," in number:
+        number = number.replace(",", ".")
+    elif re.fullmatch(r"-?\d{1,3}(\.\d{3})+", number):
+        number = number.replace(".", "")
+    number = float(number)
+    return int(number) if number.is_integer() else number
+
+# Function to normalize a 'jj-mm-aa' date (also accepts / . or space separators, 4-digit
+# years, "mm/aa" and month names as printed on labels)
+def _to_short_date(value):
+    value = _null_if_empty(value)
+    if value is None:
+        return None
+    parsed = parse_date_value(value)
+    if parsed is None:
+        raise ValueError(value)
+    return parsed.strftime("%d-%m-%y")
+
+# Function to normalize a YYYY-MM-DD payment date; relative phrases the model copied
+# verbatim ("vendredi prochain") are resolved against today's date
+def _to_iso_date(value):
+    value = _null_if_empty(value)
+    if value is None:
+        return None
+    parsed = parse_date_value(value, today=date.today())
+    if parsed is None:
+        raise ValueError(value)
+    return parsed.isoformat()
+
+# Function to validate an image extraction reply.
+# Returns (product_info, failed_fields): fields that are missing or unusable are set to
+# None and listed in failed_fields so only they need to be asked for again.
+def validate_image_product(data):
+    product_info = {field: None for field in IMAGE_PRODUCT_FIELDS}
+    if data is None:
+        return product_info, list(IMAGE_PRODUCT_FIELDS)
+
+    failed_fields = []
+    for field in IMAGE_PRODUCT_FIELDS:
+        if field not in data:
+            failed_fields.append(field)
+            continue
+        value = _null_if_empty(data[field])
+        try:
+            if field in ("start_date", "end_date"):
+                value = _to_short_date(value)
+            elif value is not None:
+                value = str(value).strip()
+        except ValueError:
+            # A date the model could see but not standardize: worth one targeted retry
+            failed_fields.append(field)
+            value = None
+        product_info[field] = value
+    return product_info, failed_fields
+
+# Function to validate a reply covering `count` images (see IMAGE_PRODUCTS_SCHEMA).
+# Returns one (product_info, failed_fields) per image, in image order; an image the
+# reply has no entry for fails on every field.
+def validate_image_products(data, count):
+    entries = {}
+    products = data.get("products") if data is not None else None
+    if isinstance(products, list):
+        for product in products:
+            if not isinstance(product, dict):
+                continue
+            try:
+                index = int(product.get("index"))
+            except (TypeError, ValueError):
+                continue
+            # The first entry for an image wins; out of range indexes are ignored
+            if 0 <= index < count and index not in entries:
+                entries[index] = validate_image_product(product)
+    return [entries.get(index) or validate_image_product(None) for index in range(count)]
+
+# Function to validate one product of a transaction reply; bad values become None
+def _validate_product(product):
+    clean = {}
+    for field in PRODUCT_FIELDS:
+        value = _null_if_empty(product.get(field))
+        try:
+            if field in ("quantity", "price"):
+                value = _to_number(value)
+            elif field == "payment_date":
+                value = _to_iso_date(value)
+            elif field == "unit":
+                # Only units of measure are kept ("kilos" -> "kg"); counted items have none
+                value = normalize_unit(value)
+            elif field == "transaction_type" and value is not None:
+                value = str(value).strip().lower()
+                value = value if value in TRANSACTION_TYPES else None
+            elif value is not None:
+                value = str(value).strip()
+        except ValueError:
+            value = None
+        clean[field] = value
+    return clean
+
+# Function to validate a transaction (speech) extraction reply.
+# Returns (result, failed_fields) in the same way as validate_image_product.
+def validate_transaction(data):
+    result = {"person_name": None, "products": []}
+    if data is None:
+        return result, list(TRANSACTION_FIELDS)
+
+    failed_fields = []
+    if "person_name" in data:
+        person_name = _null_if_empty(data["person_name"])
+        result["person_name"] = str(person_name).strip() if person_name is not None else None
+    else:
+        failed_fields.append("person_name")
+
+    products = data.get("products")
+    if isinstance(products, dict):
+        products = [products]
+    if isinstance(products, list):
+        result["products"] = [_validate_product(p) for p in products if isinstance(p, dict)]
+    else:
+        failed_fields.append("products")
+    return result, failed_fields
+
+# Function to build the follow-up message asking the model for just the failed fields
+def field_retry_prompt(failed_fields):
+    keys = ", ".join(f'"{field}"' for field in failed_fields)
+    return (
+        "Your previous answer could not be parsed for the following keys: "
+        f"{keys}. Reply with a single valid JSON object containing only these keys, "
+        "using null when the information is absent, and nothing else."
+    )
@@ -0,0 +1,388 @@
+import os
+import sqlite3
+import threading
+import time
+from datetime import date, timedelta
+
+from Instrumentation import metrics
+from Product_Catalog import normalize_name
+
+# Local ledger of the transactions extracted from speech: one row per product line,
+# plus aggregate tables kept up to date with every write so the dashboard never has
+# to scan the ledger. Writes from all sessions go through one background thread
+# that commits them in batches.
+#
+# "price" is a unit price (per item, or per kg/l... when the line has a unit), so a
+# line is worth amount = quantity * price; a line without a quantity counts as one.
+
+# Rows written per transaction at most, and the longest a record waits to be written
+DEFAULT_BATCH_SIZE = 500
+DEFAULT_FLUSH_INTERVAL = 0.5
+# How long a connection waits for another process holding the write lock
+BUSY_TIMEOUT_SECONDS = 30
+
+TRANSACTION_TYPES = ("vente", "achat")
+
+SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS sources ("
+    " source_key TEXT PRIMARY KEY,"
+    " recorded_at REAL NOT NULL)",
+    "CREATE TABLE IF NOT EXISTS transactions ("
+    " id INTEGER PRIMARY KEY,"
+    " source_key TEXT NOT NULL,"
+    " recorded_at REAL NOT NULL,"
+    " person TEXT,"
+    " person_key TEXT,"
+    " product TEXT,"
+    " quantity REAL,"
+    " unit TEXT,"
+    " price REAL,"
+    " amount REAL,"
+    " transaction_type TEXT,"
+    " payment_date TEXT)",
+    "CREATE INDEX IF NOT EXISTS idx_transactions_person ON transactions (person_key, payment_date)",
+    "CREATE INDEX IF NOT EXISTS idx_transactions_product ON transactions (product)",
+    # Holds every column upcoming_payments() reads, so it never touches the table
+    "CREATE INDEX IF NOT EXISTS idx_transactions_payment ON transactions"
+    " (payment_date, person, product, quantity, unit, price, amount, transaction_type)"
+    " WHERE payment_date IS NOT NULL",
+    # Aggregates, updated in the same write transaction as the rows they summarize
+    "CREATE TABLE IF NOT EXISTS customer_totals ("
+    " person_key TEXT PRIMARY KEY,"
+    " person TEXT,"
+    " sales_count INTEGER NOT NULL DEFAULT 0,"
+    " sales_amount REAL NOT NULL DEFAULT 0,"
+    " purchases_count INTEGER NOT NULL DEFAULT 0,"
+    " purchases_amount REAL NOT NULL DEFAULT 0,"
+    " last_recorded_at REAL)",
+    "CREATE INDEX IF NOT EXISTS idx_customer_totals_sales ON customer_totals (sales_amount)",
+    "CREATE TABLE IF NOT EXISTS type_totals ("
+    " transaction_type TEXT PRIMARY KEY,"
+    " line_count INTEGER NOT NULL DEFAULT 0,"
+    " quantity REAL NOT NULL DEFAULT 0,"
+    " amount REAL NOT NULL DEFAULT 0)",
+    "CREATE TABLE IF NOT EXISTS payments_by_date ("
+    " payment_date TEXT NOT NULL,"
+    " transaction_type TEXT NOT NULL,"
+    " line_count INTEGER NOT NULL DEFAULT 0,"
+    " amount REAL NOT NULL DEFAULT 0,"
+    " PRIMARY KEY (payment_date, transaction_type))",
+)
+
+
+def _number(value):
+    try:
+        return float(value) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+def _text(value):
+    if value is None or str(value).strip() in ("", "None", "null"):
+        return None
+    return str(value).strip()
+
+
+# Function to compute what a line is worth: quantity times unit price (one item without a quantity)
+def line_amount(quantity, price):
+    if price is None:
+        return 0.0
+    return price * (quantity if quantity is not None else 1.0)
+
+
+# Function to turn an extract_products result into ledger rows (one per product line)
+def ledger_rows(result):
+    person = _text(result.get("person_name"))
+    person_key = normalize_name(person) if person else None
+    rows = []
+    for product in result.get("products") or []:
+        transaction_type = _text(product.get("transaction_type"))
+        quantity = _number(product.get("quantity"))
+        price = _number(product.get("price"))
+        rows.append((
+            person,
+            person_key or None,
+            _text(product.get("product_name")),
+            quantity,
+            _text(product.get("unit")),
+            price,
+            line_amount(quantity, price),
+            transaction_type.lower() if transaction_type else None,
+            _text(product.get("payment_date")),
+        ))
+    return rows
+
+
+class TransactionLedger:
+    """
+    SQLite ledger (WAL mode) of extracted transactions.
+
+    record() only queues the result; a writer thread commits everything queued in
+    one transaction every `flush_interval` seconds (or as soon as `batch_size` rows
+    are waiting), updating the customer, type and payment-date aggregates from the
+    batch. Records carry a source key (e.g. the audio cache key): a source already
+    in the ledger is not counted twice. Reads use their own connection and are not
+    blocked by writes.
+    """
+
+    def __init__(self, path, batch_size=DEFAULT_BATCH_SIZE, flush_interval=DEFAULT_FLUSH_INTERVAL):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._write_conn = self._connect()
+        self._write_conn.execute("PRAGMA journal_mode=WAL")
+        for statement in SCHEMA:
+            self._write_conn.execute(statement)
+        self._write_conn.commit()
+        self._read_conn = self._connect()
+        self._read_lock = threading.Lock()
+        self._pending = []
+        self._pending_rows = 0
+        self._written = 0
+        self._queued = 0
+        self._flush_target = 0
+        self.failed_records = 0
+        self._condition = threading.Condition()
+        self._closed = False
+        self._writer = threading.Thread(target=self._write_loop, name="ledger-writer", daemon=True)
+        self._writer.start()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=BUSY_TIMEOUT_SECONDS, check_same_thread=False)
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def record(self, result, source_key, recorded_at=None):
+        """
+        Queue an extract_products result for writing. Returns the number of rows queued.
+        """
+        rows = ledger_rows(result)
+        if not rows:
+            return 0
+        with self._condition:
+            if self._closed:
+                raise RuntimeError("ledger is closed")
+            self._pending.append((source_key, recorded_at or time.time(), rows))
+            self._pending_rows += len(rows)
+            self._queued += 1
+            if len(self._pending) == 1 or self._pending_rows >= self.batch_size:
+                self._condition.notify_all()
+        return len(rows)
+
+    def flush(self, timeout=None):
+        """
+        Wait until everything queued so far is written (or failed). Returns False on timeout.
+        """
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        with self._condition:
+            target = self._queued
+            self._flush_target = max(self._flush_target, target)
+            self._condition.notify_all()
+            while self._written < target:
+                remaining = deadline - time.monotonic() if deadline is not None else None
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._condition.wait(remaining)
+        return True
+
+    def _write_loop(self):
+        while True:
+            with self._condition:
+                while not self._pending and not self._closed:
+                    self._condition.wait()
+                if not self._pending:
+                    return
+                if self._pending_rows < self.batch_size and self._flush_target <= self._written and not self._closed:
+                    # Give other sessions a moment to add to this batch
+                    self._condition.wait(self.flush_interval)
+                batch, self._pending, self._pending_rows = self._pending, [], 0
+            start = time.perf_counter()
+            failed = False
+            try:
+                self._write_batch(batch)
+            except sqlite3.Error:
+                failed = True
+                self.failed_records += len(batch)
+            metrics.observe("ledger.write", error=failed, duration_seconds=time.perf_counter() - start)
+            with self._condition:
+                self._written += len(batch)
+                self._condition.notify_all()
+
+    def _write_batch(self, batch):
+        customers = {}
+        types = {}
+        payments = {}
+        rows = []
+        conn = self._write_conn
+        with conn:
+            for source_key, recorded_at, record_rows in batch:
+                inserted = conn.execute(
+                    "INSERT OR IGNORE INTO sources (source_key, recorded_at) VALUES (?, ?)",
+                    (source_key, recorded_at),
+                ).rowcount
+                if not inserted:
+                    continue
+                for person, person_key, product, quantity, unit, price, amount, transaction_type, payment_date \
+                        in record_rows:
+                    rows.append((source_key, recorded_at, person, person_key, product, quantity, unit,
+                                 price, amount, transaction_type, payment_date))
+                    if person_key:
+                        totals = customers.setdefault(person_key, [person, 0, 0.0, 0, 0.0, recorded_at])
+                        totals[5] = max(totals[5], recorded_at)
+                        if transaction_type == "vente":
+                            totals[1] += 1
+                            totals[2] += amount
+                        elif transaction_type == "achat":
+                            totals[3] += 1
+                            totals[4] += amount
+                    if transaction_type:
+                        totals = types.setdefault(transaction_type, [0, 0.0, 0.0])
+                        totals[0] += 1
+                        totals[1] += quantity or 0.0
+                        totals[2] += amount
+                    if payment_date and transaction_type:
+                        totals = payments.setdefault((payment_date, transaction_type), [0, 0.0])
+                        totals[0] += 1
+                        totals[1] += amount
+            conn.executemany(
+                "INSERT INTO transactions (source_key, recorded_at, person, person_key, product,"
+                " quantity, unit, price, amount, transaction_type, payment_date)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+            conn.executemany(
+                "INSERT INTO customer_totals (person_key, person, sales_count, sales_amount,"
+                " purchases_count, purchases_amount, last_recorded_at) VALUES (?, ?, ?, ?, ?, ?, ?)"
+                " ON CONFLICT (person_key) DO UPDATE SET"
+                " person = excluded.person,"
+                " sales_count = sales_count + excluded.sales_count,"
+                " sales_amount = sales_amount + excluded.sales_amount,"
+                " purchases_count = purchases_count + excluded.purchases_count,"
+                " purchases_amount = purchases_amount + excluded.purchases_amount,"
+                " last_recorded_at = MAX(last_recorded_at, excluded.last_recorded_at)",
+                [(key, *totals) for key, totals in customers.items()],
+            )
+            conn.executemany(
+                "INSERT INTO type_totals (transaction_type, line_count, quantity, amount) VALUES (?, ?, ?, ?)"
+                " ON CONFLICT (transaction_type) DO UPDATE SET"
+                " line_count = line_count + excluded.line_count,"
+                " quantity = quantity + excluded.quantity,"
+                " amount = amount + excluded.amount",
+                [(key, *totals) for key, totals in types.items()],
+            )
+            conn.executemany(
+                "INSERT INTO payments_by_date (payment_date, transaction_type, line_count, amount) VALUES (?, ?, ?, ?)"
+                " ON CONFLICT (payment_date, transaction_type) DO UPDATE SET"
+                " line_count = line_count + excluded.line_count,"
+                " amount = amount + excluded.amount",
+                [(*key, *totals) for key, totals in payments.items()],
+            )
+
+    def _query(self, sql, params=()):
+        with self._read_lock:
+            cursor = self._read_conn.execute(sql, params)
+            columns = [column[0] for column in cursor.description]
+            return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+    def customer_totals(self, limit=20, order_by="sales_amount"):
+        """
+        Customers with their sales and purchases (line count and amount), largest first.
+        """
+        if order_by not in ("sales_amount", "purchases_amount", "last_recorded_at"):
+            raise ValueError(f"cannot order customers by {order_by!r}")
+        return self._query(
+            f"SELECT person, sales_count, sales_amount, purchases_count, purchases_amount, last_recorded_at"
+            f" FROM customer_totals ORDER BY {order_by} DESC LIMIT ?",
+            (limit,),
+        )
+
+    def customer(self, person):
+        """
+        Totals and ledger lines of one customer, most recent payment dates first.
+        """
+        person_key = normalize_name(person)
+        totals = self._query("SELECT * FROM customer_totals WHERE person_key = ?", (person_key,))
+        lines = self._query(
+            "SELECT product, quantity, unit, price, amount, transaction_type, payment_date, recorded_at"
+            " FROM transactions"
+            " WHERE person_key = ? ORDER BY payment_date DESC LIMIT 200",
+            (person_key,),
+        )
+        return {"totals": totals[0] if totals else None, "lines": lines}
+
+    def upcoming_payments(self, days=30, today=None, limit=100):
+        """
+        Ledger lines with a payment date in the next `days` days, soonest first,
+        and the amount due per day.
+        """
+        today = today or date.today()
+        start, end = today.isoformat(), (today + timedelta(days=days)).isoformat()
+        lines = self._query(
+            "SELECT payment_date, person, product, quantity, unit, price, amount, transaction_type"
+            " FROM transactions"
+            " WHERE payment_date BETWEEN ? AND ? ORDER BY payment_date LIMIT ?",
+            (start, end, limit),
+        )
+        per_day = self._query(
+            "SELECT payment_date, transaction_type, line_count, amount FROM payments_by_date"
+            " WHERE payment_date BETWEEN ? AND ? ORDER BY payment_date",
+            (start, end),
+        )
+        return {"lines": lines, "per_day": per_day}
+
+    def sales_vs_purchases(self):
+        """
+        Line count, quantity and amount per transaction type ("vente", "achat").
+        """
+        totals = {row["transaction_type"]: row for row in self._query("SELECT * FROM type_totals")}
+        empty = {"line_count": 0, "quantity": 0.0, "amount": 0.0}
+        summary = {}
+        for transaction_type in TRANSACTION_TYPES:
+            row = totals.pop(transaction_type, None)
+            summary[transaction_type] = {key: row[key] for key in empty} if row else dict(empty)
+        for transaction_type, row in totals.items():
+            summary[transaction_type] = {key: row[key] for key in empty}
+        return summary
+
+    def summary(self, days=30, limit=10):
+        return {
+            "totals": self.sales_vs_purchases(),
+            "customers": self.customer_totals(limit),
+            "upcoming": self.upcoming_payments(days),
+        }
+
+    def rebuild_aggregates(self):
+        """
+        Recompute the aggregate tables from the ledger rows (after manual edits).
+        """
+        self.flush()
+        with self._write_conn as conn:
+            conn.execute("DELETE FROM customer_totals")
+            conn.execute("DELETE FROM type_totals")
+            conn.execute("DELETE FROM payments_by_date")
+            conn.execute(
+                "INSERT INTO customer_totals SELECT person_key, MAX(person),"
+                " SUM(transaction_type = 'vente'), TOTAL(CASE WHEN transaction_type = 'vente' THEN amount END),"
+                " SUM(transaction_type = 'achat'), TOTAL(CASE WHEN transaction_type = 'achat' THEN amount END),"
+                " MAX(recorded_at) FROM transactions WHERE person_key IS NOT NULL GROUP BY person_key"
+            )
+            conn.execute(
+                "INSERT INTO type_totals SELECT transaction_type, COUNT(*), TOTAL(quantity), TOTAL(amount)"
+                " FROM transactions WHERE transaction_type IS NOT NULL GROUP BY transaction_type"
+            )
+            conn.execute(
+                "INSERT INTO payments_by_date SELECT payment_date, transaction_type, COUNT(*), TOTAL(amount)"
+                " FROM transactions WHERE payment_date IS NOT NULL AND transaction_type IS NOT NULL"
+                " GROUP BY payment_date, transaction_type"
+            )
+
+    def close(self):
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        self._writer.join()
+        with self._read_lock:
+            self._read_conn.close()
+        self._write_conn.close()
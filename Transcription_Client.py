@@ -0,0 +1,156 @@
+import os
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from Instrumentation import metrics
+
+# Status codes worth retrying: rate limiting and transient backend failures
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+class TranscriptionError(Exception):
+    """
+    Raised when the transcription backend rejects a file or cannot be reached.
+    """
+
+    def __init__(self, message, status_code=None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class TranscriptionClient:
+    """
+    Client for the speech-to-text backend.
+
+    Keeps one pooled HTTP session for the life of the process so recordings reuse
+    warm TCP/TLS connections, bounds every request with connect/read timeouts and
+    retries 429/5xx responses and connection failures with jittered backoff.
+    With a `rate_limiter` (see Rate_Limiter.py) every POST waits for the shared
+    request quota, and a 429 holds all callers of the key for the Retry-After time.
+    """
+
+    def __init__(self, api_url, api_key, connect_timeout=5.0, read_timeout=120.0, max_retries=3,
+                 backoff_base=0.5, backoff_max=20.0, pool_size=10, sample_rate=16000,
+                 tempo_factor=1.0, target_language="fr", rate_limiter=None):
+        self.api_url = api_url
+        self.rate_limiter = rate_limiter
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.form_data = {
+            "sample_rate": sample_rate,
+            "tempo_factor": tempo_factor,
+            "target_language": target_language,
+        }
+
+        self.session = requests.Session()
+        self.session.headers["Authorization"] = f"Bearer {api_key}"
+        # Retries are handled below so that Retry-After and jitter apply to POSTs too
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def _backoff_delay(self, attempt, retry_after=None):
+        delay = min(self.backoff_max, self.backoff_base * (2 ** attempt))
+        # Full jitter spreads out clients that failed at the same moment
+        delay = random.uniform(0, delay)
+        if retry_after is not None:
+            delay = max(delay, min(retry_after, self.backoff_max))
+        return delay
+
+    def transcribe(self, audio, filename=None):
+        """
+        Transcribe `audio` (a file path or raw bytes) and return the transcription text.
+        """
+        if isinstance(audio, (str, os.PathLike)):
+            filename = filename or os.path.basename(audio)
+            with open(audio, "rb") as audio_file:
+                audio_bytes = audio_file.read()
+        else:
+            audio_bytes = bytes(audio)
+        filename = filename or "audio.wav"
+
+        with metrics.stage("transcription.request") as span:
+            span["payload_bytes"] = len(audio_bytes)
+            span["retries"] = 0
+            return self._post_with_retries(audio_bytes, filename, span)
+
+    def _post_with_retries(self, audio_bytes, filename, span):
+        attempt = 0
+        while True:
+            span["retries"] = attempt
+            if self.rate_limiter is not None:
+                self.rate_limiter.acquire()
+            try:
+                response = self.session.post(
+                    self.api_url,
+                    files={"incoming_file": (filename, audio_bytes)},
+                    data=self.form_data,
+                    timeout=self.timeout,
+                )
+            except requests.ConnectionError as e:
+                # Covers refused/reset connections and connect timeouts; a read timeout
+                # means the backend is busy with the file, so it is not retried
+                if attempt >= self.max_retries:
+                    raise TranscriptionError(str(e)) from e
+                time.sleep(self._backoff_delay(attempt))
+                attempt += 1
+                continue
+            except requests.Timeout as e:
+                raise TranscriptionError(f"Transcription timed out: {e}") from e
+
+            if response.status_code in RETRY_STATUS_CODES and attempt < self.max_retries:
+                retry_after = None
+                try:
+                    retry_after = float(response.headers.get("Retry-After"))
+                except (TypeError, ValueError):
+                    pass
+                response.close()
+                delay = self._backoff_delay(attempt, retry_after)
+                if response.status_code == 429 and self.rate_limiter is not None:
+                    # The other callers of the key hold off too; acquire() then waits it out
+                    self.rate_limiter.pause(delay)
+                    delay = 0
+                time.sleep(delay)
+                attempt += 1
+                continue
+
+            return self._parse_response(response)
+
+    def _parse_response(self, response):
+        try:
+            response_data = response.json()
+        except ValueError:
+            response_data = {}
+        if response.status_code == 200:
+            return response_data.get("transcription", "")
+        message = response_data.get("error_message") or response.reason or "Unknown error"
+        raise TranscriptionError(message, status_code=response.status_code)
+
+    def transcribe_many(self, audio_files, max_workers=4):
+        """
+        Transcribe several files concurrently over the shared session.
+        Yields (index, audio, transcription, error) as each file finishes.
+        """
+        executor = ThreadPoolExecutor(max_workers=max_workers)
+        try:
+            futures = {
+                executor.submit(self.transcribe, audio): (index, audio)
+                for index, audio in enumerate(audio_files)
+            }
+            for future in as_completed(futures):
+                index, audio = futures[future]
+                try:
+                    yield index, audio, future.result(), None
+                except Exception as e:
+                    yield index, audio, None, str(e)
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    def close(self):
+        self.session.close()
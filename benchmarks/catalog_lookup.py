@@ -0,0 +1,107 @@
+import argparse
+import os
+import random
+import sys
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+
+from benchmarks.run_benchmarks import percentile, rss_mb
+from Product_Catalog import ProductCatalog
+
+# Catalog index benchmark: builds a synthetic catalog and times fuzzy lookups of
+# exact, misspelled and unknown names. Run from the repository root:
+#
+#   python -m benchmarks.catalog_lookup --size 100000
+
+PRODUCTS = ["riz", "huile", "sucre", "lait", "savon", "farine", "café", "thé", "sel", "tomate",
+            "sardines", "biscuits", "pâtes", "lessive", "bouillon", "jus", "eau", "beurre"]
+QUALIFIERS = ["parfumé", "concentré", "végétale", "en poudre", "brisé", "complet", "bio",
+              "sucré", "light", "extra", "premium", "local", "importé", "familial"]
+BRANDS = ["Nestlé", "Jadida", "Maggi", "Dangote", "Lesieur", "Vitalait", "Royal", "Mamy",
+          "Azur", "Sen", "Dakar", "Kirène", "Patisen", "Ardo", "Soleil", "Sotiba"]
+SYLLABLES = ["ba", "ko", "mi", "na", "sa", "ti", "lu", "re", "do", "fa", "ga", "ja", "ke", "lo",
+             "ma", "ne", "po", "ri", "se", "to", "vu", "wa", "ya", "zo", "bi", "da", "fe", "gu"]
+SIZES = ["250g", "500g", "1kg", "5kg", "25kg", "50cl", "1L", "5L", "20L", "x12", "x24"]
+
+
+# Function to make up a brand-like word from syllables
+def make_word(rng, syllables=(2, 4)):
+    return "".join(rng.choice(SYLLABLES) for _ in range(rng.randint(*syllables)))
+
+
+# Function to build `size` distinct synthetic product names: common product words and
+# qualifiers combined with a long tail of made-up brands and variants, as in a real catalog
+def make_names(size, seed=7):
+    rng = random.Random(seed)
+    brands = BRANDS + [make_word(rng).capitalize() for _ in range(max(100, size // 25))]
+    variants = [make_word(rng, (2, 3)) for _ in range(max(100, size // 50))]
+    names = set()
+    while len(names) < size:
+        names.add(f"{rng.choice(PRODUCTS)} {rng.choice(QUALIFIERS)} {rng.choice(brands)} "
+                  f"{rng.choice(variants)} {rng.choice(SIZES)}")
+    return sorted(names)
+
+
+# Function to introduce typing/transcription mistakes into a name
+def misspell(name, rng, edits=2):
+    chars = list(name)
+    for _ in range(edits):
+        position = rng.randrange(len(chars))
+        action = rng.random()
+        if action < 0.4:
+            chars[position] = rng.choice("abcdefghijklmnopqrstuvwxyz")
+        elif action < 0.7 and len(chars) > 3:
+            del chars[position]
+        else:
+            chars.insert(position, rng.choice("abcdefghijklmnopqrstuvwxyz"))
+    return "".join(chars)
+
+
+def time_lookups(catalog, queries):
+    latencies = []
+    hits = 0
+    for query, expected in queries:
+        start = time.perf_counter()
+        match = catalog.best_match(query)
+        latencies.append(time.perf_counter() - start)
+        hits += match is not None and (expected is None or match[1].name == expected)
+    return latencies, hits
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark fuzzy lookups in the product catalog index.")
+    parser.add_argument("--size", type=int, default=100000, help="Products in the synthetic catalog")
+    parser.add_argument("--queries", type=int, default=2000, help="Lookups per query kind")
+    args = parser.parse_args(argv)
+
+    rng = random.Random(11)
+    names = make_names(args.size)
+    rss_before, _ = rss_mb()
+    start = time.perf_counter()
+    catalog = ProductCatalog()
+    for name in names:
+        catalog.add(name, company=name.split()[-3])
+    build = time.perf_counter() - start
+    rss_after, _ = rss_mb()
+    print(f"built {len(catalog):,} products in {build:.1f} s, "
+          f"index ~{(rss_after or 0) - (rss_before or 0):.0f} MB")
+
+    sample = rng.sample(names, min(args.queries, len(names)))
+    kinds = {
+        "exact": [(name, name) for name in sample],
+        "misspelled": [(misspell(name, rng), name) for name in sample],
+        "unknown": [(f"{rng.choice(PRODUCTS)} inconnu {rng.randint(1, 10 ** 6)}", None) for _ in sample],
+    }
+    print(f"{'query':<12}{'p50_us':>10}{'p99_us':>10}{'matched':>10}")
+    for kind, queries in kinds.items():
+        latencies, hits = time_lookups(catalog, queries)
+        print(f"{kind:<12}{percentile(latencies, 0.5) * 1e6:>10.0f}{percentile(latencies, 0.99) * 1e6:>10.0f}"
+              f"{hits / len(queries):>10.2%}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
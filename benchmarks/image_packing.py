@@ -0,0 +1,109 @@
+import argparse
+import io
+import json
+import os
+import sys
+import time
+
+from benchmarks.mock_servers import MockOpenAIServer, MockTranscriptionServer
+from benchmarks.run_benchmarks import load_api_functions
+
+# Multi-image packing benchmark: the same small images are extracted with one request
+# per image (extract_image_product_info_batch), packed several per request
+# (extract_image_product_info_packed), and front/back pairs with one request per pair
+# (extract_image_product_info_views) against two single calls. Reports model calls,
+# billed tokens, fallbacks and wall time. Run from the repository root:
+#
+#   python -m benchmarks.image_packing
+#   python -m benchmarks.image_packing --images 12 --pack-drop-rate 0.1 --detail high
+
+
+# Function to build a phone photo of a small item, already close to the upload size
+def make_item_photo(width=960, height=1280):
+    from PIL import Image
+
+    small = Image.frombytes("RGB", (width // 16, height // 16), os.urandom((width // 16) * (height // 16) * 3))
+    buffer = io.BytesIO()
+    small.resize((width, height), Image.BICUBIC).save(buffer, format="JPEG", quality=90)
+    return buffer.getvalue()
+
+
+# Function to run `operation` and report the calls, tokens and time it cost
+def measure(name, operation, server, api):
+    server.reset_stats()
+    api.metrics.reset()
+    start = time.perf_counter()
+    results = operation()
+    wall = time.perf_counter() - start
+    stages = api.metrics.snapshot()
+    fallbacks = stages.get("image.pack.fallback", {}).get("duration_seconds", {}).get("count", 0)
+    return {
+        "mode": name,
+        "results": len(results),
+        "errors": sum(error is not None for error in results),
+        "calls": server.stats["requests"],
+        "prompt_tokens": server.stats["prompt_tokens"],
+        "completion_tokens": server.stats["completion_tokens"],
+        "fallbacks": fallbacks,
+        "wall_seconds": wall,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare packed multi-image requests with one call per image.")
+    parser.add_argument("--images", type=int, default=8, help="Images per run (front/back pairs: half as many)")
+    parser.add_argument("--workers", type=int, default=4, help="Concurrent requests")
+    parser.add_argument("--detail", choices=["low", "high", "auto"], default="auto", help="OpenAI image detail level")
+    parser.add_argument("--openai-latency", default="lognormal:0.8:0.3", help="Mock OpenAI latency per request")
+    parser.add_argument("--image-latency", type=float, default=0.15, help="Mock latency added per image in a request")
+    parser.add_argument("--pack-drop-rate", type=float, default=0.0,
+                        help="Fraction of images a packed reply leaves out (forces fallbacks)")
+    parser.add_argument("--json", help="Also write the results to this JSON file")
+    args = parser.parse_args(argv)
+
+    openai_server = MockOpenAIServer(
+        latency=args.openai_latency, image_latency=args.image_latency, pack_drop_rate=args.pack_drop_rate,
+    ).start()
+    transcription_server = MockTranscriptionServer().start()
+    try:
+        api = load_api_functions(openai_server.url, transcription_server.url)
+        # No hedged duplicates, so the call and token counts compare the modes only
+        api.HEDGE_REQUESTS = False
+        images = [make_item_photo() for _ in range(args.images)]
+        pairs = [images[i:i + 2] for i in range(0, len(images) - 1, 2)]
+        options = {"detail": args.detail}
+
+        def batch_errors(results):
+            return [error for _, _, _, error in results]
+
+        def pairs_one_by_one():
+            return [None for pair in pairs for image in pair if api.extract_image_product_info(image, **options)]
+
+        def pairs_as_views():
+            return [None for pair in pairs if api.extract_image_product_info_views(pair, **options)]
+
+        results = [
+            measure("one per image", lambda: batch_errors(api.extract_image_product_info_batch(
+                images, max_workers=args.workers, **options)), openai_server, api),
+            measure("packed", lambda: batch_errors(api.extract_image_product_info_packed(
+                images, max_workers=args.workers, **options)), openai_server, api),
+            measure("pairs, 2 calls", pairs_one_by_one, openai_server, api),
+            measure("pairs, views", pairs_as_views, openai_server, api),
+        ]
+    finally:
+        openai_server.stop()
+        transcription_server.stop()
+
+    print(f"{'mode':<15} {'results':>7} {'errors':>6} {'calls':>5} {'prompt tok':>10} {'reply tok':>9} "
+          f"{'fallbacks':>9} {'wall s':>7}")
+    for r in results:
+        print(f"{r['mode']:<15} {r['results']:>7} {r['errors']:>6} {r['calls']:>5} {r['prompt_tokens']:>10,} "
+              f"{r['completion_tokens']:>9,} {r['fallbacks']:>9} {r['wall_seconds']:>7.2f}")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,86 @@
+import argparse
+import os
+import re
+import statistics
+import subprocess
+import sys
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Cold-start benchmark: imports modules in fresh interpreters (as a worker process or
+# the CLI would) and reports the wall time, plus the slowest imports seen by
+# `python -X importtime`. Run from the repository root:
+#
+#   python -m benchmarks.import_time
+#   python -m benchmarks.import_time --modules Api_Functions,Extraction_Service --runs 20
+
+# Placeholder credentials: importing must not need real ones
+IMPORT_ENV = {
+    "OPENAI_API_KEY": "import-benchmark",
+    "ANDAKIA_API_KEY": "import-benchmark",
+    "API_URL": "http://127.0.0.1:9/transcribe",
+}
+
+
+def _environment():
+    env = dict(os.environ, **IMPORT_ENV)
+    env["PYTHONPATH"] = REPO_ROOT + os.pathsep + env.get("PYTHONPATH", "")
+    env.pop("PYTHONDONTWRITEBYTECODE", None)
+    return env
+
+
+# Function to time `import module` in a fresh interpreter, minus the bare interpreter start-up
+def time_import(module, runs, baseline=0.0):
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, "-c", f"import {module}"], env=_environment(), check=True, cwd=REPO_ROOT)
+        timings.append(time.perf_counter() - start - baseline)
+    return timings
+
+
+# Function to list the imports with the largest cumulative time for a module
+def slowest_imports(module, top=10):
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        env=_environment(), cwd=REPO_ROOT, capture_output=True, text=True, check=True,
+    )
+    rows = []
+    for line in completed.stderr.splitlines():
+        match = re.match(r"import time:\s+(\d+) \|\s+(\d+) \|(\s*)(\S+)", line)
+        if match:
+            rows.append((int(match.group(2)), (len(match.group(3)) - 1) // 2, match.group(4)))
+    # Children are listed before their parent: keep the direct children of `module`
+    # (and the module itself), leaving out interpreter start-up imports such as site
+    selected = []
+    owner = None
+    for cumulative, depth, name in reversed(rows):
+        if depth == 0:
+            owner = name
+        if owner == module and depth <= 1:
+            selected.append((cumulative, depth, name))
+    return sorted(selected, reverse=True)[:top]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure cold import time of the extraction modules.")
+    parser.add_argument("--modules", default="Api_Functions,Batch_Extraction", help="Comma-separated modules")
+    parser.add_argument("--runs", type=int, default=10, help="Fresh interpreters per module")
+    parser.add_argument("--top", type=int, default=8, help="Slowest imports to list per module")
+    args = parser.parse_args(argv)
+
+    baseline = statistics.median(time_import("sys", args.runs))
+    print(f"interpreter start-up: {baseline * 1000:.0f} ms (subtracted below)")
+    for module in args.modules.split(","):
+        module = module.strip()
+        timings = time_import(module, args.runs, baseline)
+        print(f"\n{module}: median {statistics.median(timings) * 1000:.0f} ms, "
+              f"max {max(timings) * 1000:.0f} ms over {args.runs} runs")
+        for cumulative, depth, name in slowest_imports(module, args.top):
+            print(f"  {cumulative / 1000:8.1f} ms  {'  ' * depth}{name}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
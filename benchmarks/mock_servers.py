@@ -0,0 +1,255 @@
+import base64
+import io
+import json
+import math
+import os
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+RECORDED_RESPONSES = os.path.join(os.path.dirname(__file__), "recorded_responses.json")
+
+
+# Function to build a latency sampler from a spec such as "0.2", "uniform:0.1:0.5"
+# or "lognormal:0.8:0.4" (median seconds, sigma)
+def parse_latency(spec):
+    parts = str(spec).split(":")
+    if len(parts) == 1:
+        value = float(parts[0])
+        return lambda: value
+    kind, *params = parts
+    params = [float(p) for p in params]
+    if kind == "fixed":
+        return lambda: params[0]
+    if kind == "uniform":
+        return lambda: random.uniform(params[0], params[1])
+    if kind == "lognormal":
+        median, sigma = params
+        return lambda: random.lognormvariate(math.log(median), sigma)
+    raise ValueError(f"Unknown latency distribution: {spec}")
+
+
+class MockServer:
+    """
+    Local stand-in for a remote API. Replays recorded responses after a sampled delay
+    and injects 5xx errors and 429s at the configured rates. Counts requests and bytes
+    in both directions so benchmarks can report traffic on the wire. With
+    `upload_bandwidth` (bytes per second) request bodies also take the time a client
+    uplink of that speed would need to send them. With `request_quota` (requests per
+    second) it enforces a provider limit: requests beyond it get 429 and a Retry-After.
+    """
+
+    def __init__(self, latency="0", error_rate=0.0, rate_limit_rate=0.0, retry_after=0.1,
+                 upload_bandwidth=None, request_quota=None, quota_burst_seconds=1.0,
+                 responses_path=RECORDED_RESPONSES):
+        self.sample_latency = parse_latency(latency)
+        self.request_quota = request_quota
+        self.quota_capacity = request_quota * quota_burst_seconds if request_quota else None
+        self._quota = (self.quota_capacity, time.monotonic())
+        self.upload_bandwidth = upload_bandwidth
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after = retry_after
+        with open(responses_path, encoding="utf-8") as f:
+            self.responses = json.load(f)
+        self.stats = {"requests": 0, "errors": 0, "rate_limited": 0, "over_quota": 0, "bytes_in": 0, "bytes_out": 0}
+        self._lock = threading.Lock()
+        self._server = None
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def count(self, **increments):
+        with self._lock:
+            for key, value in increments.items():
+                self.stats[key] += value
+
+    def reset_stats(self):
+        with self._lock:
+            for key in self.stats:
+                self.stats[key] = 0
+
+    def latency_for(self, body):
+        return self.sample_latency()
+
+    def take_quota(self):
+        """
+        Take one request from the quota bucket; returns None, or the seconds until one is free.
+        """
+        if not self.request_quota:
+            return None
+        with self._lock:
+            available, updated = self._quota
+            now = time.monotonic()
+            available = min(self.quota_capacity, available + (now - updated) * self.request_quota)
+            if available >= 1:
+                self._quota = (available - 1, now)
+                return None
+            self._quota = (available, now)
+            return (1 - available) / self.request_quota
+
+    def upload_seconds(self, body):
+        return len(body) / self.upload_bandwidth if self.upload_bandwidth else 0.0
+
+    def pick(self, kind):
+        return random.choice(self.responses[kind])
+
+    def handle(self, path, body):
+        """
+        Return (status, payload dict) for a request; implemented by subclasses.
+        """
+        raise NotImplementedError
+
+    def _handler_class(self):
+        mock = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                body = self.rfile.read(length)
+                mock.count(requests=1, bytes_in=len(body) + len(str(self.headers)))
+                # Requests over the quota are turned away at once, the others take their time
+                over_quota = mock.take_quota()
+                time.sleep(mock.upload_seconds(body) + (mock.latency_for(body) if over_quota is None else 0))
+
+                headers = {}
+                draw = random.random()
+                if over_quota is not None:
+                    mock.count(over_quota=1)
+                    status, payload = 429, {"error": {"message": "Rate limit reached", "type": "rate_limit"}}
+                    headers["Retry-After"] = f"{over_quota:.3f}"
+                elif draw < mock.rate_limit_rate:
+                    mock.count(rate_limited=1)
+                    status, payload = 429, {"error": {"message": "Rate limit reached", "type": "rate_limit"}}
+                    headers["Retry-After"] = str(mock.retry_after)
+                elif draw < mock.rate_limit_rate + mock.error_rate:
+                    mock.count(errors=1)
+                    status, payload = 500, {"error": {"message": "Injected server error", "type": "server_error"}}
+                else:
+                    status, payload = mock.handle(self.path, body)
+
+                out = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(out)))
+                for key, value in headers.items():
+                    self.send_header(key, value)
+                self.end_headers()
+                self.wfile.write(out)
+                mock.count(bytes_out=len(out))
+
+        return Handler
+
+    def start(self, host="127.0.0.1", port=0):
+        self._server = ThreadingHTTPServer((host, port), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+
+
+# Function to estimate the billed tokens of a data-URL image part like the provider does
+def image_part_tokens(part):
+    from Image_Preprocessing import estimate_image_tokens, load_pillow
+
+    detail = part["image_url"].get("detail", "auto")
+    Image, _ = load_pillow()
+    width, height = 1024, 1024
+    if Image is not None:
+        try:
+            data = base64.b64decode(part["image_url"]["url"].split(",", 1)[1])
+            width, height = Image.open(io.BytesIO(data)).size
+        except (IndexError, ValueError, OSError):
+            # Not a base64 data URI of an image Pillow can read: bill a mid-sized image
+            pass
+    return estimate_image_tokens(width, height, detail=detail)
+
+
+class MockOpenAIServer(MockServer):
+    """
+    Minimal /v1/chat/completions: image requests get a recorded product reply, text
+    requests a recorded transaction reply. Requests for the "image_products" schema
+    get one indexed entry per image, of which `pack_drop_rate` are left out to
+    exercise fallbacks. Token usage counts text by size and images by their pixel
+    size, and totals are kept in `stats`. `model_latency` maps model names to their
+    own latency specs (e.g. a faster mini model); `image_latency` seconds are added
+    per image in the request.
+    """
+
+    def __init__(self, model_latency=None, pack_drop_rate=0.0, image_latency=0.0, **kwargs):
+        super().__init__(**kwargs)
+        self.image_latency = image_latency
+        self.model_latency = {model: parse_latency(spec) for model, spec in (model_latency or {}).items()}
+        self.pack_drop_rate = pack_drop_rate
+        self.stats.update(prompt_tokens=0, completion_tokens=0)
+
+    def latency_for(self, body):
+        try:
+            request = json.loads(body or b"{}")
+        except ValueError:
+            request = {}
+        images = sum(
+            part.get("type") == "image_url"
+            for m in request.get("messages", []) if isinstance(m.get("content"), list) for part in m["content"]
+        )
+        sampler = self.model_latency.get(request.get("model"), self.sample_latency)
+        return sampler() + self.image_latency * images
+
+    def handle(self, path, body):
+        request = json.loads(body or b"{}")
+        messages = request.get("messages", [])
+        parts = [part for m in messages if isinstance(m.get("content"), list) for part in m["content"]]
+        images = [part for part in parts if part.get("type") == "image_url"]
+        text = "".join(m["content"] for m in messages if isinstance(m.get("content"), str))
+        text += "".join(part.get("text", "") for part in parts)
+        schema_name = ((request.get("response_format") or {}).get("json_schema") or {}).get("name")
+        if schema_name == "image_products":
+            entries = [
+                {"index": index, **json.loads(self.pick("image"))}
+                for index in range(len(images)) if random.random() >= self.pack_drop_rate
+            ]
+            content = json.dumps({"products": entries}, ensure_ascii=False)
+        else:
+            content = self.pick("image" if images else "products")
+        prompt_tokens = max(1, len(text) // 4) + sum(image_part_tokens(part) for part in images)
+        completion_tokens = max(1, len(content) // 4)
+        self.count(prompt_tokens=prompt_tokens, completion_tokens=completion_tokens)
+        return 200, {
+            "id": f"chatcmpl-mock-{random.getrandbits(32):08x}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": request.get("model", "mock"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": content},
+                "finish_reason": "stop",
+            }],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+            },
+        }
+
+
+class MockTranscriptionServer(MockServer):
+    """
+    Stand-in for the speech-to-text backend: any multipart POST gets a recorded transcription.
+    """
+
+    def handle(self, path, body):
+        return 200, {"transcription": self.pick("transcription")}
@@ -0,0 +1,144 @@
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.mock_servers import MockOpenAIServer, MockTranscriptionServer
+from benchmarks.run_benchmarks import load_api_functions, percentile
+
+# Shared rate limiter benchmark: several processes (standing in for Streamlit servers,
+# service workers and batch jobs) call extract_products against a mock OpenAI server
+# that enforces a request quota, with and without the shared limiter (Rate_Limiter.py).
+# Reports accepted throughput against the quota, 429s, failed calls and latency per
+# priority class. Run from the repository root:
+#
+#   python -m benchmarks.rate_limits
+#   python -m benchmarks.rate_limits --processes 6 --threads 8 --quota 20 --seconds 20
+
+# Never parsed locally, so every call reaches the model
+TEXT = "Bon, le voisin a pris cinq kilos de riz et deux savons, il règle vendredi prochain je crois."
+
+
+# Function run in each worker process: `threads` callers loop on extract_products until `seconds` pass
+def worker(openai_url, transcription_url, limiter_db, requests_per_minute, priority, threads, seconds, queue, start):
+    if requests_per_minute:
+        os.environ["OPENAI_RPM"] = str(requests_per_minute)
+        os.environ["RATE_LIMIT_DB"] = limiter_db
+    api = load_api_functions(openai_url, transcription_url)
+    from Rate_Limiter import priority_scope
+
+    # Build the client and limiter first, then all processes start calling together
+    api.get_openai_client()
+    api.get_openai_limiter()
+    queue.put("ready")
+    start.wait()
+    stop_at = time.monotonic() + seconds
+
+    def caller(_):
+        latencies, errors = [], 0
+        with priority_scope(priority):
+            while time.monotonic() < stop_at:
+                began = time.perf_counter()
+                try:
+                    api.extract_products(TEXT)
+                    latencies.append(time.perf_counter() - began)
+                except Exception:
+                    errors += 1
+        return latencies, errors
+
+    latencies, errors = [], 0
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        for thread_latencies, thread_errors in executor.map(caller, range(threads)):
+            latencies += thread_latencies
+            errors += thread_errors
+    queue.put({"priority": priority, "latencies": latencies, "errors": errors})
+
+
+# Function to run one configuration and summarize it
+def run(args, openai_server, transcription_server, use_limiter):
+    openai_server.reset_stats()
+    requests_per_minute = args.quota * 60 if use_limiter else None
+    limiter_db = os.path.join(tempfile.mkdtemp(prefix="ratelimit-bench-"), "limits.sqlite")
+    context = multiprocessing.get_context("spawn")
+    queue = context.Queue()
+    start = context.Event()
+    processes = []
+    for index in range(args.processes):
+        # The last `batch_processes` processes are batch jobs, the others interactive sessions
+        priority = "batch" if index >= args.processes - args.batch_processes else "interactive"
+        process = context.Process(target=worker, args=(
+            openai_server.url, transcription_server.url, limiter_db, requests_per_minute,
+            priority, args.threads, args.seconds, queue, start,
+        ))
+        process.start()
+        processes.append(process)
+    for _ in processes:
+        queue.get()
+    openai_server.reset_stats()
+    start.set()
+    reports = [queue.get() for _ in processes]
+    for process in processes:
+        process.join()
+
+    summary = {
+        "limiter": use_limiter,
+        "completed": sum(len(r["latencies"]) for r in reports),
+        "failed": sum(r["errors"] for r in reports),
+        "requests": openai_server.stats["requests"],
+        "rate_limited": openai_server.stats["over_quota"],
+    }
+    summary["throughput"] = summary["completed"] / args.seconds
+    summary["quota_used"] = summary["throughput"] / args.quota
+    for priority in ("interactive", "batch"):
+        latencies = [value for r in reports if r["priority"] == priority for value in r["latencies"]]
+        summary[f"{priority}_completed"] = len(latencies)
+        summary[f"{priority}_p50_ms"] = percentile(latencies, 0.5) * 1000 if latencies else None
+        summary[f"{priority}_p95_ms"] = percentile(latencies, 0.95) * 1000 if latencies else None
+    return summary
+
+
+def _ms(value):
+    return f"{value:.0f}" if value is not None else "-"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare callers with and without the shared rate limiter.")
+    parser.add_argument("--processes", type=int, default=4, help="Worker processes sharing the API key")
+    parser.add_argument("--batch-processes", type=int, default=1, help="How many of them run batch work")
+    parser.add_argument("--threads", type=int, default=8, help="Concurrent callers per process")
+    parser.add_argument("--seconds", type=float, default=15.0, help="Duration of each run")
+    parser.add_argument("--quota", type=float, default=20.0, help="Mock provider quota in requests per second")
+    parser.add_argument("--openai-latency", default="lognormal:0.2:0.3", help="Mock OpenAI latency")
+    parser.add_argument("--json", help="Also write the results to this JSON file")
+    args = parser.parse_args(argv)
+
+    openai_server = MockOpenAIServer(latency=args.openai_latency, request_quota=args.quota).start()
+    transcription_server = MockTranscriptionServer().start()
+    results = []
+    try:
+        for use_limiter in (False, True):
+            print(f"Running {'with' if use_limiter else 'without'} the shared limiter...", file=sys.stderr)
+            results.append(run(args, openai_server, transcription_server, use_limiter))
+    finally:
+        openai_server.stop()
+        transcription_server.stop()
+
+    print(f"{'limiter':<8} {'done/s':>7} {'quota':>6} {'failed':>7} {'requests':>9} {'429s':>6} "
+          f"{'inter done':>10} {'inter p50':>10} {'inter p95':>10} {'batch done':>10} {'batch p50':>10} {'batch p95':>10}")
+    for r in results:
+        print(f"{'on' if r['limiter'] else 'off':<8} {r['throughput']:>7.1f} {r['quota_used']:>6.0%} {r['failed']:>7} "
+              f"{r['requests']:>9} {r['rate_limited']:>6} {r['interactive_completed']:>10} "
+              f"{_ms(r['interactive_p50_ms']):>10} {_ms(r['interactive_p95_ms']):>10} {r['batch_completed']:>10} "
+              f"{_ms(r['batch_p50_ms']):>10} {_ms(r['batch_p95_ms']):>10}")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
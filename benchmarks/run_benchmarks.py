@@ -0,0 +1,284 @@
+import argparse
+import io
+import json
+import math
+import os
+import random
+import resource
+import struct
+import sys
+import time
+import wave
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.mock_servers import MockOpenAIServer, MockTranscriptionServer
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Offline benchmark / load test for Api_Functions.
+# Starts local stand-ins for OpenAI and the transcription backend, drives the extraction
+# functions and simulated Streamlit sessions through them, and reports p50/p95/p99 latency,
+# throughput, RSS and bytes on the wire. Run from the repository root:
+#
+#   python -m benchmarks.run_benchmarks --iterations 50 --concurrency 8
+#   python -m benchmarks.run_benchmarks --openai-latency lognormal:0.8:0.4 --rate-limit-rate 0.05
+#   python -m benchmarks.run_benchmarks --scenarios transcription,transcription_raw --upload-bandwidth 250000
+#   python -m benchmarks.run_benchmarks --scenarios image,products --openai-latency lognormal:0.6:1.0 --no-hedge
+
+
+# Function to import Api_Functions wired to the mock servers
+def load_api_functions(openai_url, transcription_url):
+    # Credentials are read lazily from the environment, no secrets file needed
+    os.environ["OPENAI_API_KEY"] = "bench"
+    os.environ["OPENAI_BASE_URL"] = f"{openai_url}/v1"
+    os.environ["ANDAKIA_API_KEY"] = "bench"
+    os.environ["API_URL"] = f"{transcription_url}/transcribe"
+    if REPO_ROOT not in sys.path:
+        sys.path.insert(0, REPO_ROOT)
+
+    import Api_Clients
+    import Api_Functions
+
+    Api_Clients.reset_clients()
+    return Api_Functions
+
+
+# Function to build a phone-camera-like JPEG (smooth content, several megapixels)
+def make_sample_image(width=3024, height=4032):
+    from PIL import Image
+
+    small = Image.frombytes("RGB", (width // 16, height // 16), os.urandom((width // 16) * (height // 16) * 3))
+    buffer = io.BytesIO()
+    small.resize((width, height), Image.BICUBIC).save(buffer, format="JPEG", quality=92)
+    return buffer.getvalue()
+
+
+# Function to build a 44.1 kHz stereo WAV with speech-like bursts separated by pauses,
+# after `lead_silence` seconds of silence (recordings rarely start on the first word)
+def make_sample_audio(seconds=20, rate=44100, channels=2, lead_silence=1.0):
+    frames = bytearray(b"\x00\x00" * channels * int(rate * lead_silence))
+    t = 0
+    while t < seconds:
+        for i in range(int(rate * 1.2)):
+            value = int(6000 * math.sin(i * 0.07) * (0.6 + 0.4 * math.sin(i * 0.0009)))
+            frames += struct.pack("<h", value) * channels
+        frames += b"\x00\x00" * channels * int(rate * 0.4)
+        t += 1.6
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as out:
+        out.setnchannels(channels)
+        out.setsampwidth(2)
+        out.setframerate(rate)
+        out.writeframes(bytes(frames))
+    return buffer.getvalue()
+
+
+# Nearest-rank percentile of a list of values
+def percentile(values, q):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, math.ceil(q * len(ordered)) - 1))]
+
+
+# Current and peak resident set size of this process, in MB
+def rss_mb():
+    current = None
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    current = int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    return current, peak
+
+
+# Function to run `operation` `iterations` times with `concurrency` threads and summarize it
+def run_scenario(name, operation, iterations, concurrency, servers):
+    for server in servers:
+        server.reset_stats()
+    latencies = []
+    errors = 0
+
+    def timed(_):
+        start = time.perf_counter()
+        try:
+            result = operation()
+        except Exception as e:
+            return time.perf_counter() - start, e
+        # transcribe_audio_file reports failures in its return value
+        if isinstance(result, str) and result.startswith("Error:"):
+            return time.perf_counter() - start, result
+        return time.perf_counter() - start, None
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for latency, error in executor.map(timed, range(iterations)):
+            latencies.append(latency)
+            errors += error is not None
+    wall = time.perf_counter() - start
+
+    current_rss, peak_rss = rss_mb()
+    return {
+        "scenario": name,
+        "operations": iterations,
+        "concurrency": concurrency,
+        "errors": errors,
+        "p50_ms": percentile(latencies, 0.50) * 1000,
+        "p95_ms": percentile(latencies, 0.95) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+        "throughput_ops": iterations / wall,
+        "wall_seconds": wall,
+        "requests": sum(s.stats["requests"] for s in servers),
+        "rate_limited": sum(s.stats["rate_limited"] for s in servers),
+        "bytes_sent": sum(s.stats["bytes_in"] for s in servers),
+        "bytes_received": sum(s.stats["bytes_out"] for s in servers),
+        "rss_mb": current_rss,
+        "peak_rss_mb": peak_rss,
+    }
+
+
+# Function to print results as an aligned table
+def print_report(results):
+    columns = [
+        ("scenario", "{}"), ("operations", "{}"), ("errors", "{}"), ("p50_ms", "{:.0f}"),
+        ("p95_ms", "{:.0f}"), ("p99_ms", "{:.0f}"), ("throughput_ops", "{:.2f}"),
+        ("requests", "{}"), ("bytes_sent", "{:,}"), ("bytes_received", "{:,}"), ("peak_rss_mb", "{:.0f}"),
+    ]
+    rows = [[fmt.format(r[key]) if r.get(key) is not None else "-" for key, fmt in columns] for r in results]
+    widths = [max(len(key), *(len(row[i]) for row in rows)) for i, (key, _) in enumerate(columns)]
+    print("  ".join(key.ljust(w) for (key, _), w in zip(columns, widths)))
+    for row in rows:
+        print("  ".join(value.ljust(w) for value, w in zip(row, widths)))
+
+
+# Function to measure audio preprocessing on the sample recording (time and bytes saved)
+def audio_preprocessing_report(api, runs=5):
+    audio = make_sample_audio()
+    timings = []
+    for _ in range(runs):
+        report = {}
+        start = time.perf_counter()
+        api.prepare_audio(audio, "note.wav", report=report)
+        timings.append(time.perf_counter() - start)
+    report["preprocess_ms"] = percentile(timings, 0.5) * 1000
+    return report
+
+
+# Function to print the audio preprocessing summary
+def print_audio_report(report):
+    print()
+    saved = 1 - report["processed_bytes"] / report["original_bytes"]
+    print(f"audio     {report['original_bytes']:,} -> {report['processed_bytes']:,} bytes ({saved:.0%} saved), "
+          f"{report['original_rate']} Hz x{report['original_channels']} -> {report['processed_rate']} Hz mono "
+          f"{report['codec']}, {report['trimmed_seconds']:.1f}s trimmed, {report['preprocess_ms']:.0f} ms to preprocess")
+
+
+# Function to print how often each cascade tier answered on its own
+def print_routes(routes):
+    print()
+    for task, models in routes.items():
+        for model, stats in models.items():
+            if not stats["calls"]:
+                continue
+            print(f"{task:<9} {model:<12} calls={stats['calls']:<5} hit_rate={stats['hit_rate']:.2f} "
+                  f"escalated={stats['escalated']:<5} mean_ms={stats['mean_seconds'] * 1000:.0f}")
+
+
+# Function to print how often model calls were hedged and what it saved
+def print_hedging(hedging):
+    print()
+    if not hedging["calls"]:
+        return
+    win_rate = hedging["hedge_win_rate"]
+    print(f"hedging   calls={hedging['calls']} hedged={hedging['hedged']} ({hedging['hedge_rate']:.1%}) "
+          f"capped={hedging['capped']} vetoed={hedging['vetoed']} hedge_wins={hedging['hedge_wins']} "
+          f"win_rate={'-' if win_rate is None else f'{win_rate:.2f}'} saved={hedging['saved_seconds']:.1f}s")
+
+
+def build_scenarios(api):
+    image = make_sample_image()
+    audio = make_sample_audio()
+    texts = [
+        "Madame Sakho a acheté deux sacs de riz à cinq mille francs, elle paiera vendredi prochain.",
+        "J'ai acheté trois bidons d'huile à mille cinq cents et un paquet de sucre à huit cents.",
+        # Not understood locally: always reaches the model
+        "Bon, le voisin a pris cinq kilos de riz et deux savons, il règle vendredi prochain je crois.",
+    ]
+
+    def session():
+        # One simulated Streamlit session turn: a capture, then a voice note
+        api.extract_image_product_info(image)
+        transcription = api.transcribe_audio_file(audio, filename="note.wav")
+        api.extract_products(transcription)
+        return transcription
+
+    return {
+        "image": lambda: api.extract_image_product_info(image),
+        "transcription": lambda: api.transcribe_audio_file(audio, filename="note.wav"),
+        # Uploads the recording as recorded, without Audio_Preprocessing
+        "transcription_raw": lambda: api.transcribe_audio_file(audio, filename="note.wav", preprocess=False),
+        "products": lambda: api.extract_products(random.choice(texts)),
+        "sessions": session,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Offline benchmarks against local mock servers.")
+    parser.add_argument("--scenarios", default="image,transcription,products,sessions",
+                        help="Comma-separated scenarios to run")
+    parser.add_argument("--iterations", type=int, default=40, help="Operations per scenario")
+    parser.add_argument("--concurrency", type=int, default=8, help="Concurrent callers per scenario")
+    parser.add_argument("--sessions", type=int, default=10, help="Concurrent simulated Streamlit sessions")
+    parser.add_argument("--openai-latency", default="lognormal:0.6:0.4",
+                        help='Mock OpenAI latency: seconds, "uniform:a:b" or "lognormal:median:sigma"')
+    parser.add_argument("--transcription-latency", default="lognormal:1.0:0.3",
+                        help="Mock transcription latency, same format")
+    parser.add_argument("--upload-bandwidth", type=float,
+                        help="Simulated client uplink in bytes/s for request bodies, e.g. 250000 for 2 Mbit/s")
+    parser.add_argument("--model-latency", action="append", default=[], metavar="MODEL=SPEC",
+                        help="Per-model OpenAI latency, e.g. gpt-4o-mini=lognormal:0.3:0.3 (repeatable)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of 500 responses")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="Fraction of 429 responses")
+    parser.add_argument("--retry-after", type=float, default=0.1, help="Retry-After sent with 429s")
+    parser.add_argument("--no-hedge", action="store_true", help="Disable hedged model calls (for comparison)")
+    parser.add_argument("--json", help="Also write the results to this JSON file")
+    args = parser.parse_args(argv)
+
+    faults = dict(error_rate=args.error_rate, rate_limit_rate=args.rate_limit_rate, retry_after=args.retry_after,
+                  upload_bandwidth=args.upload_bandwidth)
+    model_latency = dict(spec.split("=", 1) for spec in args.model_latency)
+    openai_server = MockOpenAIServer(latency=args.openai_latency, model_latency=model_latency, **faults).start()
+    transcription_server = MockTranscriptionServer(latency=args.transcription_latency, **faults).start()
+    servers = [openai_server, transcription_server]
+    try:
+        api = load_api_functions(openai_server.url, transcription_server.url)
+        api.HEDGE_REQUESTS = not args.no_hedge
+        scenarios = build_scenarios(api)
+        results = []
+        for name in args.scenarios.split(","):
+            name = name.strip()
+            concurrency = args.sessions if name == "sessions" else args.concurrency
+            print(f"Running {name} ({args.iterations} ops, concurrency {concurrency})...", file=sys.stderr)
+            results.append(run_scenario(name, scenarios[name], args.iterations, concurrency, servers))
+        routes = api.cascade_stats()
+        hedging = api.hedge_stats()
+        audio_report = audio_preprocessing_report(api)
+    finally:
+        for server in servers:
+            server.stop()
+
+    print_report(results)
+    print_routes(routes)
+    print_hedging(hedging)
+    print_audio_report(audio_report)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"scenarios": results, "routes": routes, "hedging": hedging, "audio": audio_report}, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
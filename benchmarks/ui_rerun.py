@@ -0,0 +1,104 @@
+import argparse
+import io
+import os
+import statistics
+import sys
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Streamlit rerun benchmark: runs Extraction_app.py headless (streamlit.testing AppTest)
+# with chat histories of increasing length and reports the wall time of a full rerun
+# (AppTest overhead included), the time spent in the app script itself, and the time
+# spent in the mode's fragment, which is all a rerun triggered from inside the mode
+# costs. Run from the repository root:
+#
+#   python -m benchmarks.ui_rerun
+#   python -m benchmarks.ui_rerun --lengths 0,50,200,1000 --runs 20
+
+# Placeholder credentials: rendering must not call any backend
+APP_ENV = {
+    "OPENAI_API_KEY": "ui-benchmark",
+    "ANDAKIA_API_KEY": "ui-benchmark",
+    "API_URL": "http://127.0.0.1:9/transcribe",
+}
+
+
+# Function to build a small JPEG like the thumbnails kept in the history
+def make_thumbnail():
+    from PIL import Image
+
+    buffer = io.BytesIO()
+    Image.frombytes("RGB", (24, 32), os.urandom(24 * 32 * 3)).resize((180, 240)).save(buffer, format="JPEG", quality=70)
+    return buffer.getvalue()
+
+
+# Function to fill image and audio chat histories with `length` exchanges each
+def make_histories(app, length):
+    from Chat_History import ChatHistory
+
+    thumbnail = make_thumbnail()
+    image_history = ChatHistory(max_entries=2 * length + 2, memory_budget=float("inf"))
+    audio_history = ChatHistory(max_entries=length + 1, memory_budget=float("inf"))
+    result = {
+        "person_name": "Madame Sakho",
+        "products": [{"product_name": "Riz parfumé 5kg", "quantity": 2, "price": 5000,
+                      "transaction_type": "vente", "payment_date": "2026-10-23"}],
+    }
+    for index in range(length):
+        image_history.add_image(b"", f"shelf_{index}.jpg", thumbnail=thumbnail)
+        image_history.add_message("system", f"Extracted Information: Product Name: Riz {index} Company: Acme")
+        audio_history.add_message("system", app.build_audio_message(
+            f"note_{index}.wav", "Madame Sakho a acheté deux sacs de riz à cinq mille francs.", result,
+        ))
+    return image_history, audio_history
+
+
+def _ms(seconds):
+    return f"{seconds * 1000:.1f}" if seconds is not None else "-"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure Streamlit rerun time against chat history length.")
+    parser.add_argument("--lengths", default="0,10,50,200", help="Comma-separated history lengths")
+    parser.add_argument("--runs", type=int, default=10, help="Reruns timed per length and mode")
+    parser.add_argument("--modes", default="image_extraction,speech_to_text", help="App modes to measure")
+    parser.add_argument("--app", default=os.path.join(REPO_ROOT, "Extraction_app.py"), help="Streamlit script to run")
+    args = parser.parse_args(argv)
+
+    os.environ.update(APP_ENV)
+    if REPO_ROOT not in sys.path:
+        sys.path.insert(0, REPO_ROOT)
+    from streamlit.testing.v1 import AppTest
+
+    import Extraction_app
+    from Instrumentation import metrics
+
+    print(f"{'mode':<17} {'history':>7} {'rerun p50 ms':>13} {'rerun max ms':>13} {'script p50 ms':>14} {'fragment p50 ms':>16}")
+    for mode in args.modes.split(","):
+        for length in [int(value) for value in args.lengths.split(",")]:
+            app = AppTest.from_file(args.app, default_timeout=120)
+            image_history, audio_history = make_histories(Extraction_app, length)
+            app.session_state["image_chat_history"] = image_history
+            app.session_state["audio_chat_history"] = audio_history
+            app.session_state["app_mode"] = mode
+            app.run()
+            metrics.reset()
+            timings = []
+            for _ in range(args.runs):
+                start = time.perf_counter()
+                app.run()
+                timings.append(time.perf_counter() - start)
+            if app.exception:
+                raise RuntimeError(app.exception[0].message)
+            stages = metrics.snapshot()
+            script, fragment = (
+                stages.get(stage, {}).get("duration_seconds", {}).get("p50") for stage in ("ui.app", f"ui.{mode}")
+            )
+            print(f"{mode:<17} {length:>7} {statistics.median(timings) * 1000:>13.1f} {max(timings) * 1000:>13.1f} "
+                  f"{_ms(script):>14} {_ms(fragment):>16}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
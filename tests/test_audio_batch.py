@@ -0,0 +1,36 @@
+import threading
+
+import Api_Functions
+
+
+class RecordingClient:
+    def __init__(self):
+        self.uploads = []
+        self._lock = threading.Lock()
+
+    def transcribe(self, audio, filename=None):
+        if audio == b"broken!":
+            raise RuntimeError("backend error")
+        with self._lock:
+            self.uploads.append((audio, filename))
+        return f"transcription of {filename}"
+
+
+def test_batch_transcription_preprocesses_every_file(monkeypatch, tmp_path):
+    client = RecordingClient()
+    monkeypatch.setattr(Api_Functions, "get_transcription_client", lambda: client)
+    monkeypatch.setattr(Api_Functions, "AUDIO_PREPROCESS", True)
+
+    def preprocess_audio(audio_bytes, filename, **options):
+        assert options["sample_rate"] == Api_Functions.AUDIO_SAMPLE_RATE
+        return audio_bytes + b"!", "prepared.ogg", {"original_bytes": len(audio_bytes)}
+
+    monkeypatch.setattr(Api_Functions, "preprocess_audio", preprocess_audio)
+    path = tmp_path / "note.wav"
+    path.write_bytes(b"from disk")
+    results = sorted(Api_Functions.transcribe_audio_files([b"first", str(path), b"broken"], max_workers=3))
+
+    assert sorted(client.uploads) == [(b"first!", "prepared.ogg"), (b"from disk!", "prepared.ogg")]
+    assert [transcription for _, _, transcription in results] == [
+        "transcription of prepared.ogg", "transcription of prepared.ogg", "Error: backend error",
+    ]
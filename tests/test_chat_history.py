@@ -0,0 +1,41 @@
+import gc
+import os
+
+from Chat_History import BlobStore, ChatHistory
+
+
+def test_blob_store_directory_is_removed_with_the_history(tmp_path):
+    history = ChatHistory(blob_store=BlobStore(parent=str(tmp_path)))
+    entry = history.add_image(b"not really an image", "photo.jpg")
+    assert history.original(entry) == b"not really an image"
+    directory = history.blob_store.directory
+    assert os.path.dirname(directory) == str(tmp_path)
+    history.close()
+    assert not os.path.exists(directory)
+
+
+def test_blob_store_of_a_dropped_session_is_removed(tmp_path):
+    history = ChatHistory(blob_store=BlobStore(parent=str(tmp_path)))
+    history.add_image(b"picture", "photo.jpg")
+    directory = history.blob_store.directory
+    del history
+    gc.collect()
+    assert not os.path.exists(directory)
+
+
+def test_cleared_history_keeps_storing(tmp_path):
+    history = ChatHistory(blob_store=BlobStore(parent=str(tmp_path)))
+    history.add_image(b"first", "first.jpg")
+    history.clear()
+    assert os.listdir(history.blob_store.directory) == []
+    entry = history.add_image(b"second", "second.jpg")
+    assert history.original(entry) == b"second"
+    history.close()
+
+
+def test_evicted_originals_are_deleted(tmp_path):
+    history = ChatHistory(max_entries=1, blob_store=BlobStore(parent=str(tmp_path)))
+    history.add_image(b"first", "first.jpg")
+    history.add_image(b"second", "second.jpg")
+    assert len(os.listdir(history.blob_store.directory)) == 1
+    history.close()
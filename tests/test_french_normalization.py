@@ -0,0 +1,90 @@
+from datetime import date
+
+import pytest
+
+from French_Normalization import normalize_transcript, parse_simple_transaction, replace_number_words, resolve_date
+
+# A Sunday
+TODAY = date(2026, 10, 18)
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("deux sacs à cinq mille", "2 sacs à 5000"),
+    ("neuf sacs de riz", "9 sacs de riz"),
+    ("un sac de riz", "1 sac de riz"),
+    ("vingt et un savons", "21 savons"),
+    ("quatre-vingt-dix-sept francs", "97 francs"),
+    ("5 mille francs", "5000 francs"),
+    # Articles and adjectives stay words
+    ("un peu de sucre", "un peu de sucre"),
+    ("un téléphone neuf", "1 téléphone neuf"),
+    ("un sac neuf à 2000", "1 sac neuf à 2000"),
+    ("c'est un bon client", "c'est un bon client"),
+    ("l'un des sacs", "l'un des sacs"),
+    ("il en veut un", "il en veut un"),
+])
+def test_replace_number_words(text, expected):
+    assert replace_number_words(text) == expected
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("mardi", date(2026, 10, 20)),
+    ("mardi prochain", date(2026, 10, 20)),
+    ("mardi dernier", date(2026, 10, 13)),
+    ("samedi passé", date(2026, 10, 17)),
+    ("dimanche dernier", date(2026, 10, 11)),
+    ("dans deux semaines", date(2026, 11, 1)),
+])
+def test_resolve_weekdays(text, expected):
+    assert resolve_date(text, TODAY) == expected
+
+
+def test_past_weekday_is_annotated_with_past_date():
+    text, dates = normalize_transcript("Elle a payé mardi dernier", TODAY)
+    assert text == "Elle a payé mardi dernier [2026-10-13]"
+    assert dates == [date(2026, 10, 13)]
+
+
+def test_units_are_not_product_names():
+    result = parse_simple_transaction("Madame Sakho a acheté deux cent cinquante grammes de sucre", TODAY)
+    assert result["products"] == [{
+        "product_name": "sucre", "quantity": 250, "unit": "g", "price": None,
+        "transaction_type": "vente", "payment_date": None,
+    }]
+    product = parse_simple_transaction("Moussa a acheté un litre d'huile", TODAY)["products"][0]
+    assert (product["product_name"], product["quantity"], product["unit"]) == ("huile", 1, "l")
+
+
+def test_price_per_unit_of_measure():
+    result = parse_simple_transaction("Madame Sakho a acheté deux kilos de riz à six cents le kilo", TODAY)
+    product = result["products"][0]
+    assert (product["quantity"], product["unit"], product["price"]) == (2, "kg", 600)
+    # The line price or the unit price? Left to the model
+    assert parse_simple_transaction("Madame Sakho a acheté deux kilos de riz à six cents francs", TODAY) is None
+
+
+def test_prices_are_per_item():
+    result = parse_simple_transaction(
+        "Madame Sakho a acheté deux sacs de riz à cinq mille francs, elle paiera vendredi prochain.", TODAY
+    )
+    assert result["products"][0]["price"] == 5000
+    assert result["products"][0]["payment_date"] == "2026-10-23"
+    result = parse_simple_transaction("Madame Sakho a acheté deux sacs de riz pour dix mille francs", TODAY)
+    assert result["products"][0]["price"] == 5000
+
+
+@pytest.mark.parametrize("text", [
+    "Fatou a acheté deux sacs de riz à crédit",
+    "Fatou a acheté deux sacs de riz hier",
+    "Fatou a acheté deux sacs de riz mais elle n'a pas payé",
+    "J'ai vendu deux sacs de riz à Madame Sakho à cinq mille",
+    "Monsieur a acheté deux sacs",
+])
+def test_sentences_not_fully_understood_go_to_the_model(text):
+    assert parse_simple_transaction(text, TODAY) is None
+
+
+def test_buyer_after_the_price():
+    result = parse_simple_transaction("J'ai vendu deux sacs de riz à cinq mille à Madame Sakho", TODAY)
+    assert result["person_name"] == "Madame Sakho"
+    assert result["products"][0]["product_name"] == "sacs de riz"
@@ -0,0 +1,82 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from Hedged_Requests import Deadline, DeadlineExceeded, Hedger
+
+
+def test_concurrent_calls_are_not_capped():
+    hedger = Hedger("test", initial_delay=5.0)
+    started = time.monotonic()
+    with ThreadPoolExecutor(max_workers=96) as callers:
+        results = list(callers.map(lambda i: hedger.run(lambda: time.sleep(0.3) or i, key="slow"), range(96)))
+    assert results == list(range(96))
+    assert time.monotonic() - started < 0.7
+    assert hedger.stats()["hedged"] == 0
+
+
+def test_latency_samples_measure_the_call_only():
+    hedger = Hedger("test", min_samples=1)
+    for _ in range(3):
+        hedger.run(lambda: time.sleep(0.05), key="call")
+    assert all(0.05 <= sample < 0.2 for sample in hedger._latencies["call"])
+
+
+def test_slow_call_is_hedged_and_hedge_wins():
+    hedger = Hedger("test", initial_delay=0.1)
+    calls = []
+    lock = threading.Lock()
+
+    def call():
+        with lock:
+            calls.append(None)
+            first = len(calls) == 1
+        time.sleep(2.0 if first else 0.05)
+        return "first" if first else "hedge"
+
+    started = time.monotonic()
+    assert hedger.run(call, key="k") == "hedge"
+    assert time.monotonic() - started < 1.0
+    stats = hedger.stats()
+    assert (stats["hedged"], stats["hedge_wins"]) == (1, 1)
+
+
+def test_deadline_interrupts_the_wait():
+    hedger = Hedger("test", initial_delay=10.0)
+    started = time.monotonic()
+    with pytest.raises(DeadlineExceeded):
+        hedger.run(lambda: time.sleep(2.0), deadline=Deadline(0.2))
+    assert time.monotonic() - started < 1.0
+
+
+def test_hedge_veto_does_not_block_other_calls():
+    hedger = Hedger("test", initial_delay=0.05)
+    vetoing = threading.Event()
+
+    def can_hedge():
+        # Stands in for a quota check waiting on a busy database
+        vetoing.set()
+        time.sleep(0.5)
+        return False
+
+    slow = threading.Thread(target=hedger.run, args=(lambda: time.sleep(0.8),), kwargs={"can_hedge": can_hedge})
+    slow.start()
+    assert vetoing.wait(1.0)
+    started = time.monotonic()
+    assert hedger.run(lambda: "fast", key="other") == "fast"
+    assert time.monotonic() - started < 0.2
+    slow.join()
+    stats = hedger.stats()
+    assert (stats["hedged"], stats["vetoed"], stats["capped"]) == (0, 1, 0)
+
+
+def test_hedges_past_the_rate_cap_are_not_offered_to_the_veto():
+    hedger = Hedger("test", initial_delay=0.01, max_hedge_rate=0.0)
+    asked = []
+    for _ in range(4):
+        hedger.run(lambda: time.sleep(0.05), can_hedge=lambda: asked.append(None) or True)
+    stats = hedger.stats()
+    # HEDGE_BURST hedges are allowed before the rate applies
+    assert (stats["hedged"], stats["capped"], len(asked)) == (2, 2, 2)
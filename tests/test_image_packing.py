@@ -0,0 +1,55 @@
+import json
+from types import SimpleNamespace
+
+import Api_Functions
+
+
+def _response(content):
+    return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content), finish_reason="stop")])
+
+
+def _product(name, **extra):
+    return {"product_name": name, "company": "Sen", "start_date": None, "end_date": None, **extra}
+
+
+def test_only_the_images_the_pack_misses_fall_back(monkeypatch):
+    def prepare_image_part(image, **options):
+        return {"type": "image_url", "image_url": {"url": f"data:{image}", "detail": "low"}}, {"processed_tokens": 100}
+
+    pack_calls = []
+    single_calls = []
+
+    def create_chat_completion(stage, **kwargs):
+        if stage == "image.pack":
+            pack_calls.append(len(kwargs["messages"][-1]["content"]))
+            return _response(json.dumps({"products": [
+                {"index": 0, **_product("riz")},
+                # image 1 has no entry, image 2's entry is malformed
+                {"index": 2, "product_name": "sucre"},
+                "pas un produit",
+                {"index": 3, **_product("huile")},
+            ]}))
+        image_url = kwargs["messages"][-1]["content"][-1]["image_url"]["url"]
+        single_calls.append(image_url)
+        return _response(json.dumps(_product(f"seul {image_url}")))
+
+    monkeypatch.setattr(Api_Functions, "prepare_image_part", prepare_image_part)
+    monkeypatch.setattr(Api_Functions, "create_chat_completion", create_chat_completion)
+    monkeypatch.setattr(Api_Functions, "get_catalog", lambda: None)
+    images = ["image0", "image1", "image2", "image3"]
+    results = {
+        index: (json.loads(product_json)["product_name"], error)
+        for index, _, product_json, error in Api_Functions.extract_image_product_info_packed(
+            images, token_budget=1000, max_images=4,
+        )
+    }
+
+    # One request for the four images (a text label and the image each, after the prompt text)
+    assert pack_calls == [9]
+    assert sorted(single_calls) == ["data:image1", "data:image2"]
+    assert results == {
+        0: ("riz", None),
+        1: ("seul data:image1", None),
+        2: ("seul data:image2", None),
+        3: ("huile", None),
+    }
@@ -0,0 +1,62 @@
+import io
+import os
+
+import pytest
+
+from Image_Preprocessing import EXIF_ORIENTATION, make_thumbnail, open_preview, preprocess_image
+from Near_Duplicates import DEFAULT_MAX_DISTANCE, hamming_distance, perceptual_hash
+
+Image = pytest.importorskip("PIL.Image")
+
+
+# Function to encode a noisy RGB image as JPEG, optionally with an EXIF orientation
+def make_jpeg(width, height, quality=60, orientation=None):
+    image = Image.frombytes("RGB", (width // 8, height // 8), os.urandom((width // 8) * (height // 8) * 3))
+    image = image.resize((width, height))
+    buffer = io.BytesIO()
+    if orientation is None:
+        image.save(buffer, format="JPEG", quality=quality)
+    else:
+        exif = Image.Exif()
+        exif[EXIF_ORIENTATION] = orientation
+        image.save(buffer, format="JPEG", quality=quality, exif=exif.tobytes())
+    return buffer.getvalue()
+
+
+def test_small_upright_jpeg_is_sent_unchanged():
+    original = make_jpeg(400, 300)
+    processed, mime, report = preprocess_image(original)
+    assert processed == original
+    assert mime == "image/jpeg"
+    assert not report["preprocessed"]
+
+
+def test_rotated_jpeg_is_transposed():
+    # Orientation 6: the camera was turned, the picture must be rotated to be upright
+    processed, _, report = preprocess_image(make_jpeg(400, 304, orientation=6))
+    assert report["preprocessed"]
+    assert Image.open(io.BytesIO(processed)).size == (304, 400)
+
+
+def test_large_jpeg_is_downscaled():
+    processed, _, report = preprocess_image(make_jpeg(3000, 2000), max_dimension=1000)
+    assert report["processed_size"] == (1000, 667)
+    assert len(processed) < report["original_bytes"]
+
+
+def test_preview_serves_hash_and_thumbnail_from_one_decode(monkeypatch):
+    original = make_jpeg(1600, 1200, orientation=6)
+    expected_hash = perceptual_hash(original)
+    opened = []
+    open_image = Image.open
+    monkeypatch.setattr(Image, "open", lambda *args, **kwargs: opened.append(None) or open_image(*args, **kwargs))
+    preview = open_preview(original, 240)
+    image_hash = perceptual_hash(preview)
+    thumbnail = make_thumbnail(preview, 240)
+    assert len(opened) == 1
+    # Decoded at a reduced scale, but still upright and at least the thumbnail size
+    assert min(preview.size) >= 240 and preview.size[0] < preview.size[1]
+    # The reduced-scale hash still finds the full-size image as a near duplicate
+    assert hamming_distance(image_hash, expected_hash) <= DEFAULT_MAX_DISTANCE
+    monkeypatch.setattr(Image, "open", open_image)
+    assert Image.open(io.BytesIO(thumbnail)).size == (180, 240)
@@ -0,0 +1,67 @@
+import json
+
+import pytest
+
+import Api_Functions
+from French_Normalization import parse_simple_transaction
+from Product_Catalog import ProductCatalog, match_product, set_catalog
+
+
+@pytest.fixture
+def catalog():
+    catalog = ProductCatalog()
+    catalog.add("Riz parfumé 5kg", company="Royal", aliases=["riz royal"])
+    catalog.add("Huile Lesieur 1L", company="Lesieur")
+    catalog.add("Sucre en poudre 1kg", company="Sen")
+    return catalog
+
+
+def test_best_match(catalog):
+    assert catalog.best_match("riz parfume 5kg") == (1.0, catalog.entries[0])
+    assert catalog.best_match("riz royal")[1].name == "Riz parfumé 5kg"
+    score, entry = catalog.best_match("huile lesieure 1L")
+    assert entry.name == "Huile Lesieur 1L" and 0.8 <= score < 1
+    assert catalog.best_match("savon de Marseille") is None
+
+
+def test_best_match_verifies_a_bounded_number_of_names(monkeypatch):
+    catalog = ProductCatalog()
+    for index in range(50):
+        catalog.add(f"savon bakolo variante{index:02d}")
+    monkeypatch.setattr("Product_Catalog.WORD_VERIFY_LIMIT", 10)
+    verified = []
+    score = catalog._score
+    monkeypatch.setattr(catalog, "_score", lambda counts, *args: verified.append(len(counts)) or score(counts, *args))
+    assert catalog.best_match("savon bakolo variantee03")[1].name == "savon bakolo variante03"
+    assert sum(verified) <= 10
+
+
+def test_transcript_names_are_taken_from_the_catalog(catalog):
+    def lookup(name):
+        entry = match_product(catalog, name, 0.9)
+        return entry.name if entry else None
+
+    text = "Madame Sakho a acheté deux sacs de riz parfumé 5kg à 5000 francs, elle paiera vendredi"
+    # Digits in the name are not understood without the catalog
+    assert parse_simple_transaction(text) is None
+    result = parse_simple_transaction(text, lookup_product=lookup)
+    assert result["person_name"] == "Madame Sakho"
+    assert result["products"][0]["product_name"] == "Riz parfumé 5kg"
+    assert result["products"][0]["quantity"] == 2
+    assert result["products"][0]["price"] == 5000
+    # Names the catalog does not know still go to the model
+    assert parse_simple_transaction("J'ai acheté 2 savon 5x à 300", lookup_product=lookup) is None
+
+
+def test_extract_products_skips_the_model_for_catalog_products(catalog, monkeypatch):
+    def no_model(*args, **kwargs):
+        raise AssertionError("the model was called")
+
+    monkeypatch.setattr(Api_Functions, "create_chat_completion", no_model)
+    set_catalog(catalog)
+    try:
+        result = json.loads(Api_Functions.extract_products("J'ai acheté trois huile Lesieur 1L à 1500 francs"))
+    finally:
+        set_catalog(None)
+    assert result["products"][0]["product_name"] == "Huile Lesieur 1L"
+    assert result["products"][0]["quantity"] == 3
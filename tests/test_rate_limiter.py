@@ -0,0 +1,82 @@
+import threading
+import time
+
+import pytest
+
+from Hedged_Requests import Deadline, DeadlineExceeded
+from Rate_Limiter import SharedRateLimiter, priority_scope
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    return str(tmp_path / "rate_limits.sqlite")
+
+
+def test_requests_per_minute(db_path):
+    # 95% of 6000 per minute: 95 per second, with one second of burst
+    limiter = SharedRateLimiter("test", requests_per_minute=6000, path=db_path)
+    started = time.monotonic()
+    for _ in range(95 + 38):
+        limiter.acquire()
+    assert 0.3 <= time.monotonic() - started < 1.5
+
+
+def test_tokens_per_minute_and_settle(db_path):
+    # 950 tokens per second
+    limiter = SharedRateLimiter("test", tokens_per_minute=60000, path=db_path)
+    assert limiter.try_acquire(900)
+    assert not limiter.try_acquire(900)
+    # The call used far fewer tokens than estimated: the difference comes back
+    limiter.settle(900, 100)
+    assert limiter.try_acquire(700)
+
+
+def test_limiters_in_other_processes_share_the_bucket(db_path):
+    # Two instances on one file stand for two processes
+    first = SharedRateLimiter("key", requests_per_minute=120, path=db_path)
+    second = SharedRateLimiter("key", requests_per_minute=120, path=db_path)
+    other_key = SharedRateLimiter("other", requests_per_minute=120, path=db_path)
+    assert first.try_acquire()
+    assert not second.try_acquire()
+    assert other_key.try_acquire()
+
+
+def test_pause_holds_every_caller(db_path):
+    limiter = SharedRateLimiter("test", requests_per_minute=6000, path=db_path)
+    SharedRateLimiter("test", requests_per_minute=6000, path=db_path).pause(0.3)
+    assert not limiter.try_acquire()
+    started = time.monotonic()
+    limiter.acquire()
+    assert time.monotonic() - started >= 0.25
+
+
+def test_interactive_callers_go_before_batch_callers(db_path):
+    # About one request every 0.5 s; the burst is used up first
+    limiter = SharedRateLimiter("test", requests_per_minute=120, path=db_path)
+    limiter.acquire()
+    limiter.acquire()
+    order = []
+
+    def take(priority):
+        with priority_scope(priority):
+            limiter.acquire()
+        order.append(priority)
+
+    batch = threading.Thread(target=take, args=("batch",))
+    batch.start()
+    time.sleep(0.1)
+    interactive = threading.Thread(target=take, args=("interactive",))
+    interactive.start()
+    batch.join()
+    interactive.join()
+    assert order == ["interactive", "batch"]
+
+
+def test_acquire_gives_up_at_the_deadline(db_path):
+    limiter = SharedRateLimiter("test", requests_per_minute=6, path=db_path)
+    limiter.acquire()
+    started = time.monotonic()
+    with pytest.raises(DeadlineExceeded):
+        limiter.acquire(deadline=Deadline(0.2))
+    assert time.monotonic() - started < 0.5
+    assert limiter.stats()["timed_out"] == 1
@@ -0,0 +1,142 @@
+import json
+import re
+from types import SimpleNamespace
+
+import pytest
+
+import Api_Functions
+from Prompt_Registry import PRODUCTS_PROMPT, Prompt, count_tokens
+from Response_Parsing import _to_number, parse_json_reply, validate_transaction
+
+FULL_REPLY = json.dumps({
+    "person_name": "Fatou",
+    "products": [
+        {"product_name": name, "quantity": 2, "unit": None, "price": 500,
+         "transaction_type": "vente", "payment_date": None}
+        for name in ("riz", "sucre", "huile")
+    ],
+})
+
+
+def test_fenced_reply():
+    data = parse_json_reply("Voici le résultat :\n```json\n" + FULL_REPLY + "\n```")
+    assert [p["product_name"] for p in data["products"]] == ["riz", "sucre", "huile"]
+
+
+def test_malformed_reply_is_repaired():
+    data = parse_json_reply("{'person_name': None, 'products': [{'product_name': 'riz', 'quantity': 2,},],}")
+    assert data == {"person_name": None, "products": [{"product_name": "riz", "quantity": 2}]}
+
+
+def test_truncated_reply_is_closed():
+    data = parse_json_reply(FULL_REPLY[:FULL_REPLY.index('"sucre"') + 4])
+    assert data["person_name"] == "Fatou"
+    assert data["products"][0]["product_name"] == "riz"
+
+
+def test_unusable_reply():
+    assert parse_json_reply("Je ne peux pas répondre.") is None
+    assert parse_json_reply("[1, 2]") is None
+    result, failed_fields = validate_transaction(None)
+    assert result == {"person_name": None, "products": []}
+    assert failed_fields == ["person_name", "products"]
+
+
+@pytest.mark.parametrize("value, expected", [
+    ("5 000", 5000),
+    ("5000 FCFA", 5000),
+    ("2,5", 2.5),
+    ("1.500", 1500),
+    ("1.500,00", 1500),
+    ("1,500.00", 1500),
+    ("1,500,000", 1500000),
+    ("12.5", 12.5),
+    ("2, 3 sacs", 2),
+    ("cinq mille", 5000),
+    ("aucun", None),
+])
+def test_to_number(value, expected):
+    assert _to_number(value) == expected
+
+
+def _response(content, finish_reason="stop"):
+    return SimpleNamespace(choices=[SimpleNamespace(
+        message=SimpleNamespace(content=content), finish_reason=finish_reason,
+    )])
+
+
+def test_truncated_reply_escalates_instead_of_dropping_products(monkeypatch):
+    calls = []
+
+    def create_chat_completion(stage, **kwargs):
+        calls.append((kwargs["model"], kwargs["max_tokens"]))
+        if len(calls) == 1:
+            return _response(FULL_REPLY[:FULL_REPLY.index('"sucre"') + 4], finish_reason="length")
+        return _response(FULL_REPLY)
+
+    monkeypatch.setattr(Api_Functions, "create_chat_completion", create_chat_completion)
+    monkeypatch.setattr(Api_Functions, "LOCAL_FAST_PATH", False)
+    result = json.loads(Api_Functions.extract_products("Fatou a pris deux riz, deux sucres et deux huiles à 500"))
+    assert [model for model, _ in calls] == list(Api_Functions.PRODUCTS_MODELS)
+    assert len(result["products"]) == 3
+
+
+def test_truncated_field_retry_is_not_trusted(monkeypatch):
+    replies = iter([
+        _response('{"products": [{"product_name": "riz"', finish_reason="length"),
+    ])
+    monkeypatch.setattr(Api_Functions, "create_chat_completion", lambda stage, **kwargs: next(replies))
+    truncated = FULL_REPLY[:FULL_REPLY.index('"sucre"') + 4]
+    result, failed_fields = Api_Functions.parse_validated_reply(
+        "gpt-4o", [], truncated, validate_transaction, max_retries=1, truncated=True,
+    )
+    assert failed_fields == ["products"]
+    assert result["person_name"] == "Fatou"
+
+
+def test_reply_budget_grows_with_the_transcript(monkeypatch):
+    budgets = []
+
+    def create_chat_completion(stage, **kwargs):
+        budgets.append(kwargs["max_tokens"])
+        return _response(FULL_REPLY)
+
+    monkeypatch.setattr(Api_Functions, "create_chat_completion", create_chat_completion)
+    monkeypatch.setattr(Api_Functions, "LOCAL_FAST_PATH", False)
+    Api_Functions.extract_products("Fatou a pris du riz")
+    Api_Functions.extract_products("Fatou a pris du riz, " * 100)
+    assert Api_Functions.PRODUCTS_MIN_REPLY_TOKENS < budgets[0] < budgets[1] <= Api_Functions.PRODUCTS_MAX_REPLY_TOKENS
+
+
+def test_long_transcript_is_split_instead_of_truncated(monkeypatch):
+    sentences = [f"Fatou a pris deux sacs de produit{index} à 500 francs." for index in range(400)]
+    texts = []
+
+    def create_chat_completion(stage, **kwargs):
+        text = kwargs["messages"][-1]["content"]
+        texts.append(text)
+        names = re.findall(r"produit\d+", text)
+        return _response(json.dumps({"person_name": "Fatou", "products": [
+            {"product_name": name, "quantity": 2, "unit": None, "price": 500,
+             "transaction_type": "vente", "payment_date": None}
+            for name in names
+        ]}))
+
+    monkeypatch.setattr(Api_Functions, "create_chat_completion", create_chat_completion)
+    monkeypatch.setattr(Api_Functions, "LOCAL_FAST_PATH", False)
+    truncations = PRODUCTS_PROMPT.truncations
+    result = json.loads(Api_Functions.extract_products(" ".join(sentences)))
+    assert len(texts) > 1
+    assert all(not text.endswith("…\"") for text in texts)
+    assert len(result["products"]) == 400
+    assert PRODUCTS_PROMPT.truncations == truncations
+
+
+def test_truncation_is_counted():
+    prompt = Prompt("test", "v1", "Système.", "Texte : {text}", max_input_tokens=40, budget_field="text")
+    messages = prompt.build_messages(text="mot " * 200)
+    assert messages[-1]["content"].endswith("…")
+    assert prompt.describe()["truncated_inputs"] == 1
+    pieces = prompt.split_field(text="Une phrase courte. " * 30)
+    assert len(pieces) > 1
+    assert all(count_tokens(piece) <= prompt.field_budget(text="") for piece in pieces)
@@ -0,0 +1,44 @@
+from datetime import date
+
+from Transaction_Ledger import TransactionLedger
+
+TODAY = date(2026, 10, 18)
+RESULT = {
+    "person_name": "Madame Sakho",
+    "products": [
+        {"product_name": "sacs de riz", "quantity": 2, "unit": None, "price": 5000,
+         "transaction_type": "vente", "payment_date": "2026-10-23"},
+        {"product_name": "riz", "quantity": 2.5, "unit": "kg", "price": 600,
+         "transaction_type": "vente", "payment_date": "2026-10-23"},
+        {"product_name": "savon", "quantity": None, "unit": None, "price": 250,
+         "transaction_type": "vente", "payment_date": None},
+    ],
+}
+
+
+def test_amounts_are_quantity_times_unit_price(tmp_path):
+    ledger = TransactionLedger(str(tmp_path / "ledger.sqlite"))
+    ledger.record(RESULT, "recording-1")
+    ledger.flush()
+    assert ledger.sales_vs_purchases()["vente"]["amount"] == 10000 + 1500 + 250
+    assert ledger.customer_totals()[0]["sales_amount"] == 11750
+    upcoming = ledger.upcoming_payments(days=30, today=TODAY)
+    assert sorted(line["amount"] for line in upcoming["lines"]) == [1500, 10000]
+    assert upcoming["per_day"][0]["amount"] == 11500
+
+    totals = ledger.sales_vs_purchases()
+    ledger.rebuild_aggregates()
+    assert ledger.sales_vs_purchases() == totals
+    ledger.close()
+
+
+def test_upcoming_payments_read_only_the_index(tmp_path):
+    ledger = TransactionLedger(str(tmp_path / "ledger.sqlite"))
+    plan = ledger._query(
+        "EXPLAIN QUERY PLAN SELECT payment_date, person, product, quantity, unit, price, amount, transaction_type"
+        " FROM transactions WHERE payment_date BETWEEN ? AND ? ORDER BY payment_date LIMIT ?",
+        ("2026-10-18", "2026-11-17", 100),
+    )
+    assert any("COVERING INDEX idx_transactions_payment" in row["detail"] for row in plan)
+    ledger.close()
+
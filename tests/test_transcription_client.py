@@ -0,0 +1,177 @@
+import json
+import socket
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from Transcription_Client import TranscriptionClient, TranscriptionError
+
+
+class StandInServer:
+    """
+    Local stand-in for the transcription backend. `responses` scripts the replies as
+    (status, headers, delay) tuples; once used up every request gets a 200.
+    """
+
+    def __init__(self, responses=(), delay=0.0):
+        self.responses = list(responses)
+        self.delay = delay
+        self.requests = 0
+        self.connections = set()
+        self.active = 0
+        self.max_active = 0
+        self._lock = threading.Lock()
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            # Keep-alive, so a pooled client sends every request over one connection
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                status, headers, delay = server.next_response(self.client_address)
+                time.sleep(delay)
+                with server._lock:
+                    server.active -= 1
+                body = json.dumps({"transcription": "bonjour"} if status == 200 else {"error_message": "busy"})
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body.encode("utf-8"))
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.httpd.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}/transcribe"
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    def next_response(self, client_address):
+        with self._lock:
+            self.requests += 1
+            self.connections.add(client_address)
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+            if self.responses:
+                return self.responses.pop(0)
+            return 200, {}, self.delay
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+@pytest.fixture
+def make_server():
+    servers = []
+
+    def make(*args, **kwargs):
+        servers.append(StandInServer(*args, **kwargs))
+        return servers[-1]
+
+    yield make
+    for server in servers:
+        server.stop()
+
+
+def make_client(url, **options):
+    options.setdefault("backoff_base", 0.01)
+    return TranscriptionClient(url, "test-key", **options)
+
+
+def test_calls_reuse_one_connection(make_server):
+    server = make_server()
+    client = make_client(server.url)
+    for _ in range(5):
+        assert client.transcribe(b"RIFF....WAVE") == "bonjour"
+    client.close()
+    assert server.requests == 5
+    assert len(server.connections) == 1
+
+
+def test_retries_server_errors(make_server):
+    server = make_server(responses=[(503, {}, 0), (500, {}, 0)])
+    client = make_client(server.url, max_retries=3)
+    assert client.transcribe(b"audio") == "bonjour"
+    assert server.requests == 3
+
+
+def test_gives_up_after_max_retries(make_server):
+    server = make_server(responses=[(502, {}, 0)] * 3)
+    client = make_client(server.url, max_retries=2)
+    with pytest.raises(TranscriptionError) as error:
+        client.transcribe(b"audio")
+    assert error.value.status_code == 502
+    assert server.requests == 3
+
+
+def test_honours_retry_after_on_429(make_server):
+    server = make_server(responses=[(429, {"Retry-After": "0.4"}, 0)])
+    client = make_client(server.url, backoff_max=5.0)
+    started = time.monotonic()
+    assert client.transcribe(b"audio") == "bonjour"
+    assert time.monotonic() - started >= 0.4
+    assert server.requests == 2
+
+
+def test_read_timeout_is_not_retried(make_server):
+    server = make_server(responses=[(200, {}, 1.0)])
+    client = make_client(server.url, read_timeout=0.2, max_retries=3)
+    started = time.monotonic()
+    with pytest.raises(TranscriptionError, match="timed out"):
+        client.transcribe(b"audio")
+    assert time.monotonic() - started < 0.9
+    assert server.requests == 1
+
+
+def test_connect_failures_are_retried_then_raised():
+    # A port nobody listens on refuses the connection
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        port = probe.getsockname()[1]
+    client = make_client(f"http://127.0.0.1:{port}/transcribe", connect_timeout=0.2, max_retries=2)
+    with pytest.raises(TranscriptionError):
+        client.transcribe(b"audio")
+
+
+def test_connect_timeout_bounds_the_wait():
+    # A listening socket whose accept backlog is full never completes new handshakes
+    listener = socket.socket()
+    listener.bind(("127.0.0.1", 0))
+    listener.listen(0)
+    fillers = []
+    try:
+        for _ in range(8):
+            filler = socket.socket()
+            filler.setblocking(False)
+            filler.connect_ex(listener.getsockname())
+            fillers.append(filler)
+        time.sleep(0.1)
+        client = make_client(f"http://127.0.0.1:{listener.getsockname()[1]}/transcribe",
+                             connect_timeout=0.2, read_timeout=30, max_retries=1)
+        started = time.monotonic()
+        with pytest.raises(TranscriptionError):
+            client.transcribe(b"audio")
+        assert time.monotonic() - started < 5
+    finally:
+        for filler in fillers:
+            filler.close()
+        listener.close()
+
+
+def test_transcribe_many_runs_files_concurrently(make_server):
+    server = make_server(delay=0.3)
+    client = make_client(server.url, pool_size=4)
+    started = time.monotonic()
+    results = list(client.transcribe_many([b"a", b"b", b"c", b"d"], max_workers=4))
+    elapsed = time.monotonic() - started
+    assert sorted(index for index, _, _, _ in results) == [0, 1, 2, 3]
+    assert all(text == "bonjour" and error is None for _, _, text, error in results)
+    assert server.max_active == 4
+    assert elapsed < 0.9